@@ -4,18 +4,54 @@ __all__ = [
         "consts",
         "task",
         "terminal",
+        "dispatch",
+        "timer",
+        "instrument",
+        "sendqueue",
+        "alias",
+        "workers",
+        "store",
+        "adaptive",
+        "wildcards",
         ]
 
 from consts import *
 from trigger import *
 from task import *
 from terminal import *
+from dispatch import *
+from timer import *
+from sendqueue import *
+from alias import *
+from workers import *
+from store import *
+from adaptive import *
+from wildcards import *
 
-def init(ax):
+def init(ax, dispatch=False, buffered=False, remote=None, authkey=None,
+        **stdout_options):
     """Initialize this package with necessary global variables.
 
     This function must be called before using it.
+
+    With dispatch=True, a single catch-all trigger is installed and Task
+    handlers are matched by the Python side dispatcher (see mush.dispatch).
+
+    With buffered=True, stdout is a buffered Terminal. Other keyword
+    arguments are passed as options to the stdout Terminal as well, e.g.
+    max_lines and log_file (see Terminal).
+
+    With remote=(host, port), the Tasks run in a worker process listening
+    there, and only a shim forwarding to it is installed (see mush.remote).
+    authkey, the secret shared with the worker, is then required.
     """
+    # the stdout of a previous load (a script reload): flush it and stop
+    # its log file writer before a new one takes over the file
+    import sys
+    old = sys.stdout.__class__
+    if (old.__module__, old.__name__) == (Terminal.__module__, "Terminal"):
+        sys.stdout.close()
+
     # inject the ax and the world objects
     import __builtin__
     __builtin__.ax = ax
@@ -24,9 +60,25 @@ def init(ax):
     world.note("Successfully loaded Mushpy")
 
     # redirect stdout and stderr
-    import sys
-    sys.stdout = Terminal(title='stdout', time_stamp=True)
+    sys.stdout = Terminal(title='stdout', time_stamp=True, buffered=buffered,
+            **stdout_options)
     sys.stderr = sys.stdout
 
-def send(what):
-    world.send(what)
+    if remote is not None:
+        from remote import install_shim
+        install_shim(remote, authkey)
+        return
+
+    if dispatch:
+        install_dispatcher()
+
+def send(what, priority=0, dedupe=False):
+    """Send commands to the MUD, through the send queue if installed.
+
+    With dedupe=True, commands already waiting in the queue are dropped.
+    """
+    queue = get_send_queue()
+    if queue is not None:
+        queue.put(what, priority, dedupe)
+    else:
+        world.send(what)
@@ -0,0 +1,81 @@
+'''Evaluate the most matched exclusive handlers first.
+
+A line matching an exclusive handler (@Task.trigger(..., exclusive=True))
+matches no other one, so the order among exclusive handlers doesn't change
+what runs, only how many patterns are tried before evaluation stops. Once
+installed, the AdaptiveSequencer reads every interval seconds how many
+times each exclusive client trigger matched ("timesmatched") and gives the
+hottest the lowest sequence numbers, between low and high (before the
+default sequence 100). With the dispatcher, the same is done by the
+Dispatcher itself (see Dispatcher.adaptive).
+
+    >>> install_adaptive(interval=60)
+'''
+
+__all__ = ["AdaptiveSequencer", "install_adaptive", "get_adaptive"]
+
+from trigger import get_trigger
+from timer import call_every
+from dispatch import get_dispatcher
+from task import _task_classes, _SharedTrigger
+
+class AdaptiveSequencer(object):
+    def __init__(self, interval=60.0, low=1, high=99):
+        self.low = low
+        self.high = high
+        self._last = {}     # trigger name : timesmatched at the last update
+        self._score = {}    # trigger name : matches, older ones halved
+        self._timer = call_every(interval, self.update)
+        dispatcher = get_dispatcher()
+        if dispatcher is not None:
+            dispatcher.adaptive = True
+
+    def _triggers(self):
+        '''Names of the exclusive handler triggers in the client'''
+        names = set()
+        for cls in _task_classes.itervalues():
+            for trig in cls._shared.itervalues():
+                if (type(trig) is _SharedTrigger and trig.registered and
+                        trig.dispatcher is None and
+                        trig.order.get("exclusive")):
+                    names.add(trig.name)
+        return names
+
+    def update(self):
+        '''Timer callback: reorder the exclusive triggers by matches'''
+        names = self._triggers()
+        if not names:
+            return
+        for name in names:
+            count = get_trigger(name).timesmatched or 0
+            last = self._last.get(name, 0)
+            self._last[name] = count
+            # the count restarts when the trigger is recreated
+            delta = count - last if count >= last else count
+            self._score[name] = self._score.get(name, 0) / 2.0 + delta
+        ranked = sorted(names, key=lambda name: (-self._score[name], name))
+        slots = self.high - self.low + 1
+        for rank, name in enumerate(ranked):
+            # unchanged sequences aren't sent again, see Trigger
+            get_trigger(name).sequence = \
+                    self.low + rank * slots // max(len(ranked), slots)
+
+    def stop(self):
+        self._timer.cancel()
+        dispatcher = get_dispatcher()
+        if dispatcher is not None:
+            dispatcher.adaptive = False
+            dispatcher.reorder()
+
+_adaptive = None
+
+def install_adaptive(interval=60.0, low=1, high=99):
+    '''Start reordering the exclusive handlers every interval seconds.'''
+    global _adaptive
+    if _adaptive is None:
+        _adaptive = AdaptiveSequencer(interval, low, high)
+    return _adaptive
+
+def get_adaptive():
+    '''Return the installed AdaptiveSequencer or None.'''
+    return _adaptive
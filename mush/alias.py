@@ -0,0 +1,188 @@
+'''Python side alias dispatch.
+
+A single catch-all client alias forwards every typed command to an
+AliasDispatcher. Aliases whose pattern starts with a literal (e.g.
+"^kill (.*)$") are indexed by that literal in a prefix trie, so resolving a
+command only looks at the aliases whose literal prefixes the command, however
+many aliases there are. Other patterns are tried as plain regexes.
+
+The first matching alias, in adding order, handles the command. Commands
+matching none are sent to the MUD as typed, right away rather than through
+the send queue. The catch-all alias comes last in sequence, after the
+aliases of the world file.
+'''
+
+__all__ = ["AliasDispatcher", "install_alias_dispatcher",
+        "get_alias_dispatcher"]
+
+import re
+import sys
+import sre_parse
+import sre_constants
+import traceback
+
+from consts import *
+from common import expose
+from wildcards import Wildcards
+
+class AliasOpError(Exception): pass
+
+def _literal_prefix(pattern):
+    '''Return the literal an anchored pattern starts with, or None'''
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, TypeError, OverflowError):
+        return None
+    if parsed.pattern.flags & re.IGNORECASE:
+        return None
+    items = list(parsed)
+    if not items or items[0] != (sre_constants.AT, sre_constants.AT_BEGINNING):
+        return None
+    prefix = []
+    for op, av in items[1:]:
+        if op != sre_constants.LITERAL:
+            break
+        prefix.append(chr(av) if av < 128 else unichr(av))
+    return "".join(prefix) or None
+
+class _Node(object):
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children = {}  # character : _Node
+        self.entries = set()    # enabled entries whose prefix ends here
+
+class _Entry(object):
+    __slots__ = ("name", "pattern", "regex", "prefix", "callback",
+            "enabled", "seq", "group")
+
+    def __init__(self, name, pattern, callback, seq, group):
+        self.name = name
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.prefix = _literal_prefix(pattern)
+        self.callback = callback
+        self.enabled = False
+        self.seq = seq
+        self.group = group
+
+class AliasDispatcher(object):
+    '''Resolve commands against many alias patterns.
+
+    Callbacks are invoked like MUSHclient alias scripts:
+
+        >>> callback(name, command, wildcards)
+
+    Entries are added disabled.
+    '''
+
+    def __init__(self, name="mushpy_alias"):
+        self.name = name
+        self._entries = {}  # name : _Entry
+        self._trie = _Node()
+        self._unprefixed = set()    # enabled entries without a prefix
+        self._groups = {}   # group : set of names
+        self._seq = 0
+
+    def add(self, name, pattern, callback, enabled=False, group=None):
+        if name in self._entries:
+            self.remove(name)
+        self._seq += 1
+        entry = _Entry(name, pattern, callback, self._seq, group)
+        self._entries[name] = entry
+        if group:
+            self._groups.setdefault(group, set()).add(name)
+        if enabled:
+            self.set_enabled(name, True)
+
+    def remove(self, name):
+        self.set_enabled(name, False)
+        entry = self._entries.pop(name)
+        if entry.group:
+            members = self._groups[entry.group]
+            members.discard(name)
+            if not members:
+                del self._groups[entry.group]
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def is_enabled(self, name):
+        return self._entries[name].enabled
+
+    def set_enabled(self, name, on):
+        entry = self._entries[name]
+        on = bool(on)
+        if entry.enabled == on:
+            return
+        entry.enabled = on
+        if entry.prefix is None:
+            bucket = self._unprefixed
+        else:
+            node = self._trie
+            for char in entry.prefix:
+                node = node.children.setdefault(char, _Node())
+            bucket = node.entries
+        if on:
+            bucket.add(entry)
+        else:
+            bucket.discard(entry)
+
+    def set_group_enabled(self, group, on):
+        members = self._groups.get(group, ())
+        for name in members:
+            self.set_enabled(name, on)
+        return len(members)
+
+    def candidates(self, command):
+        '''Enabled entries that may match the command, in adding order'''
+        found = list(self._unprefixed)
+        node = self._trie
+        for char in command:
+            node = node.children.get(char)
+            if node is None:
+                break
+            found.extend(node.entries)
+        if len(found) > 1:
+            found.sort(key=lambda e: e.seq)
+        return found
+
+    def dispatch(self, command):
+        '''Run the first alias matching the command. Returns whether one
+        matched.'''
+        for entry in self.candidates(command):
+            m = entry.regex.search(command)
+            if m is None:
+                continue
+            try:
+                entry.callback(entry.name, command, Wildcards(command, m))
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+            return True
+        return False
+
+    def on_command(self, name, line, wildcards):
+        '''Script callback of the catch-all client alias.'''
+        if not self.dispatch(line):
+            world.Send(line)
+        sys.stdout.flush()
+
+_alias_dispatcher = None
+
+def install_alias_dispatcher(name="mushpy_alias"):
+    '''Create the catch-all alias feeding the alias dispatcher.'''
+    global _alias_dispatcher
+    if _alias_dispatcher is None:
+        _alias_dispatcher = AliasDispatcher(name)
+        expose(_alias_dispatcher.on_command, name)
+        res = world.AddAlias(name, "^(.*)$", "",
+                AliasFlags.Re_Replace | AliasFlags.eEnabled, name)
+        if res != ErrorNo.eOK:
+            raise AliasOpError("Alias creation failed: {0}".format(res))
+        # after the world's own aliases
+        world.SetAliasOption(name, "sequence", 10000)
+    return _alias_dispatcher
+
+def get_alias_dispatcher():
+    '''Return the installed AliasDispatcher or None.'''
+    return _alias_dispatcher
@@ -0,0 +1,232 @@
+'''Throughput benchmark of mushpy against the simulated client.
+
+    python -m mush.bench [options] [LOG ...]
+
+Replays session logs, or a synthetic session if none is given, through
+mush.sim with a set of Task handlers, and reports lines per second, the
+latency of the script calls the client makes and the world calls made per
+line. Handlers are either generated (--handlers, --instances) or the Task
+subclasses of a module (--tasks). Generated handlers can be made exclusive
+(--exclusive), and reordered by matches (--adaptive, see mush.adaptive).
+
+mush keeps its state in module globals, so with --mode both each mode runs
+in its own process.
+'''
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+
+MODES = ["triggers", "dispatch"]
+
+_words = ("the a an orc goblin sword shield north south east west you are "
+        "hungry thirsty sky clear dark room exit door chest gold coins").split()
+
+def synthetic_lines(count, handlers, seed=0):
+    '''A session where about a third of the lines match some handler, the
+    last defined handlers matching most of them'''
+    rand = random.Random(seed)
+    lines = []
+    for i in range(count):
+        if handlers and rand.random() < 0.3:
+            lines.append("Bob hits mob{0} for {1} damage.".format(
+                handlers - 1 - int(handlers * rand.random() ** 3),
+                rand.randrange(100)))
+        else:
+            lines.append(" ".join(rand.choice(_words)
+                for j in range(rand.randrange(3, 12))).capitalize() + ".")
+    return lines
+
+def read_logs(paths):
+    lines = []
+    for path in paths:
+        with open(path, "rb") as f:
+            for line in f:
+                lines.append(line.rstrip("\r\n").decode("utf-8", "replace"))
+    return lines
+
+def make_tasks(handlers, instances, per_class=10, exclusive=False):
+    '''Generate Task classes with handlers handlers in total, and
+    instantiate each class instances times'''
+    from mush.task import Task
+
+    def handler(self, wc):
+        self.hits += 1
+
+    def init(self):
+        Task.__init__(self)
+        self.hits = 0
+
+    tasks = []
+    for start in range(0, handlers, per_class):
+        attrs = {"__init__" : init}
+        for i in range(start, min(start + per_class, handlers)):
+            pattern = r"^(\w+) hits mob{0} for (\d+) damage\.$".format(i)
+            attrs["onHit{0}".format(i)] = Task.trigger(pattern,
+                    exclusive=exclusive)(handler)
+        cls = type("Bench{0}".format(start), (Task,), attrs)
+        tasks.extend(cls() for j in range(instances))
+    return tasks
+
+def load_tasks(module_name):
+    '''Instantiate the Task subclasses of a module having a constructor
+    without arguments'''
+    import importlib
+    from mush.task import Task
+    module = importlib.import_module(module_name)
+    tasks = []
+    for value in vars(module).values():
+        if (isinstance(value, type) and issubclass(value, Task) and
+                value.__module__ == module.__name__):
+            try:
+                tasks.append(value())
+            except TypeError:
+                pass
+    return tasks
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
+
+def run(mode, lines, handlers=0, instances=1, tasks_module=None,
+        exclusive=False, adaptive=False):
+    '''Run one mode in this process and return the measures as a dict'''
+    import mush
+    import mush.sim
+    import mush.dispatch
+    from mush.adaptive import install_adaptive
+
+    ax = mush.sim.make_ax()
+    sim = ax.sim
+    out, err = sys.stdout, sys.stderr
+    try:
+        mush.init(ax, dispatch=(mode == "dispatch"), buffered=True)
+        if tasks_module:
+            tasks = load_tasks(tasks_module)
+        else:
+            tasks = make_tasks(handlers, instances, exclusive=exclusive)
+        for task in tasks:
+            task.enable_all()
+        sequencer = install_adaptive() if adaptive else None
+        dispatcher = mush.dispatch.get_dispatcher()
+        if dispatcher is not None:
+            dispatcher.candidates("")   # builds the literal index once
+        setup_calls = sum(sim.calls.itervalues())
+
+        sim.calls.clear()
+        del sim.script_times[:]
+        sim.evaluations = 0
+        start = time.time()
+        for i, line in enumerate(lines):
+            if sequencer is not None and i and not i % 1000:
+                sequencer.update()  # what its timer would do meanwhile
+            sim.receive(line)
+        elapsed = time.time() - start
+        sys.stdout.flush()
+    finally:
+        sys.stdout, sys.stderr = out, err
+
+    calls = dict(sim.calls)
+    times = sim.script_times
+    evaluations = sim.evaluations
+    dispatcher = mush.dispatch.get_dispatcher()
+    if dispatcher is not None:
+        evaluations += dispatcher.evaluations
+    count = max(len(lines), 1)
+    return {
+        "mode" : mode,
+        "lines" : len(lines),
+        "tasks" : len(tasks),
+        "seconds" : elapsed,
+        "lines_per_sec" : len(lines) / elapsed if elapsed else 0.0,
+        "script_calls" : len(times),
+        "latency_us" : dict(("p{0}".format(p), percentile(times, p) * 1e6)
+            for p in (50, 90, 99)),
+        "setup_world_calls" : setup_calls,
+        "world_calls_per_line" : sum(calls.itervalues()) / float(count),
+        "world_calls" : calls,
+        "evaluations_per_line" : evaluations / float(count),
+        "script_errors" : sim.script_errors,
+    }
+
+def report(result, out=sys.stdout):
+    out.write("{mode}: {lines} lines, {tasks} tasks, {seconds:.3f}s, "
+            "{lines_per_sec:.0f} lines/s\n".format(**result))
+    out.write("  script calls: {0}, latency p50/p90/p99: "
+            "{1[p50]:.1f}/{1[p90]:.1f}/{1[p99]:.1f} us\n".format(
+                result["script_calls"], result["latency_us"]))
+    out.write("  world calls per line: {0:.3f} (setup: {1})\n".format(
+        result["world_calls_per_line"], result["setup_world_calls"]))
+    out.write("  regex evaluations per line: {0:.2f}\n".format(
+        result["evaluations_per_line"]))
+    for name, count in sorted(result["world_calls"].items(),
+            key=lambda item: -item[1]):
+        out.write("    {0:<24} {1}\n".format(name, count))
+    if result["script_errors"]:
+        out.write("  script errors: {0}\n".format(result["script_errors"]))
+
+def _run_subprocess(mode, argv):
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None,
+        [root, env.get("PYTHONPATH")]))
+    output = subprocess.check_output([sys.executable, "-m", "mush.bench",
+        "--mode", mode, "--json"] + argv, env=env)
+    return json.loads(output)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog="python -m mush.bench",
+            description="Replay session logs through the simulated client.")
+    parser.add_argument("logs", nargs="*", help="session logs to replay")
+    parser.add_argument("--mode", choices=MODES + ["both"], default="both")
+    parser.add_argument("--handlers", type=int, default=100,
+            help="number of generated handlers (default: 100)")
+    parser.add_argument("--instances", type=int, default=1,
+            help="instances of each generated Task class (default: 1)")
+    parser.add_argument("--tasks", metavar="MODULE",
+            help="use the Task subclasses of MODULE instead")
+    parser.add_argument("--lines", type=int, default=20000,
+            help="length of the synthetic session (default: 20000)")
+    parser.add_argument("--exclusive", action="store_true",
+            help="make the generated handlers exclusive")
+    parser.add_argument("--adaptive", action="store_true",
+            help="reorder the exclusive handlers by matches")
+    parser.add_argument("--json", action="store_true",
+            help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.mode == "both":
+        rest = ["--handlers", str(args.handlers), "--instances",
+                str(args.instances), "--lines", str(args.lines)]
+        if args.tasks:
+            rest += ["--tasks", args.tasks]
+        if args.exclusive:
+            rest.append("--exclusive")
+        if args.adaptive:
+            rest.append("--adaptive")
+        results = [_run_subprocess(mode, rest + args.logs) for mode in MODES]
+    else:
+        if args.logs:
+            lines = read_logs(args.logs)
+        else:
+            lines = synthetic_lines(args.lines, args.handlers)
+        results = [run(args.mode, lines, args.handlers, args.instances,
+            args.tasks, args.exclusive, args.adaptive)]
+
+    if args.json:
+        sys.stdout.write(json.dumps(results[0] if len(results) == 1
+            else results))
+        return
+    for result in results:
+        report(result)
+
+if __name__ == "__main__":
+    main()
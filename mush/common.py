@@ -1,3 +1,6 @@
+# Exposed names : what was exposed, see exposed()
+_exposed = {}
+
 def expose(*args):
     '''Expose the functino to global namespace.
 
@@ -19,11 +22,12 @@ def expose(*args):
         if not callable(func):
             raise TypeError(func, 'Not callable')   #FIXME
         print "exposing func: %s with name: %s" % (str(func), name)
-        #setattr(ax._scriptEngine_.globalNameSpaceModule, name, func.__call__)
-        setattr(ax._scriptEngine_.globalNameSpaceModule, name, func)
         # setattr doesn't work on instancemethod for python2.7
         # setattr(func, 'global_name', name)
-        func.__func__.global_name = name
+        getattr(func, "__func__", func).global_name = name
+        _exposed[name] = func
+        #setattr(ax._scriptEngine_.globalNameSpaceModule, name, func.__call__)
+        setattr(ax._scriptEngine_.globalNameSpaceModule, name, func)
         return
 
     if len(args) == 1:
@@ -34,3 +38,14 @@ def expose(*args):
             return func
         return CalledOnFunc
 
+def unexpose(name):
+    '''Remove a name exposed by expose() from the global namespace'''
+    if _exposed.pop(name, None) is not None:
+        namespace = ax._scriptEngine_.globalNameSpaceModule
+        if hasattr(namespace, name):
+            delattr(namespace, name)
+
+def exposed():
+    '''{name: callable} of the exposed names'''
+    return dict(_exposed)
+
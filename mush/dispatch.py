@@ -0,0 +1,451 @@
+'''Python side trigger dispatch.
+
+Instead of adding one MUSHclient trigger per handler, a single catch-all
+trigger forwards every line to a Dispatcher. The dispatcher keeps all the
+enabled patterns in one index keyed by a literal each pattern requires, so
+for a given line only the regexes whose literal occurs in it are run. The
+literals occurring in a line are found by a single regex alternating all of
+them, so the cost per line doesn't grow with the number of patterns.
+
+Enabling or disabling an entry is a Python side flag flip, no client call
+is involved.
+
+Entries can also match blocks of lines. A block starts at a line matching
+a start marker and is matched line by line as it grows, up to a number of
+lines, either until a line matches an end marker or until the lines joined
+with newlines match a multi-line pattern. Only the blocks started are looked
+at, and a block is only matched again when its new line may complete the
+pattern, so a long multi-line pattern isn't rescanned on every line.
+'''
+
+__all__ = ["Dispatcher", "install_dispatcher", "get_dispatcher"]
+
+import re
+import sys
+import sre_parse
+import sre_compile
+import sre_constants
+import traceback
+
+from trigger import *
+from common import expose
+from wildcards import Wildcards
+
+def _required_literal(pattern):
+    '''Return the longest literal that every match of the pattern contains.
+
+    Only top level literals are considered. Returns None when nothing can be
+    safely required, e.g. with top level alternation or ignore case.
+    '''
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, TypeError, OverflowError):
+        return None
+    if parsed.pattern.flags & re.IGNORECASE:
+        return None
+
+    best, run = "", []
+    for op, av in parsed:
+        if op == sre_constants.LITERAL:
+            run.append(chr(av) if av < 128 else unichr(av))
+            continue
+        if op == sre_constants.BRANCH:
+            return None
+        if len(run) > len(best):
+            best = "".join(run)
+        run = []
+    if len(run) > len(best):
+        best = "".join(run)
+    return best or None
+
+def _trie_regex(literals):
+    '''Regex matching any of the literals, the longest one at a given
+    position. Shared prefixes are factored so that matching takes as many
+    steps as the literals are long, however many they are.'''
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[""] = True     # a literal ends here
+    def build(node):
+        branches = [re.escape(char) + build(child)
+                for char, child in sorted(node.iteritems()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        regex = "(?:{0})".format("|".join(branches))
+        return regex + "?" if "" in node else regex
+    return build(trie)
+
+_single = (sre_constants.LITERAL, sre_constants.NOT_LITERAL,
+        sre_constants.ANY, sre_constants.IN)
+_nested = (sre_constants.SUBPATTERN, sre_constants.MAX_REPEAT,
+        sre_constants.MIN_REPEAT, sre_constants.BRANCH)
+_context = (sre_constants.ASSERT, sre_constants.ASSERT_NOT,
+        sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS)
+
+def _newline_span(items, state):
+    '''(min, max) numbers of newlines in the text a parsed pattern matches
+    or looks ahead at, max None if unbounded'''
+    low, high = 0, 0
+    for op, av in items:
+        if op in _single:
+            single = sre_parse.SubPattern(state, [(op, av)])
+            newline = bool(sre_compile.compile(single, state.flags).match("\n"))
+            if op == sre_constants.LITERAL:
+                span = (int(newline), int(newline))
+            else:
+                span = (0, int(newline))
+        elif op == sre_constants.SUBPATTERN:
+            span = _newline_span(av[1], state)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            least, most, sub = av
+            sub_low, sub_high = _newline_span(sub, state)
+            if sub_high == 0:
+                span = (0, 0)
+            elif sub_high is None or most == sre_constants.MAXREPEAT:
+                span = (sub_low * least, None)
+            else:
+                span = (sub_low * least, sub_high * most)
+        elif op == sre_constants.BRANCH:
+            spans = [_newline_span(sub, state) for sub in av[1]]
+            highs = [h for l, h in spans]
+            span = (min(l for l, h in spans),
+                    None if None in highs else max(highs))
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            span = (0, _newline_span(av[1], state)[1])
+        elif op == sre_constants.AT:
+            span = (0, 0)
+        else:
+            span = (0, None)    # e.g. back references
+        low += span[0]
+        high = None if high is None or span[1] is None else high + span[1]
+    return low, high
+
+def _uses_context(items):
+    '''Whether a parsed pattern has look arounds or back references'''
+    for op, av in items:
+        if op in _context:
+            return True
+        if op == sre_constants.SUBPATTERN and _uses_context(av[1]):
+            return True
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and \
+                _uses_context(av[2]):
+            return True
+        if op == sre_constants.BRANCH and any(_uses_context(sub)
+                for sub in av[1]):
+            return True
+    return False
+
+def _block_filter(pattern):
+    '''Analyze a multi-line pattern: returns (min, max) numbers of newlines
+    its matches span (see _newline_span()) and a regex its last line must
+    contain, or None.
+
+    A block only gets a new match when it ends in its new line, and then
+    the end of the pattern that can't span lines is in that line.
+    '''
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, TypeError, OverflowError):
+        return (0, None), None
+    state = parsed.pattern
+    span = _newline_span(parsed, state)
+    if _uses_context(parsed):
+        return span, None
+    items = list(parsed)
+    start = len(items)
+    while start and _newline_span(items[start - 1:start], state)[1] == 0:
+        start -= 1
+    if start == len(items):
+        return span, None
+    tail = sre_parse.SubPattern(state, items[start:])
+    return span, sre_compile.compile(tail, state.flags)
+
+class _Entry(object):
+    __slots__ = ("name", "pattern", "regex", "literal", "callback",
+            "enabled", "seq", "group", "priority", "exclusive", "hits",
+            "order")
+
+    def __init__(self, name, pattern, callback, seq, group, priority=None,
+            exclusive=False):
+        self.name = name
+        self.group = group
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.literal = _required_literal(pattern)
+        self.callback = callback
+        self.enabled = False
+        self.seq = seq
+        self.priority = 100 if priority is None else priority
+        self.exclusive = exclusive
+        self.hits = 0
+        self.order = (self.priority, seq)   # evaluation order
+
+class _BlockEntry(_Entry):
+    __slots__ = ("end", "whole", "lines", "span", "tail")
+
+    def __init__(self, name, pattern, callback, seq, group, lines, start, end):
+        # the start marker is what gets indexed
+        super(_BlockEntry, self).__init__(name, start or pattern, callback,
+                seq, group)
+        self.pattern = pattern
+        self.end = re.compile(end) if end is not None else None
+        self.whole = re.compile(pattern) if start is not None else None
+        self.lines = lines
+        if start is not None:
+            self.span, self.tail = _block_filter(pattern)
+
+class _Block(object):
+    '''A block being collected'''
+    __slots__ = ("entry", "lines", "first")
+
+    def __init__(self, entry, line, first):
+        self.entry = entry
+        self.lines = [line]
+        self.first = first  # match of the start marker
+
+class Dispatcher(object):
+    '''Match lines against many patterns and call the matching callbacks.
+
+    Callbacks are invoked like MUSHclient trigger scripts, with the
+    wildcards of the match as a Wildcards object (see mush.wildcards):
+
+        >>> callback(name, line, wildcards)
+
+    in the order of their priority (lower first, 100 by default, like the
+    client's trigger sequence) then of adding. Entries are added disabled,
+    the same as triggers created by add_trigger().
+
+    A line matching an exclusive entry is declared to match no other
+    entry, so evaluation stops there. With adaptive set, the exclusive
+    entries are evaluated before the others, the most matched first, as
+    reordered every 1024 lines; the others keep their order.
+
+    Block entries are added with lines, the maximum length of the block,
+    and either
+
+        end: the block starts at a line matching pattern and ends at the
+            next line matching end, or
+        start: the block starts at a line matching start and ends when the
+            lines of the block joined with newlines match pattern (anchored
+            at the start line).
+
+    Their wildcards are those of the start match or of the multi-line
+    match, the 10th being the block's lines joined with newlines. A block
+    reaching lines lines without ending is dropped.
+    '''
+
+    def __init__(self, name="mushpy_dispatch"):
+        self.name = name
+        self._entries = {}      # name : _Entry
+        self._by_literal = {}   # literal : set of enabled entries
+        self._literals = None   # regex finding the literals, see _index()
+        self._prefixes = {}     # literal : the literals it starts with
+        self._unfiltered = set()    # enabled entries without a literal
+        self._groups = {}       # group : set of names
+        self._open = {}         # name : _Block being collected
+        self._seq = 0
+        self.adaptive = False
+        self.lines = 0          # lines dispatched
+        self.evaluations = 0    # regex searches made on them
+
+    def add(self, name, pattern, callback, enabled=False, group=None,
+            lines=None, start=None, end=None, priority=None, exclusive=False):
+        if name in self._entries:
+            self.remove(name)
+        self._seq += 1
+        if lines or start is not None or end is not None:
+            if (start is None) == (end is None):
+                raise ValueError("A block needs either start or end")
+            entry = _BlockEntry(name, pattern, callback, self._seq, group,
+                    lines or 200, start, end)
+            entry.priority = 100 if priority is None else priority
+            entry.order = (entry.priority, entry.seq)
+        else:
+            entry = _Entry(name, pattern, callback, self._seq, group,
+                    priority, exclusive)
+        self._entries[name] = entry
+        if group:
+            self._groups.setdefault(group, set()).add(name)
+        if enabled:
+            self.set_enabled(name, True)
+
+    def remove(self, name):
+        self.set_enabled(name, False)
+        entry = self._entries.pop(name)
+        if entry.group:
+            members = self._groups[entry.group]
+            members.discard(name)
+            if not members:
+                del self._groups[entry.group]
+
+    def set_group_enabled(self, group, on):
+        '''Counterpart of enable_trigger_group(). Returns the group size.'''
+        members = self._groups.get(group, ())
+        for name in members:
+            self.set_enabled(name, on)
+        return len(members)
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def is_enabled(self, name):
+        return self._entries[name].enabled
+
+    def set_enabled(self, name, on):
+        entry = self._entries[name]
+        on = bool(on)
+        if entry.enabled == on:
+            return
+        entry.enabled = on
+        if entry.literal is None:
+            bucket = self._unfiltered
+        else:
+            bucket = self._by_literal.get(entry.literal)
+            if bucket is None:
+                bucket = self._by_literal[entry.literal] = set()
+                self._literals = None
+        if on:
+            bucket.add(entry)
+        else:
+            # an empty bucket is kept until the index is rebuilt, entries
+            # coming and going don't cause a rebuild
+            bucket.discard(entry)
+            self._open.pop(name, None)
+
+    def _index(self):
+        '''Build the regex finding the literals of the enabled entries'''
+        for literal in [literal for literal, bucket in
+                self._by_literal.iteritems() if not bucket]:
+            del self._by_literal[literal]
+        if not self._by_literal:
+            self._literals = None
+            return
+        # at each position the longest literal is found, the shorter ones
+        # starting there are its prefixes
+        literals = self._by_literal
+        self._literals = re.compile("(?=({0}))".format(
+            _trie_regex(literals)))
+        self._prefixes = dict((literal, [literal[:i] for i in
+                range(1, len(literal)) if literal[:i] in literals])
+            for literal in literals)
+
+    def candidates(self, line):
+        '''Enabled entries that may match the line, in evaluation order.'''
+        found = list(self._unfiltered)
+        if self._literals is None and self._by_literal:
+            self._index()
+        if self._literals is not None:
+            buckets = self._by_literal
+            seen = set()
+            for m in self._literals.finditer(line):
+                literal = m.group(1)
+                if literal in seen:
+                    continue
+                seen.add(literal)
+                found.extend(buckets[literal])
+                for prefix in self._prefixes[literal]:
+                    if prefix not in seen:
+                        seen.add(prefix)
+                        found.extend(buckets[prefix])
+        if len(found) > 1:
+            found.sort(key=lambda e: e.order)
+        return found
+
+    def reorder(self):
+        '''Put the exclusive entries first, the most matched since the last
+        reordering first, or back in priority order if not adaptive'''
+        for entry in self._entries.itervalues():
+            if self.adaptive and entry.exclusive:
+                # ahead of any priority, older hits weighing less and less
+                entry.order = (-1, -entry.hits, entry.seq)
+                entry.hits >>= 1
+            else:
+                entry.order = (entry.priority, entry.seq)
+
+    def _call(self, entry, m, line):
+        try:
+            entry.callback(entry.name, line, Wildcards(line, m))
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+
+    def _feed(self, block):
+        '''Check whether a block ended with its last line'''
+        entry = block.entry
+        if entry.end is not None:
+            m = None
+            if len(block.lines) > 1 and entry.end.search(block.lines[-1]):
+                m = block.first
+        else:
+            m = None
+            newlines = len(block.lines) - 1
+            low, high = entry.span
+            if newlines >= low and (entry.tail is None or
+                    entry.tail.search(block.lines[-1])):
+                m = entry.whole.match("\n".join(block.lines))
+            if m is None and high is not None and newlines >= high:
+                # longer than any match
+                self._open.pop(entry.name, None)
+                return
+        if m is not None:
+            self._open.pop(entry.name, None)
+            self._call(entry, m, "\n".join(block.lines))
+        elif len(block.lines) >= entry.lines:
+            self._open.pop(entry.name, None)
+
+    def dispatch(self, line):
+        '''Run all the enabled callbacks matching the line.
+
+        An exception in one callback is reported on stderr and doesn't
+        prevent the others from running, like separate client triggers.
+        '''
+        for block in self._open.values():
+            if self._open.get(block.entry.name) is not block:
+                continue    # closed by a callback
+            block.lines.append(line)
+            self._feed(block)
+        self.lines += 1
+        if self.adaptive and not self.lines & 1023:
+            self.reorder()
+        for entry in self.candidates(line):
+            self.evaluations += 1
+            m = entry.regex.search(line)
+            if m is None:
+                continue
+            entry.hits += 1
+            if isinstance(entry, _BlockEntry):
+                block = self._open[entry.name] = _Block(entry, line, m)
+                self._feed(block)
+                continue
+            self._call(entry, m, line)
+            if entry.exclusive:
+                break
+
+    def on_line(self, name, line, wildcards):
+        '''Script callback of the catch-all client trigger.'''
+        self.dispatch(line)
+        # whatever the handlers printed for this line goes out in one batch
+        sys.stdout.flush()
+
+_dispatcher = None
+
+def install_dispatcher(name="mushpy_dispatch"):
+    '''Create the catch-all trigger feeding the dispatcher.
+
+    Task instances created afterwards register their handlers into the
+    dispatcher rather than as individual client triggers.
+    '''
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = Dispatcher(name)
+        expose(_dispatcher.on_line, name)
+        add_trigger(name=name, pattern="^.*$", script=name)
+        enable_trigger(name)
+    return _dispatcher
+
+def get_dispatcher():
+    '''Return the installed Dispatcher or None.'''
+    return _dispatcher
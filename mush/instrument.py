@@ -0,0 +1,285 @@
+'''Optional instrumentation of handlers and world calls.
+
+When started, every Task handler call and every call made through the world
+object is counted and timed, per handler ("Class.handler") and per world
+method. When stopped, handlers only pay a None check and the world object is
+the client's own.
+
+    >>> import mush.instrument as instrument
+    >>> instrument.start(sample_every=10)   # time one call in ten
+    >>> ...
+    >>> instrument.report()                 # to the "mushpy profile" notepad
+    >>> instrument.report("profile.txt")
+
+In sampling mode all the calls are counted but only one in sample_every is
+timed, which is cheap enough to stay on. install_command() adds a
+"mushpy profile start|stop|reset|report|memory [file]" client command.
+
+memory_report() lists the live Task instances and the exposed names, with
+the approximate memory each of them retains, to find what keeps growing
+over a long session.
+'''
+
+__all__ = ["Profiler", "start", "stop", "reset", "report", "memory_report",
+        "install_command"]
+
+import gc
+import sys
+import time
+import types
+from collections import deque
+from greenlet import greenlet, getcurrent
+
+from consts import *
+from common import expose, exposed
+
+class _Stat(object):
+    __slots__ = ("calls", "timed", "total", "max", "recent")
+
+    def __init__(self):
+        self.calls = 0
+        self.timed = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=1024)    # latest timings, for p99
+
+    def add(self, elapsed):
+        self.timed += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.recent.append(elapsed)
+
+    def mean(self):
+        return self.total / self.timed if self.timed else 0.0
+
+    def p99(self):
+        if not self.recent:
+            return 0.0
+        values = sorted(self.recent)
+        return values[int(0.99 * (len(values) - 1))]
+
+    def estimated_total(self):
+        '''Total time, extrapolated from the timed calls'''
+        return self.mean() * self.calls
+
+class Profiler(object):
+    def __init__(self, sample_every=1):
+        self.sample_every = max(1, int(sample_every))
+        self.handlers = {}  # "Class.handler" : _Stat
+        self.world_calls = {}   # lower case method : _Stat
+        self._count = 0
+
+    def _stat(self, table, key):
+        stat = table.get(key)
+        if stat is None:
+            stat = table[key] = _Stat()
+        return stat
+
+    def _sampled(self):
+        self._count += 1
+        return self._count % self.sample_every == 0
+
+    def call(self, table, key, func, *args):
+        stat = self._stat(table, key)
+        stat.calls += 1
+        if not self._sampled():
+            return func(*args)
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            stat.add(time.time() - start)
+
+    def call_handler(self, task, name, method, wc):
+        key = "{0}.{1}".format(type(task).__name__, name)
+        return self.call(self.handlers, key, method, wc)
+
+    def lines(self):
+        '''The report, sorted by total time'''
+        out = []
+        for title, table in (("Handlers", self.handlers),
+                ("World calls", self.world_calls)):
+            out.append("{0} (every {1} call timed)".format(title,
+                self.sample_every))
+            out.append("{0:<40} {1:>10} {2:>12} {3:>10} {4:>10} {5:>10}".format(
+                "name", "calls", "total ms", "mean us", "p99 us", "max us"))
+            for key, stat in sorted(table.iteritems(),
+                    key=lambda item: -item[1].estimated_total()):
+                out.append("{0:<40} {1:>10} {2:>12.2f} {3:>10.1f} "
+                        "{4:>10.1f} {5:>10.1f}".format(key, stat.calls,
+                            stat.estimated_total() * 1e3, stat.mean() * 1e6,
+                            stat.p99() * 1e6, stat.max * 1e6))
+            out.append("")
+        return out
+
+class _InstrumentedWorld(object):
+    '''Proxy of the world object timing the calls made through it'''
+
+    def __init__(self, world, profiler):
+        self.__dict__["_world"] = world
+        self.__dict__["_profiler"] = profiler
+
+    def __getattr__(self, name):
+        method = getattr(self._world, name)
+        key = name.lower()
+        profiler = self._profiler
+        def call(*args):
+            return profiler.call(profiler.world_calls, key, method, *args)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._world, name, value)
+
+# The running profiler, checked by the Task handlers
+handler_profiler = None
+_world = None   # the client's world while it is instrumented
+
+def start(sample_every=1, handlers=True, world_calls=True):
+    '''Start (or restart with new settings) collecting, keeping the data
+    collected so far.'''
+    global handler_profiler, _world
+    import __builtin__
+    profiler = handler_profiler or _profiler
+    profiler.sample_every = max(1, int(sample_every))
+    handler_profiler = profiler if handlers else None
+    if world_calls and _world is None:
+        _world = __builtin__.world
+        __builtin__.world = _InstrumentedWorld(_world, profiler)
+    elif not world_calls:
+        _restore_world()
+
+def _restore_world():
+    global _world
+    if _world is not None:
+        import __builtin__
+        __builtin__.world = _world
+        _world = None
+
+def stop():
+    '''Stop collecting, the data is kept for report()'''
+    global handler_profiler
+    handler_profiler = None
+    _restore_world()
+
+def reset():
+    '''Drop the data collected so far'''
+    _profiler.handlers.clear()
+    _profiler.world_calls.clear()
+    _profiler._count = 0
+
+def _write(lines, target, title):
+    if target is None:
+        world.ReplaceNotepad(title, "\r\n".join(lines) + "\r\n")
+    elif isinstance(target, basestring):
+        with open(target, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    else:
+        target.write("\n".join(lines) + "\n")
+        target.flush()
+
+def report(target=None):
+    '''Write the report.
+
+    target is a file name, an object with a write() method such as a
+    Terminal, or None for the "mushpy profile" notepad.
+    '''
+    _write(_profiler.lines(), target, "mushpy profile")
+
+# not followed when measuring what an object retains
+_shared_types = (types.ModuleType, type, types.ClassType, types.FunctionType,
+        types.BuiltinFunctionType, greenlet)
+
+def _retained(obj, seen, limit=100000):
+    '''Approximate size in bytes of what can be reached from obj and wasn't
+    seen yet, not following modules, classes, functions and greenlets'''
+    size = 0
+    # greenlets don't show their attributes and frame to the gc
+    stack = [obj, getattr(obj, "__dict__", None),
+            getattr(obj, "gr_frame", None)]
+    while stack and limit:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        limit -= 1
+        size += sys.getsizeof(item, 0)
+        for ref in gc.get_referents(item):
+            if not isinstance(ref, _shared_types) or ref is obj:
+                stack.append(ref)
+    return size
+
+def _task_state(task, waiting):
+    if task.dead:
+        return "dead"
+    if task is getcurrent():
+        return "running"
+    if not task:
+        return "not started"
+    return "waiting" if task in waiting else "suspended"
+
+def memory_lines():
+    from task import live_tasks, _scheduler
+    gc.collect()
+    tasks = live_tasks()
+    seen = set()
+    sizes = dict((id(task), _retained(task, seen)) for task in tasks)
+    by_class = {}
+    for task in tasks:
+        by_class.setdefault(type(task).__name__, []).append(task)
+    out = ["Live tasks: {0} (approximate bytes retained)".format(len(tasks))]
+    for name, members in sorted(by_class.iteritems(),
+            key=lambda item: -sum(sizes[id(t)] for t in item[1])):
+        out.append("  {0:<38} {1:>8} {2:>12}".format(name, len(members),
+            sum(sizes[id(t)] for t in members)))
+        for task in sorted(members, key=lambda t: -sizes[id(t)]):
+            out.append("    {0:<36} {1:<12} {2:>12}".format(
+                "#{0}".format(task._serial),
+                _task_state(task, _scheduler._waiters), sizes[id(task)]))
+    names = exposed()
+    out.append("")
+    out.append("Exposed names: {0}".format(len(names)))
+    for name, func in sorted(names.iteritems()):
+        target = getattr(func, "__self__", None)
+        what = getattr(func, "__name__", type(func).__name__)
+        size = _retained(target, seen) if target is not None else 0
+        out.append("  {0:<38} {1:<24} {2:>10}".format(name, what, size))
+    out.append("")
+    return out
+
+def memory_report(target=None):
+    '''Write the memory report, to target as for report(), by default the
+    "mushpy memory" notepad.'''
+    _write(memory_lines(), target, "mushpy memory")
+
+_profiler = Profiler()
+
+def _command(name, line, wildcards):
+    action, arg = wildcards[0], wildcards[1]
+    if action == "start":
+        start(sample_every=int(arg or 1))
+    elif action == "stop":
+        stop()
+    elif action == "reset":
+        reset()
+    elif action == "memory":
+        memory_report(arg or None)
+    else:
+        report(arg or None)
+
+def install_command(name="mushpy_profile"):
+    '''Add the client alias
+
+        mushpy profile start [sample_every]
+        mushpy profile stop|reset
+        mushpy profile report [file]
+        mushpy profile memory [file]
+    '''
+    expose(_command, "mushpy_profile_command")
+    res = world.AddAlias(name,
+            r"^mushpy profile (start|stop|reset|report|memory)(?: (\S+))?$",
+            "",
+            AliasFlags.Re_Replace | AliasFlags.eEnabled,
+            "mushpy_profile_command")
+    if res != ErrorNo.eOK:
+        raise RuntimeError("Alias creation failed: {0}".format(res))
@@ -0,0 +1,169 @@
+'''Run Task handlers over session logs, without a client, on all cores.
+
+Log files are memory mapped and cut into shards on line boundaries. Each
+shard is processed by a worker of a process pool, which creates one
+instance of each Task class and calls the handlers of the lines matching
+their patterns, with all handlers enabled. The per shard results are merged
+in shard order, so the outcome doesn't depend on the number of processes:
+
+    >>> res = run(["session1.log", "session2.log"], [Combat, Loot])
+    >>> res["handlers"]["Combat.onHit"]["matches"]
+    >>> res["handlers"]["Combat.onHit"]["values"]  # non None return values
+
+Task instances only see the lines of their shard. A class can define
+offline_result(self), returning a picklable summary of an instance's state;
+res["results"]["Class"] is then the list of the summaries of all the
+shards, or the value of the class' offline_merge(cls, summaries) if it has
+one. Handlers waiting in expect() or sleep() are not supported. Calls to
+world go to a simulated world (see mush.sim).
+
+From the command line, with the Task classes of a module:
+
+    python -m mush.offline [-j PROCESSES] MODULE LOG [LOG ...]
+'''
+
+import os
+import sys
+import mmap
+import argparse
+import multiprocessing
+
+def shards(path, count):
+    '''Cut a file into about count (path, start, end) byte ranges, each
+    ending at a line boundary'''
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            ranges = []
+            start = 0
+            step = max(1, size // max(1, count))
+            while start < size:
+                end = data.find("\n", min(start + step, size) - 1)
+                end = size if end == -1 else end + 1
+                ranges.append((path, start, end))
+                start = end
+            return ranges
+        finally:
+            data.close()
+
+def _lines(path, start, end):
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            chunk = data[start:end]
+        finally:
+            data.close()
+    for line in chunk.splitlines():
+        yield line.decode("utf-8", "replace")
+
+def _offline_world():
+    '''Give the handlers a world to talk to'''
+    import __builtin__
+    if getattr(__builtin__, "world", None) is None:
+        import sim
+        ax = sim.make_ax()
+        __builtin__.ax = ax
+        __builtin__.world = ax._scriptEngine_.globalNameSpaceModule.world
+
+def _run_shard(job):
+    path, start, end, classes = job
+    _offline_world()
+    from dispatch import Dispatcher
+
+    dispatcher = Dispatcher()
+    handlers = {}   # "Class.func" : {"matches": n, "values": [...]}
+    instances = []
+    for cls in classes:
+        task = cls()
+        instances.append(task)
+        for func, pattern in sorted(cls._func2pattern.iteritems()):
+            key = "{0}.{1}".format(cls.__name__, func)
+            stat = handlers[key] = {"matches": 0, "values": []}
+            def callback(name, line, wc, task=task,
+                    handler=cls._shared[func].handler, stat=stat):
+                stat["matches"] += 1
+                value = handler(task, wc)
+                if value is not None:
+                    stat["values"].append(value)
+            options = dict(cls._func2order.get(func, {}),
+                    **cls._func2block.get(func, {}))
+            dispatcher.add(key, pattern, callback, enabled=True, **options)
+
+    count = 0
+    for line in _lines(path, start, end):
+        count += 1
+        dispatcher.dispatch(line)
+
+    results = {}
+    for task in instances:
+        if hasattr(task, "offline_result"):
+            results[type(task).__name__] = task.offline_result()
+    return count, handlers, results
+
+def _merge(shard_results, classes):
+    total = 0
+    handlers = {}
+    results = {}
+    for count, shard_handlers, shard_results in shard_results:
+        total += count
+        for key, stat in shard_handlers.iteritems():
+            merged = handlers.setdefault(key, {"matches": 0, "values": []})
+            merged["matches"] += stat["matches"]
+            merged["values"].extend(stat["values"])
+        for name, result in shard_results.iteritems():
+            results.setdefault(name, []).append(result)
+    for cls in classes:
+        merge = getattr(cls, "offline_merge", None)
+        if merge is not None and cls.__name__ in results:
+            results[cls.__name__] = merge(results[cls.__name__])
+    return {"lines": total, "handlers": handlers, "results": results}
+
+def run(paths, classes, processes=None, shards_per_process=4):
+    '''Run the handlers of the Task classes over the log files.
+
+    processes defaults to the number of cores; with processes=1 everything
+    runs in this process.
+    '''
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    jobs = []
+    for path in paths:
+        for path, start, end in shards(path, processes * shards_per_process):
+            jobs.append((path, start, end, list(classes)))
+    if processes == 1:
+        return _merge(map(_run_shard, jobs), classes)
+    pool = multiprocessing.Pool(processes)
+    try:
+        return _merge(pool.map(_run_shard, jobs, chunksize=1), classes)
+    finally:
+        pool.close()
+        pool.join()
+
+def main(argv=None):
+    import importlib
+    from task import Task
+
+    parser = argparse.ArgumentParser(prog="python -m mush.offline",
+            description="Run the Task handlers of a module over session logs.")
+    parser.add_argument("module", help="module defining Task subclasses")
+    parser.add_argument("logs", nargs="+", help="session logs")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+            help="number of processes (default: number of cores)")
+    args = parser.parse_args(argv)
+
+    module = importlib.import_module(args.module)
+    classes = [value for value in vars(module).values()
+            if isinstance(value, type) and issubclass(value, Task) and
+            value.__module__ == module.__name__]
+    res = run(args.logs, classes, args.processes)
+    sys.stdout.write("{0} lines\n".format(res["lines"]))
+    for key, stat in sorted(res["handlers"].iteritems()):
+        sys.stdout.write("{0:<40} {1:>10}\n".format(key, stat["matches"]))
+    for name, result in sorted(res["results"].iteritems()):
+        sys.stdout.write("{0}: {1!r}\n".format(name, result))
+
+if __name__ == "__main__":
+    main()
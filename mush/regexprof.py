@@ -0,0 +1,388 @@
+'''Cost profiler and backtracking checker of handler patterns.
+
+    python -m mush.regexprof [options] [LOG ...]
+
+Collects the patterns of the Task handlers (triggers, aliases and the
+markers of multi-line triggers), and for each of them:
+
+    - looks for constructs known to backtrack badly: nested unbounded
+      quantifiers such as (a+)+, alternatives that can match the same text
+      under a quantifier such as (\w|\d)+, adjacent quantifiers over the
+      same characters such as \d+\d* and unanchored patterns starting with
+      .* (searched from every position of a non-matching line),
+    - times it on growing adversarial inputs made of the characters its
+      quantifiers repeat, and reports how the time grows with the length,
+    - times it on the lines of session logs, or of a synthetic session,
+      and reports its cost per line, the patterns ranked by total time.
+
+Patterns are searched with Python's re, which backtracks like the
+client's PCRE.
+
+In a test suite:
+
+    >>> import mymodule
+    >>> assert not regexprof.check()
+
+check() returns the problems found in the patterns of all the Task classes
+defined so far, or of the ones given.
+'''
+
+import re
+import sys
+import json
+import math
+import argparse
+import sre_parse
+import sre_constants
+from timeit import default_timer
+
+_UNBOUNDED = 100    # repeats of more than this are considered unbounded
+_ALPHABET = frozenset(map(chr, range(32, 127)) + ["\t"])
+
+_categories = {
+    sre_constants.CATEGORY_DIGIT: frozenset("0123456789"),
+    sre_constants.CATEGORY_SPACE: frozenset(" \t"),
+    sre_constants.CATEGORY_WORD: frozenset(c for c in _ALPHABET
+        if c.isalnum() or c == "_"),
+}
+_categories[sre_constants.CATEGORY_NOT_DIGIT] = \
+        _ALPHABET - _categories[sre_constants.CATEGORY_DIGIT]
+_categories[sre_constants.CATEGORY_NOT_SPACE] = \
+        _ALPHABET - _categories[sre_constants.CATEGORY_SPACE]
+_categories[sre_constants.CATEGORY_NOT_WORD] = \
+        _ALPHABET - _categories[sre_constants.CATEGORY_WORD]
+
+def _char(code):
+    return chr(code) if code < 128 else unichr(code)
+
+def _charset(op, av):
+    '''Printable characters matched by a single character item, or None'''
+    if op == sre_constants.LITERAL:
+        return frozenset([_char(av)])
+    if op == sre_constants.NOT_LITERAL:
+        return _ALPHABET - frozenset([_char(av)])
+    if op == sre_constants.ANY:
+        return _ALPHABET
+    if op == sre_constants.IN:
+        chars = set()
+        negate = False
+        for iop, iav in av:
+            if iop == sre_constants.NEGATE:
+                negate = True
+            elif iop == sre_constants.LITERAL:
+                chars.add(_char(iav))
+            elif iop == sre_constants.RANGE:
+                chars.update(c for c in _ALPHABET
+                        if iav[0] <= ord(c) <= iav[1])
+            elif iop == sre_constants.CATEGORY:
+                chars.update(_categories.get(iav, ()))
+        return _ALPHABET - chars if negate else frozenset(chars)
+    return None
+
+def _is_repeat(op, av):
+    return (op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and
+            av[1] > _UNBOUNDED)
+
+def _first(items):
+    '''(characters a sequence can start with, whether it can be empty)'''
+    chars = set()
+    for op, av in items:
+        single = _charset(op, av)
+        if single is not None:
+            chars.update(single)
+            return chars, False
+        if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            sub, empty = _first(av[2])
+            chars.update(sub)
+            if av[0] > 0 and not empty:
+                return chars, False
+        elif op == sre_constants.SUBPATTERN:
+            sub, empty = _first(av[1])
+            chars.update(sub)
+            if not empty:
+                return chars, False
+        elif op == sre_constants.BRANCH:
+            empty = False
+            for branch in av[1]:
+                sub, branch_empty = _first(branch)
+                chars.update(sub)
+                empty = empty or branch_empty
+            if not empty:
+                return chars, False
+        elif op in (sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS):
+            # unknown content
+            chars.update(_ALPHABET)
+            return chars, False
+        # AT, ASSERT, ASSERT_NOT: zero width
+    return chars, True
+
+def _children(op, av):
+    '''Sub-sequences of an item'''
+    if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+        return [av[2]]
+    if op == sre_constants.SUBPATTERN:
+        return [av[1]]
+    if op == sre_constants.BRANCH:
+        return av[1]
+    if op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+        return [av[1]]
+    return []
+
+def _contains_repeat(items):
+    for op, av in items:
+        if _is_repeat(op, av):
+            return True
+        if any(_contains_repeat(sub) for sub in _children(op, av)):
+            return True
+    return False
+
+def _branches(items):
+    '''Alternatives of a sequence made of a single alternation'''
+    while len(items) == 1 and items[0][0] == sre_constants.SUBPATTERN:
+        items = items[0][1][1]
+    if len(items) == 1 and items[0][0] == sre_constants.BRANCH:
+        return items[0][1][1]
+    return None
+
+def _scan(items, problems, samples):
+    '''Look for bad constructs in a sequence and its sub-sequences'''
+    items = list(items)
+    for i, (op, av) in enumerate(items):
+        if _is_repeat(op, av):
+            body = list(av[2])
+            chars, empty = _first(body)
+            samples.append(chars)
+            if _contains_repeat(body):
+                problems.append(("error", "nested quantifiers, exponential "
+                    "backtracking"))
+            branches = _branches(body)
+            if branches:
+                firsts = [_first(branch)[0] for branch in branches]
+                if any(firsts[a] & firsts[b] for a in range(len(firsts))
+                        for b in range(a + 1, len(firsts))):
+                    problems.append(("error", "overlapping alternatives "
+                        "under a quantifier, exponential backtracking"))
+            # a following quantifier reachable without consuming anything
+            # and repeating some of the same characters
+            for op2, av2 in items[i + 1:]:
+                if _is_repeat(op2, av2):
+                    if chars & _first(av2[2])[0]:
+                        problems.append(("warning", "adjacent quantifiers "
+                            "over the same characters, polynomial "
+                            "backtracking"))
+                    break
+                if not _first([(op2, av2)])[1]:
+                    break
+        for sub in _children(op, av):
+            _scan(sub, problems, samples)
+
+def analyze(pattern):
+    '''Static check of a pattern.
+
+    Returns ([(severity, message)], [sets of characters repeated by its
+    quantifiers]). Severity is "error" for exponential backtracking and
+    "warning" for polynomial.
+    '''
+    try:
+        parsed = sre_parse.parse(pattern)
+    except (sre_constants.error, TypeError, OverflowError) as e:
+        return [("error", "invalid pattern: {0}".format(e))], []
+    problems = []
+    samples = []
+    _scan(parsed, problems, samples)
+    items = list(parsed)
+    if items and _is_repeat(*items[0]) and len(items[0][1][2]) == 1 and \
+            _charset(*items[0][1][2][0]) == _ALPHABET:
+        problems.append(("warning", "unanchored leading .*, quadratic on "
+            "non-matching lines; anchor it with ^"))
+    # one report per kind of problem is enough
+    seen = set()
+    problems = [p for p in problems if not (p in seen or seen.add(p))]
+    return problems, samples
+
+def _time_search(regex, text, budget):
+    '''Seconds per search, repeating short searches for accuracy'''
+    count = 1
+    while True:
+        start = default_timer()
+        for i in xrange(count):
+            regex.search(text)
+        elapsed = default_timer() - start
+        if elapsed > 1e-3 or elapsed > budget or count >= 1 << 16:
+            return elapsed / count
+        count *= 8
+
+def growth(pattern, samples=None, budget=0.05, max_length=4096):
+    '''Time a pattern on growing adversarial inputs.
+
+    The inputs repeat a character its quantifiers accept, followed by a
+    character making the match fail. Returns (exponent, length, seconds):
+    time grows like length**exponent, measured up to length, where a
+    search took seconds. Stops as soon as a search takes more than budget
+    seconds.
+    '''
+    regex = re.compile(pattern)
+    if samples is None:
+        samples = analyze(pattern)[1]
+    pumps = sorted(set(min(chars) for chars in samples if chars)) or ["a"]
+    lengths = range(4, 32, 2) + [int(32 * 1.5 ** i) for i in range(20)]
+    worst = (0.0, 0, 0.0)
+    for pump in pumps:
+        points = []
+        for length in lengths:
+            if length > max_length:
+                break
+            seconds = _time_search(regex, pump * length + "\x01", budget)
+            points.append((length, seconds))
+            if seconds > budget:
+                break
+        # the exponent between the last point and the last one measured
+        # over a noticeable time, at most half its length
+        length, seconds = points[-1]
+        exponent = 0.0
+        for n, t in reversed(points[:-1]):
+            if n * 2 <= length and t > 1e-5:
+                exponent = math.log(seconds / t) / math.log(length / float(n))
+                break
+        else:
+            if seconds > budget and length < 64:
+                exponent = float("inf")
+        if (exponent, -length) > (worst[0], -worst[1]):
+            worst = (exponent, length, seconds)
+    return worst
+
+def collect_patterns(classes=None):
+    '''{pattern: ["Class.func", ...]} of the handlers of Task classes, all
+    the defined ones by default'''
+    from mush.task import _task_classes
+    if classes is None:
+        classes = _task_classes.values()
+    patterns = {}
+    for cls in classes:
+        for table in (cls._func2pattern, cls._func2alias):
+            for func, pattern in table.iteritems():
+                where = "{0}.{1}".format(cls.__name__, func)
+                patterns.setdefault(pattern, []).append(where)
+        for func, block in cls._func2block.iteritems():
+            for key in ("start", "end"):
+                if block.get(key) is not None:
+                    where = "{0}.{1}:{2}".format(cls.__name__, func, key)
+                    patterns.setdefault(block[key], []).append(where)
+    return patterns
+
+def profile(patterns, lines, budget=0.05):
+    '''Measure patterns, an iterable or a dict as given by
+    collect_patterns(), and return the results sorted by total time on
+    the lines, the most expensive first. Patterns with errors aren't
+    timed on the lines (matches is None).'''
+    from mush.dispatch import _required_literal
+    if not isinstance(patterns, dict):
+        patterns = dict((pattern, []) for pattern in patterns)
+    results = []
+    for pattern, where in patterns.iteritems():
+        problems, samples = analyze(pattern)
+        result = {
+            "pattern" : pattern,
+            "where" : sorted(where),
+            "problems" : problems,
+            "literal" : _required_literal(pattern),
+        }
+        results.append(result)
+        if any(message.startswith("invalid") for s, message in problems):
+            result.update(seconds=0.0, per_line_us=0.0, matches=None,
+                    exponent=0.0, length=0)
+            continue
+        exponent, length, seconds = growth(pattern, samples, budget)
+        if exponent > 1.5:
+            problems.append(("error" if exponent > 3 else "warning",
+                "search time grows like length**{0:.1f} on adversarial "
+                "input ({1:.3f}s at {2} characters)".format(exponent,
+                    seconds, length)))
+        result.update(seconds=0.0, per_line_us=0.0, matches=None,
+                exponent=exponent, length=length)
+        if any(severity == "error" for severity, message in problems):
+            # could take forever on some line
+            continue
+        search = re.compile(pattern).search
+        start = default_timer()
+        matches = 0
+        for line in lines:
+            if search(line) is not None:
+                matches += 1
+        elapsed = default_timer() - start
+        result.update(seconds=elapsed, matches=matches,
+                per_line_us=elapsed / max(len(lines), 1) * 1e6)
+    results.sort(key=lambda r: -r["seconds"])
+    return results
+
+def check(classes=None, lines=(), budget=0.05, level="error"):
+    '''Problems of the patterns of Task classes, [(pattern, where,
+    severity, message)]. level "warning" also reports the warnings.'''
+    levels = ("error",) if level == "error" else ("error", "warning")
+    found = []
+    for result in profile(collect_patterns(classes), lines, budget):
+        for severity, message in result["problems"]:
+            if severity in levels:
+                found.append((result["pattern"], result["where"], severity,
+                    message))
+    return found
+
+def report(results, lines, out=sys.stdout):
+    total = sum(r["seconds"] for r in results)
+    out.write("{0} patterns, {1} lines, {2:.3f}s, {3:.1f} us per line\n"
+            .format(len(results), lines, total,
+                total / max(lines, 1) * 1e6))
+    out.write("{0:>9} {1:>8} {2:>7} {3:>4}  {4}\n".format("us/line",
+        "share", "matches", "lit", "pattern"))
+    for r in results:
+        out.write("{0:>9.3f} {1:>7.1%} {2:>7} {3:>4}  {4}\n".format(
+            r["per_line_us"], r["seconds"] / total if total else 0.0,
+            "-" if r["matches"] is None else r["matches"],
+            "yes" if r["literal"] else "no", r["pattern"]))
+        if r["where"]:
+            out.write("{0:>33}{1}\n".format("", ", ".join(r["where"])))
+        for severity, message in r["problems"]:
+            out.write("{0:>33}{1}: {2}\n".format("", severity, message))
+
+def main(argv=None):
+    import importlib
+    from mush.bench import read_logs, synthetic_lines
+
+    parser = argparse.ArgumentParser(prog="python -m mush.regexprof",
+            description="Profile and check the patterns of Task handlers.")
+    parser.add_argument("logs", nargs="*",
+            help="session logs to time the patterns on")
+    parser.add_argument("--tasks", metavar="MODULE", action="append",
+            default=[], help="module defining Task subclasses, repeatable")
+    parser.add_argument("--pattern", action="append", default=[],
+            help="a pattern to profile, repeatable")
+    parser.add_argument("--lines", type=int, default=20000,
+            help="length of the synthetic session (default: 20000)")
+    parser.add_argument("--budget", type=float, default=0.05,
+            help="seconds a search may take on adversarial input "
+            "(default: 0.05)")
+    parser.add_argument("--check", action="store_true",
+            help="exit with status 1 if an error is found")
+    parser.add_argument("--json", action="store_true",
+            help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    for name in args.tasks:
+        importlib.import_module(name)
+    patterns = collect_patterns() if args.tasks else {}
+    for pattern in args.pattern:
+        patterns.setdefault(pattern, [])
+    lines = (read_logs(args.logs) if args.logs
+            else synthetic_lines(args.lines, 100))
+    results = profile(patterns, lines, args.budget)
+
+    if args.json:
+        sys.stdout.write(json.dumps(results))
+    else:
+        report(results, len(lines))
+    if args.check and any(severity == "error" for r in results
+            for severity, message in r["problems"]):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
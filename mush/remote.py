@@ -0,0 +1,392 @@
+'''Run the Tasks in a separate process, connected to the client by a pipe.
+
+In the client, mush.init(ax, remote=address) only installs a Shim: it
+connects to the worker process and forwards to it the calls of the
+scripts the worker's triggers, aliases and timers name, such as the
+dispatcher's catch-all trigger. The worker runs the Tasks against a
+RemoteWorld, which sends the world calls back:
+
+    - calls returning nothing useful (sending, notes, notepad writes,
+      option changes...) are queued and sent as one batch once the
+      forwarded call is processed, and answered eOK right away,
+    - the others (GetVariable, GetTriggerInfo...) wait for the client's
+      answer.
+
+The shim applies what the worker sends from a client timer, and after each
+forwarded call, never waiting for the worker, so a busy or stuck worker
+doesn't freeze the client.
+
+The connection carries pickles, so both ends must be given the same
+authkey, a secret only they know: unpickling what an unauthenticated peer
+sends would run its code. An authkey of None is refused.
+
+Worker side, e.g. with the Task classes of a module, the authkey read from
+the MUSHPY_AUTHKEY environment variable:
+
+    python -m mush.remote serve [--address HOST:PORT] MODULE
+
+MODULE.setup() is called once connected if it exists, otherwise its Task
+classes are instantiated and enabled. Or from Python:
+
+    >>> serve(setup, ("localhost", 6520), authkey)
+
+replay runs a fake client on the simulated world of mush.sim, feeding a
+worker session logs:
+
+    python -m mush.remote replay [--address HOST:PORT] LOG [LOG ...]
+'''
+
+import os
+import sys
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+from consts import *
+from common import expose
+
+DEFAULT_ADDRESS = ("localhost", 6520)
+AUTHKEY_ENV = "MUSHPY_AUTHKEY"  # the authkey of the command line
+
+class RemoteOpError(Exception): pass
+
+def _check_authkey(authkey):
+    if not authkey:
+        raise ValueError("The remote connection needs an authkey, the "
+                "secret shared by the client and the worker")
+
+# world calls applied in batches, lower case
+_batched = frozenset("""
+    note colournote colourtell tell send sendnoecho sendimmediate sendpush
+    appendtonotepad replacenotepad notepadsavemethod notepadreadonly
+    setvariable deletevariable
+    addtrigger deletetrigger enabletrigger enabletriggergroup settriggeroption
+    addalias deletealias enablealias enablealiasgroup setaliasoption
+    addtimer deletetimer enabletimer enabletimergroup settimeroption
+    arraycreate arraydelete arrayclear arrayset arraydeletekey arrayimport
+    """.split())
+
+# world calls naming a script, lower case : index of the script argument
+_scripted = {
+    "addtrigger" : 7,
+    "addalias" : 4,
+    "addtimer" : 6,
+}
+_script_options = frozenset(["settriggeroption", "setaliasoption",
+    "settimeroption"])
+
+def _plain(value):
+    '''Picklable copy of a script argument, e.g. the wildcards array'''
+    if isinstance(value, basestring) or not hasattr(value, "__iter__"):
+        return value
+    return [_plain(item) for item in value]
+
+class Shim(object):
+    '''Client side end of the connection.
+
+    Forwards script calls to the worker and applies the world calls it
+    sends back, from a client timer polling the connection every interval
+    seconds and after each forwarded call.
+    '''
+
+    def __init__(self, conn, name="mushpy_remote", interval=0.05):
+        self.conn = conn
+        self.name = name
+        self._scripts = set()   # names of the forwarding scripts exposed
+        self._pongs = set()
+        self._ping = 0
+        expose(self.poll, name)
+        res = world.AddTimer(name, 0, 0, interval, "",
+                TimerFlags.eEnabled | TimerFlags.eTemporary |
+                TimerFlags.eReplace | TimerFlags.eActiveWhenClosed, name)
+        if res != ErrorNo.eOK:
+            raise RemoteOpError("Timer creation failed: {0}".format(res))
+
+    def _forwarder(self, script):
+        def forward(*args):
+            if self.conn is None:
+                return
+            self._send(("callback", script, _plain(args)))
+            self.poll()
+        return forward
+
+    def _expose_script(self, script):
+        if script and script not in self._scripts:
+            self._scripts.add(script)
+            expose(self._forwarder(script), script)
+
+    def _apply(self, method, args):
+        key = method.lower()
+        if key in _scripted and len(args) > _scripted[key]:
+            self._expose_script(args[_scripted[key]])
+        elif key in _script_options and len(args) == 3 and \
+                args[1] == "script":
+            self._expose_script(args[2])
+        return getattr(world, method)(*args)
+
+    def _send(self, msg):
+        try:
+            self.conn.send(msg)
+        except (EOFError, IOError):
+            self._disconnected()
+
+    def _disconnected(self):
+        self.conn = None
+        world.EnableTimer(self.name, False)
+        world.Note("mushpy: remote runtime disconnected")
+
+    def poll(self, name=None):
+        '''Apply what the worker sent. Script callback of the timer.'''
+        try:
+            while self.conn is not None and self.conn.poll():
+                msg = self.conn.recv()
+                kind = msg[0]
+                if kind == "batch":
+                    for method, args in msg[1]:
+                        res = self._apply(method, args)
+                        if method.lower().startswith(("add", "delete")) \
+                                and res not in (None, ErrorNo.eOK):
+                            sys.stderr.write("mushpy: remote {0}{1!r} "
+                                "failed: {2}\n".format(method, args, res))
+                elif kind == "call":
+                    seq, method, args = msg[1:]
+                    try:
+                        res = (True, _plain(self._apply(method, args)))
+                    except Exception as e:
+                        res = (False, repr(e))
+                    self.conn.send(("result", seq, res))
+                elif kind == "pong":
+                    self._pongs.add(msg[1])
+        except (EOFError, IOError):
+            self._disconnected()
+
+    def sync(self, timeout=10.0):
+        '''Wait until the worker has processed everything forwarded so far
+        and its replies are applied. For tests and tools only, the client
+        is blocked meanwhile. Returns False on timeout.'''
+        self._ping += 1
+        ping = self._ping
+        self._send(("ping", ping))
+        deadline = time.time() + timeout
+        while self.conn is not None and ping not in self._pongs:
+            if time.time() > deadline:
+                return False
+            if self.conn.poll(0.01):
+                self.poll()
+        self._pongs.discard(ping)
+        return self.conn is not None
+
+    def close(self):
+        if self.conn is not None:
+            self._send(("close",))
+            self.conn.close()
+            self.conn = None
+        world.DeleteTimer(self.name)
+
+_shim = None
+
+def install_shim(address=DEFAULT_ADDRESS, authkey=None, interval=0.05):
+    '''Connect to the worker listening at address. Called by
+    mush.init(ax, remote=address, authkey=...).'''
+    global _shim
+    _check_authkey(authkey)
+    if _shim is None:
+        _shim = Shim(Client(address, authkey=authkey), interval=interval)
+    return _shim
+
+def get_shim():
+    '''Return the installed Shim or None.'''
+    return _shim
+
+class RemoteWorld(object):
+    '''Worker side stand-in of the world object, see the module doc'''
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._calls = []    # (method, args) not sent yet
+        self._inbox = deque()   # messages received while waiting a result
+        self._seq = 0
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name.lower() in _batched:
+            def call(*args):
+                self._calls.append((name, args))
+                return ErrorNo.eOK
+        else:
+            def call(*args):
+                return self._call(name, args)
+        setattr(self, name, call)
+        return call
+
+    def flush(self):
+        '''Send the queued calls in one batch'''
+        if self._calls:
+            calls, self._calls = self._calls, []
+            self._conn.send(("batch", calls))
+
+    def _call(self, name, args):
+        self.flush()
+        self._seq += 1
+        self._conn.send(("call", self._seq, name, args))
+        while True:
+            msg = self._conn.recv()
+            if msg[0] == "result" and msg[1] == self._seq:
+                ok, value = msg[2]
+                if not ok:
+                    raise RemoteOpError("world.{0} failed: {1}".format(name,
+                        value))
+                return value
+            self._inbox.append(msg)
+
+    def next_message(self):
+        '''Next message from the client, raising EOFError once closed'''
+        if self._inbox:
+            return self._inbox.popleft()
+        return self._conn.recv()
+
+class _Namespace(object):
+    pass
+
+class _ScriptEngine(object):
+    def __init__(self, world):
+        self.globalNameSpaceModule = _Namespace()
+        self.globalNameSpaceModule.world = world
+
+class RemoteAx(object):
+    '''Stand-in of the "ax" object given to mush.init() in the worker'''
+
+    def __init__(self, world):
+        self._scriptEngine_ = _ScriptEngine(world)
+
+def run(world, namespace):
+    '''Process the forwarded script calls until the client goes away'''
+    while True:
+        try:
+            msg = world.next_message()
+        except (EOFError, IOError):
+            return
+        kind = msg[0]
+        if kind == "callback":
+            script, args = msg[1], msg[2]
+            func = getattr(namespace, script, None)
+            if func is None:
+                sys.stderr.write("mushpy: no script {0}\n".format(script))
+            else:
+                try:
+                    func(*args)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+            sys.stdout.flush()
+            world.flush()
+        elif kind == "ping":
+            sys.stdout.flush()
+            world.flush()
+            world._conn.send(("pong", msg[1]))
+        elif kind == "close":
+            return
+
+def serve(setup, address=DEFAULT_ADDRESS, authkey=None, dispatch=True,
+        **init_options):
+    '''Wait for the client's shim to connect, call setup() to create the
+    Tasks and serve the client until it disconnects.'''
+    import mush
+    _check_authkey(authkey)
+    listener = Listener(address, authkey=authkey)
+    try:
+        conn = listener.accept()
+    finally:
+        listener.close()
+    world = RemoteWorld(conn)
+    ax = RemoteAx(world)
+    out, err = sys.stdout, sys.stderr
+    try:
+        mush.init(ax, dispatch=dispatch, buffered=True, **init_options)
+        setup()
+        sys.stdout.flush()
+        world.flush()
+        run(world, ax._scriptEngine_.globalNameSpaceModule)
+    finally:
+        sys.stdout, sys.stderr = out, err
+        conn.close()
+
+def _address(text):
+    host, _, port = text.rpartition(":")
+    return (host or "localhost", int(port))
+
+def _module_setup(name):
+    import importlib
+    def setup():
+        from mush.bench import load_tasks
+        module = importlib.import_module(name)
+        if hasattr(module, "setup"):
+            module.setup()
+            return
+        # kept referenced, the triggers only hold weak references
+        module._remote_tasks = load_tasks(name)
+        for task in module._remote_tasks:
+            task.enable_all()
+    return setup
+
+def replay(lines, address=DEFAULT_ADDRESS, authkey=None):
+    '''Fake client: feed lines to the worker at address through a shim on
+    the simulated world. Returns the simulated World.'''
+    import mush
+    import mush.sim
+    _check_authkey(authkey)
+    ax = mush.sim.make_ax()
+    out, err = sys.stdout, sys.stderr
+    try:
+        mush.init(ax, remote=address, authkey=authkey)
+        # not this module's get_shim() when run with python -m
+        shim = sys.modules["mush.remote"].get_shim()
+        shim.sync()
+        for line in lines:
+            ax.sim.receive(line)
+            ax.sim.poll_timers()
+        shim.sync()
+        shim.close()
+    finally:
+        sys.stdout, sys.stderr = out, err
+    return ax.sim
+
+def main(argv=None):
+    import argparse
+    from mush.bench import read_logs
+
+    parser = argparse.ArgumentParser(prog="python -m mush.remote",
+            description="Out of process Task runtime.")
+    parser.add_argument("--address", type=_address, default=DEFAULT_ADDRESS,
+            help="HOST:PORT (default: localhost:6520)")
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="run a worker")
+    serve_parser.add_argument("module", help="module defining the Tasks")
+    serve_parser.add_argument("--no-dispatch", action="store_true",
+            help="use client triggers rather than the dispatcher")
+    replay_parser = commands.add_parser("replay",
+            help="feed session logs to a worker from a fake client")
+    replay_parser.add_argument("logs", nargs="+", help="session logs")
+    args = parser.parse_args(argv)
+    authkey = os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        parser.error("set {0} to the secret shared by the client and the "
+                "worker".format(AUTHKEY_ENV))
+
+    if args.command == "serve":
+        serve(_module_setup(args.module), args.address, authkey,
+                dispatch=not args.no_dispatch)
+        return
+    lines = read_logs(args.logs)
+    start = time.time()
+    sim = replay(lines, args.address, authkey)
+    elapsed = time.time() - start
+    sys.stdout.write("{0} lines in {1:.3f}s\n".format(len(lines), elapsed))
+    for command in sim.sent:
+        sys.stdout.write("sent: {0}\n".format(command))
+    for title, text in sorted(sim.notepads.iteritems()):
+        sys.stdout.write("notepad {0}:\n{1}\n".format(title, text))
+
+if __name__ == "__main__":
+    main()
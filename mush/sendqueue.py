@@ -0,0 +1,129 @@
+'''Rate limited queue for the commands sent to the MUD.
+
+Once installed, send() queues the commands instead of sending them right
+away. They leave the queue at most rate per second, with bursts of up to
+burst commands, higher priority first. The commands sent at once are
+joined into a single world.Send call. With dedupe=True, a command already
+waiting in the queue is not queued again.
+
+    >>> install_send_queue(rate=5, burst=10)
+    >>> for item in items:
+    >>>     send("get " + item)
+    >>> send("flee", priority=10)   # goes before the loot
+    >>> send("score", dedupe=True)  # once, however often asked for
+
+A Task can wait for its commands to leave the queue with Task.wait_sent().
+'''
+
+__all__ = ["SendQueue", "install_send_queue", "get_send_queue"]
+
+import time
+import heapq
+from greenlet import getcurrent
+
+from timer import call_every
+
+class SendQueue(object):
+    def __init__(self, rate=10.0, burst=20, interval=0.1):
+        self.rate = float(rate) # commands per second
+        self.burst = burst      # maximum commands sent at once
+        self.interval = interval    # seconds between two drains
+        self._tokens = float(burst)
+        self._last = time.time()
+        self._heap = []     # (-priority, seq, command, owner)
+        self._seq = 0
+        self._queued = {}   # command : number of times in the queue
+        self._pending = {}  # owner : number of commands in the queue
+        self._on_sent = {}  # owner : callbacks waiting for them
+        self._timer = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def put(self, what, priority=0, dedupe=False):
+        '''Queue commands (one per line of what) and send what the rate
+        allows right away. With dedupe, the commands already waiting are
+        skipped. Returns the number of commands queued.'''
+        owner = getcurrent()
+        queued = 0
+        for command in what.split("\n"):
+            if dedupe and command in self._queued:
+                continue
+            self._seq += 1
+            heapq.heappush(self._heap, (-priority, self._seq, command, owner))
+            self._queued[command] = self._queued.get(command, 0) + 1
+            self._pending[owner] = self._pending.get(owner, 0) + 1
+            queued += 1
+        self._send()
+        self._schedule()
+        return queued
+
+    def pending(self, owner):
+        '''Number of commands queued by owner (a greenlet) not sent yet'''
+        return self._pending.get(owner, 0)
+
+    def on_sent(self, owner, callback):
+        '''Call callback(True) once all the commands of owner are sent'''
+        if not self.pending(owner):
+            callback(True)
+        else:
+            self._on_sent.setdefault(owner, []).append(callback)
+
+    def _refill(self):
+        now = time.time()
+        self._tokens = min(float(self.burst),
+                self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def drain(self):
+        '''Timer callback: send what the rate allows and tell the waiting
+        tasks whose commands are all sent'''
+        self._send()
+        self._notify()
+        self._schedule()
+
+    def _send(self):
+        '''Send as many queued commands as the rate allows, in one call'''
+        self._refill()
+        batch = []
+        while self._heap and self._tokens >= 1:
+            priority, seq, command, owner = heapq.heappop(self._heap)
+            self._tokens -= 1
+            batch.append(command)
+            self._queued[command] -= 1
+            if not self._queued[command]:
+                del self._queued[command]
+            self._pending[owner] -= 1
+            if not self._pending[owner] and owner not in self._on_sent:
+                del self._pending[owner]
+        if batch:
+            world.Send("\n".join(batch))
+
+    def _notify(self):
+        # Resuming tasks is left to the timer, which runs on the main
+        # greenlet, so put() never switches to another task.
+        for owner in [o for o, n in self._pending.iteritems() if not n]:
+            del self._pending[owner]
+            for callback in self._on_sent.pop(owner, ()):
+                callback(True)
+
+    def _schedule(self):
+        needed = self._heap or self._on_sent
+        if needed and self._timer is None:
+            self._timer = call_every(self.interval, self.drain)
+        elif not needed and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+_queue = None
+
+def install_send_queue(rate=10.0, burst=20, interval=0.1):
+    '''Route send() through a SendQueue'''
+    global _queue
+    if _queue is None:
+        _queue = SendQueue(rate, burst, interval)
+    return _queue
+
+def get_send_queue():
+    '''Return the installed SendQueue or None.'''
+    return _queue
@@ -0,0 +1,561 @@
+'''In-process stand-in for MUSHclient's world object.
+
+It implements the world calls used by this package, with the client's
+return codes, and matches incoming lines against its triggers like the
+client does: in sequence order, calling the trigger's script function from
+the script namespace, and stopping at the first match that doesn't keep
+evaluating. Every world call is counted.
+
+    >>> import mush, mush.sim
+    >>> ax = mush.sim.make_ax()
+    >>> mush.init(ax)
+    >>> ...
+    >>> ax.sim.receive("Bob tells you 'hi'")
+    >>> ax.sim.calls["settriggeroption"]
+
+Method names are case insensitive, as through COM.
+'''
+
+import re
+import sys
+import time
+import traceback
+from collections import defaultdict
+
+from consts import *
+
+_name_re = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+def _glob_to_regex(match):
+    '''Regex of a non regular expression trigger, "*" being a wildcard'''
+    return "^" + "(.*?)".join(re.escape(part) for part in match.split("*")) + "$"
+
+def _yes(value):
+    if isinstance(value, basestring):
+        return value.lower() in ("y", "1", "true")
+    return bool(value)
+
+class _SimTrigger(object):
+    # SetTriggerOption name : GetTriggerInfo code
+    info_codes = {
+        "match" : 1, "send" : 2, "sound" : 3, "script" : 4,
+        "omit_from_log" : 5, "omit_from_output" : 6, "keep_evaluating" : 7,
+        "enabled" : 8, "regexp" : 9, "ignore_case" : 10, "repeat" : 11,
+        "sound_if_inactive" : 12, "expand_variables" : 13, "send_to" : 15,
+        "sequence" : 16, "group" : 26, "variable" : 27, "one_shot" : 36,
+    }
+    boolean_opts = set(["enabled", "expand_variables", "ignore_case",
+        "inverse", "italic", "keep_evaluating", "lowercase_wildcard",
+        "multi_line", "omit_from_log", "omit_from_output", "one_shot",
+        "regexp", "repeat", "sound_if_inactive"])
+    int_opts = {
+        "clipboard_arg" : (0, 10), "colour_change_type" : (0, 2),
+        "custom_colour" : (0, 17), "lines_to_match" : (0, 200),
+        "match_style" : (0, 0xFFFF), "new_style" : (0, 7),
+        "send_to" : (0, 14), "sequence" : (0, 10000),
+        "user" : (-2147483647, 2147483647),
+    }
+    string_opts = set(["group", "match", "name", "other_back_colour",
+        "other_text_colour", "script", "send", "sound", "variable"])
+
+    def __init__(self, name, match, send, flags, script):
+        self.opts = {
+            "name" : name, "match" : match, "send" : send, "script" : script,
+            "enabled" : bool(flags & TriggerFlags.eEnabled),
+            "omit_from_log" : bool(flags & TriggerFlags.eOmitFromLog),
+            "omit_from_output" : bool(flags & TriggerFlags.eOmitFromOutput),
+            "keep_evaluating" : bool(flags & TriggerFlags.eKeepEvaluating),
+            "ignore_case" : bool(flags & TriggerFlags.eIgnoreCase),
+            "regexp" : bool(flags & TriggerFlags.eTriggerRegularExpression),
+            "expand_variables" : bool(flags & TriggerFlags.eExpandVariables),
+            "lowercase_wildcard" : bool(flags & TriggerFlags.eLowercaseWildcard),
+            "temporary" : bool(flags & TriggerFlags.eTemporary),
+            "group" : "", "sequence" : 100, "send_to" : 0, "variable" : "",
+            "one_shot" : False, "repeat" : False, "sound" : "",
+            "sound_if_inactive" : False, "multi_line" : False,
+            "lines_to_match" : 0, "user" : 0,
+        }
+        self.invocations = 0
+        self.matched = 0
+        self.last_matched = None
+        self.executing = False
+        self.compile()
+
+    def compile(self):
+        match = self.opts["match"]
+        if not self.opts["regexp"]:
+            match = _glob_to_regex(match)
+        self.regex = re.compile(match,
+                re.IGNORECASE if self.opts["ignore_case"] else 0)
+
+    def set(self, key, value):
+        if key in self.boolean_opts:
+            value = _yes(value)
+        elif key in self.int_opts:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                return ErrorNo.eOptionOutOfRange
+            low, high = self.int_opts[key]
+            if not low <= value <= high:
+                return ErrorNo.eOptionOutOfRange
+        elif key not in self.string_opts:
+            return ErrorNo.eUnknownOption
+        old = self.opts.get(key)
+        self.opts[key] = value
+        if key in ("match", "regexp", "ignore_case"):
+            try:
+                self.compile()
+            except re.error:
+                self.opts[key] = old
+                self.compile()
+                return ErrorNo.eBadRegularExpression
+        return ErrorNo.eOK
+
+    def info(self, code):
+        if code == 20:
+            return self.invocations
+        if code == 21:
+            return self.matched
+        if code == 22:
+            return self.last_matched
+        if code == 33:
+            return self.executing
+        if code == 34:
+            return True
+        for key, c in self.info_codes.iteritems():
+            if c == code:
+                return self.opts[key]
+        return None
+
+class _SimAlias(object):
+    def __init__(self, name, match, send, flags, script):
+        self.name = name
+        self.match = match
+        self.send = send
+        self.script = script
+        self.enabled = bool(flags & AliasFlags.eEnabled)
+        self.regexp = bool(flags & AliasFlags.eAliasRegularExpression)
+        self.group = ""
+        self.sequence = 100
+        self.keep_evaluating = False
+        self.matched = 0
+        self.regex = re.compile(match if self.regexp else _glob_to_regex(match),
+                re.IGNORECASE if flags & AliasFlags.eIgnoreAliasCase else 0)
+
+class _SimTimer(object):
+    def __init__(self, name, interval, flags, script):
+        self.name = name
+        self.interval = interval
+        self.flags = flags
+        self.script = script
+        self.enabled = bool(flags & TimerFlags.eEnabled)
+        self.due = time.time() + interval
+
+class World(object):
+    '''The simulated client. Use it through make_ax(), whose world object
+    counts the calls and resolves method names case insensitively.'''
+
+    def __init__(self, namespace):
+        self.namespace = namespace  # where script functions are looked up
+        self.triggers = {}
+        self.timers = {}
+        self.aliases = {}
+        self.variables = {}
+        self.arrays = {}    # name : {key : value}
+        self.notepads = {}
+        self.output = []    # world.note() and friends
+        self.sent = []      # world.send()
+        self.calls = defaultdict(int)   # lower case method : count
+        self.script_times = []  # seconds taken by each script call
+        self.script_errors = 0
+        self.evaluations = 0    # trigger regex searches
+        self._sorted = None # triggers in evaluation order
+
+    # -- script side ---------------------------------------------------
+
+    def Note(self, text):
+        self.output.append(text)
+
+    def Send(self, text):
+        self.sent.extend(text.split("\n"))
+        return ErrorNo.eOK
+
+    def AddTrigger(self, name, match, send, flags, colour, wildcard,
+            sound, script):
+        if not _name_re.match(name):
+            return ErrorNo.eInvalidObjectLabel
+        if not match:
+            return ErrorNo.eTriggerCannotBeEmpty
+        if name in self.triggers and not flags & TriggerFlags.eReplace:
+            return ErrorNo.eTriggerAlreadyExists
+        if script and not callable(getattr(self.namespace, script, None)):
+            return ErrorNo.eScriptNameNotLocated
+        try:
+            trig = _SimTrigger(name, match, send, flags, script)
+        except re.error:
+            return ErrorNo.eBadRegularExpression
+        self.triggers[name] = trig
+        self._sorted = None
+        return ErrorNo.eOK
+
+    def DeleteTrigger(self, name):
+        trig = self.triggers.get(name)
+        if trig is None:
+            return ErrorNo.eTriggerNotFound
+        if trig.executing:
+            return ErrorNo.eItemInUse
+        del self.triggers[name]
+        self._sorted = None
+        return ErrorNo.eOK
+
+    def IsTrigger(self, name):
+        if name in self.triggers:
+            return ErrorNo.eOK
+        return ErrorNo.eTriggerNotFound
+
+    def GetTriggerList(self):
+        # the client returns None rather than an empty array
+        return tuple(self.triggers) or None
+
+    def GetTriggerInfo(self, name, code):
+        trig = self.triggers.get(name)
+        if trig is None:
+            return None
+        return trig.info(code)
+
+    def SetTriggerOption(self, name, key, value):
+        trig = self.triggers.get(name)
+        if trig is None:
+            return ErrorNo.eTriggerNotFound
+        res = trig.set(key, value)
+        if key == "sequence":
+            self._sorted = None
+        return res
+
+    def EnableTriggerGroup(self, group, on):
+        count = 0
+        for trig in self.triggers.itervalues():
+            if trig.opts["group"] == group:
+                trig.opts["enabled"] = bool(on)
+                count += 1
+        return count
+
+    def AddAlias(self, name, match, send, flags, script):
+        if not _name_re.match(name):
+            return ErrorNo.eInvalidObjectLabel
+        if not match:
+            return ErrorNo.eAliasCannotBeEmpty
+        if name in self.aliases and not flags & AliasFlags.eReplace:
+            return ErrorNo.eAliasAlreadyExists
+        if script and not callable(getattr(self.namespace, script, None)):
+            return ErrorNo.eScriptNameNotLocated
+        try:
+            self.aliases[name] = _SimAlias(name, match, send, flags, script)
+        except re.error:
+            return ErrorNo.eBadRegularExpression
+        return ErrorNo.eOK
+
+    def DeleteAlias(self, name):
+        if self.aliases.pop(name, None) is None:
+            return ErrorNo.eAliasNotFound
+        return ErrorNo.eOK
+
+    def IsAlias(self, name):
+        if name in self.aliases:
+            return ErrorNo.eOK
+        return ErrorNo.eAliasNotFound
+
+    def EnableAlias(self, name, on):
+        alias = self.aliases.get(name)
+        if alias is None:
+            return ErrorNo.eAliasNotFound
+        alias.enabled = bool(on)
+        return ErrorNo.eOK
+
+    def SetAliasOption(self, name, key, value):
+        alias = self.aliases.get(name)
+        if alias is None:
+            return ErrorNo.eAliasNotFound
+        if key in ("enabled", "keep_evaluating"):
+            setattr(alias, key, _yes(value))
+        elif key == "sequence":
+            alias.sequence = int(value)
+        elif key == "group":
+            alias.group = value
+        else:
+            return ErrorNo.eUnknownOption
+        return ErrorNo.eOK
+
+    def GetAliasList(self):
+        return tuple(self.aliases) or None
+
+    def AddTimer(self, name, hour, minute, second, send, flags, script):
+        if not _name_re.match(name):
+            return ErrorNo.eInvalidObjectLabel
+        if name in self.timers and not flags & TimerFlags.eReplace:
+            return ErrorNo.eTimerAlreadyExists
+        if script and not callable(getattr(self.namespace, script, None)):
+            return ErrorNo.eScriptNameNotLocated
+        interval = hour * 3600 + minute * 60 + second
+        if interval <= 0:
+            return ErrorNo.eTimeInvalid
+        self.timers[name] = _SimTimer(name, interval, flags, script)
+        return ErrorNo.eOK
+
+    def DeleteTimer(self, name):
+        if self.timers.pop(name, None) is None:
+            return ErrorNo.eTimerNotFound
+        return ErrorNo.eOK
+
+    def IsTimer(self, name):
+        if name in self.timers:
+            return ErrorNo.eOK
+        return ErrorNo.eTimerNotFound
+
+    def EnableTimer(self, name, on):
+        timer = self.timers.get(name)
+        if timer is None:
+            return ErrorNo.eTimerNotFound
+        if on and not timer.enabled:
+            timer.due = time.time() + timer.interval
+        timer.enabled = bool(on)
+        return ErrorNo.eOK
+
+    def GetVariable(self, name):
+        return self.variables.get(name)
+
+    def SetVariable(self, name, value):
+        self.variables[name] = unicode(value)
+        return ErrorNo.eOK
+
+    def DeleteVariable(self, name):
+        if self.variables.pop(name, None) is None:
+            return ErrorNo.eVariableNotFound
+        return ErrorNo.eOK
+
+    def GetVariableList(self):
+        return tuple(self.variables) or None
+
+    def ArrayCreate(self, name):
+        if name in self.arrays:
+            return ErrorNo.eArrayAlreadyExists
+        self.arrays[name] = {}
+        return ErrorNo.eOK
+
+    def ArrayDelete(self, name):
+        if self.arrays.pop(name, None) is None:
+            return ErrorNo.eArrayDoesNotExist
+        return ErrorNo.eOK
+
+    def ArrayExists(self, name):
+        return name in self.arrays
+
+    def ArrayClear(self, name):
+        if name not in self.arrays:
+            return ErrorNo.eArrayDoesNotExist
+        self.arrays[name].clear()
+        return ErrorNo.eOK
+
+    def ArraySize(self, name):
+        return len(self.arrays.get(name, ()))
+
+    def ArrayGet(self, name, key):
+        return self.arrays.get(name, {}).get(key)
+
+    def ArraySet(self, name, key, value):
+        array = self.arrays.get(name)
+        if array is None:
+            return ErrorNo.eArrayDoesNotExist
+        replaced = key in array
+        array[key] = unicode(value)
+        return ErrorNo.eSetReplacingExistingValue if replaced else ErrorNo.eOK
+
+    def ArrayDeleteKey(self, name, key):
+        array = self.arrays.get(name)
+        if array is None:
+            return ErrorNo.eArrayDoesNotExist
+        if array.pop(key, None) is None:
+            return ErrorNo.eKeyDoesNotExist
+        return ErrorNo.eOK
+
+    def ArrayImport(self, name, values, delimiter):
+        if len(delimiter) != 1 or delimiter == "\\":
+            return ErrorNo.eBadDelimiter
+        array = self.arrays.get(name)
+        if array is None:
+            return ErrorNo.eArrayDoesNotExist
+        # the delimiter and backslashes are escaped with a backslash
+        items, item, escaped = [], [], False
+        for char in values:
+            if escaped:
+                item.append(char)
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == delimiter:
+                items.append("".join(item))
+                item = []
+            else:
+                item.append(char)
+        if values:
+            items.append("".join(item))
+        if len(items) % 2:
+            return ErrorNo.eArrayNotEvenNumberOfValues
+        duplicates = False
+        for i in range(0, len(items), 2):
+            duplicates = duplicates or items[i] in array
+            array[items[i]] = items[i + 1]
+        return ErrorNo.eImportedWithDuplicates if duplicates else ErrorNo.eOK
+
+    def ArrayExport(self, name, delimiter):
+        if len(delimiter) != 1 or delimiter == "\\":
+            return ErrorNo.eBadDelimiter
+        array = self.arrays.get(name)
+        if array is None:
+            return ErrorNo.eArrayDoesNotExist
+        escape = lambda text: text.replace("\\", "\\\\").replace(delimiter,
+                "\\" + delimiter)
+        return delimiter.join(escape(key) + delimiter + escape(array[key])
+                for key in sorted(array))
+
+    def AppendToNotepad(self, title, text):
+        self.notepads[title] = self.notepads.get(title, "") + text
+        return True
+
+    def ReplaceNotepad(self, title, text):
+        self.notepads[title] = text
+        return True
+
+    def GetNotepadText(self, title):
+        return self.notepads.get(title, "")
+
+    def NotepadSaveMethod(self, title, method):
+        return title in self.notepads
+
+    def NotepadReadOnly(self, title, readonly):
+        return title in self.notepads
+
+    # -- client side ---------------------------------------------------
+
+    def _call_script(self, script, *args):
+        func = getattr(self.namespace, script, None)
+        if func is None:
+            return
+        start = time.time()
+        try:
+            func(*args)
+        except Exception:
+            self.script_errors += 1
+            traceback.print_exc(file=sys.__stderr__)
+        self.script_times.append(time.time() - start)
+
+    def receive(self, line):
+        '''Process a line coming from the MUD, as the client does'''
+        if self._sorted is None:
+            self._sorted = sorted(self.triggers.itervalues(),
+                    key=lambda t: (t.opts["sequence"], t.opts["name"]))
+        for trig in self._sorted:
+            if (not trig.opts["enabled"] or
+                    self.triggers.get(trig.opts["name"]) is not trig):
+                continue
+            self.evaluations += 1
+            m = trig.regex.search(line)
+            if m is None:
+                continue
+            trig.matched += 1
+            trig.last_matched = time.time()
+            if trig.opts["script"]:
+                wildcards = [g if g is not None else ""
+                        for g in m.groups()[:9]]
+                wildcards.extend([""] * (9 - len(wildcards)))
+                wildcards.append(line)
+                trig.invocations += 1
+                trig.executing = True
+                try:
+                    self._call_script(trig.opts["script"], trig.opts["name"],
+                            line, tuple(wildcards))
+                finally:
+                    trig.executing = False
+            if trig.opts["one_shot"]:
+                self.triggers.pop(trig.opts["name"], None)
+                self._sorted = None
+            if not trig.opts["keep_evaluating"]:
+                break
+
+    def command(self, text):
+        '''Process a command typed by the user: run the matching aliases,
+        or send it to the MUD if none matches'''
+        matched = False
+        for alias in sorted(self.aliases.values(),
+                key=lambda a: (a.sequence, a.name)):
+            if not alias.enabled:
+                continue
+            m = alias.regex.search(text)
+            if m is None:
+                continue
+            matched = True
+            alias.matched += 1
+            if alias.send:
+                self.Send(alias.send)
+            if alias.script:
+                wildcards = [g if g is not None else ""
+                        for g in m.groups()[:9]]
+                wildcards.extend([""] * (9 - len(wildcards)))
+                wildcards.append(text)
+                self._call_script(alias.script, alias.name, text,
+                        tuple(wildcards))
+            if not alias.keep_evaluating:
+                break
+        if not matched:
+            self.Send(text)
+
+    def poll_timers(self, now=None):
+        '''Fire the enabled timers which are due'''
+        if now is None:
+            now = time.time()
+        for timer in list(self.timers.itervalues()):
+            if not timer.enabled or timer.due > now:
+                continue
+            timer.due = now + timer.interval
+            if timer.flags & TimerFlags.eOneShot:
+                del self.timers[timer.name]
+            if timer.script:
+                self._call_script(timer.script, timer.name)
+
+class _Com(object):
+    '''Counting, case insensitive view of a World, as seen by scripts'''
+
+    def __init__(self, sim):
+        self.__dict__["_sim"] = sim
+        self.__dict__["_methods"] = dict((name.lower(), name)
+                for name in dir(sim) if name[0].isupper())
+
+    def __getattr__(self, name):
+        key = name.lower()
+        method = getattr(self._sim, self._methods[key])
+        calls = self._sim.calls
+        def call(*args):
+            calls[key] += 1
+            return method(*args)
+        return call
+
+class _Namespace(object):
+    pass
+
+class _ScriptEngine(object):
+    def __init__(self):
+        self.globalNameSpaceModule = _Namespace()
+
+class Ax(object):
+    '''Stand-in of the "ax" object given to mush.init()'''
+
+    def __init__(self):
+        self._scriptEngine_ = _ScriptEngine()
+        namespace = self._scriptEngine_.globalNameSpaceModule
+        self.sim = World(namespace)
+        namespace.world = _Com(self.sim)
+
+def make_ax():
+    '''Return a new simulated "ax" object; its World is ax.sim'''
+    return Ax()
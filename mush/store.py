@@ -0,0 +1,218 @@
+'''Cached world variables and arrays, written back in bulk.
+
+Each world variable or array call is a COM call. A Store is a dict kept in
+Python: reading and writing it costs no call. Changed keys are written
+back at flush() in one ArrayImport call into the client array of the same
+name, which is then saved into a world variable, so that it persists with
+the world:
+
+    >>> kills = get_store("kills")
+    >>> kills["orc"] = int(kills.get("orc", 0)) + 1   # no client call
+    >>> kills.flush()   # ArrayImport, ArrayExport and SetVariable
+
+A store is loaded from its variable when created, and flushed
+flush_interval seconds after it is first changed, if not flushed before.
+Values are converted to strings, or with codec.dumps()/codec.loads() if
+given, e.g. codec=json.
+
+Variables does the same for plain world variables, written back one call
+per changed variable.
+'''
+
+__all__ = ["Store", "Variables", "get_store", "get_variables", "flush_all"]
+
+from collections import MutableMapping
+
+from consts import *
+from timer import call_later
+
+class StoreOpError(Exception): pass
+
+def _escape(text, delimiter):
+    return text.replace("\\", "\\\\").replace(delimiter, "\\" + delimiter)
+
+def _split(text, delimiter):
+    '''Split text exported by ArrayExport()'''
+    items, item, escaped = [], [], False
+    for char in text:
+        if escaped:
+            item.append(char)
+            escaped = False
+        elif char == "\\":
+            escaped = True
+        elif char == delimiter:
+            items.append("".join(item))
+            item = []
+        else:
+            item.append(char)
+    items.append("".join(item))
+    return items
+
+class _Cached(MutableMapping):
+    '''Dict cache tracking the changed and deleted keys'''
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._data = {}
+        self._dirty = set()
+        self._deleted = set()
+        self._timer = None
+
+    def _changed(self):
+        if self._timer is None and self.flush_interval:
+            self._timer = call_later(self.flush_interval, self.flush)
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        if not isinstance(key, basestring):
+            raise TypeError("Keys must be strings: {0!r}".format(key))
+        self._data[key] = value
+        self._dirty.add(key)
+        self._deleted.discard(key)
+        self._changed()
+
+    def __delitem__(self, key):
+        del self._data[key]
+        self._dirty.discard(key)
+        self._deleted.add(key)
+        self._changed()
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def dirty(self):
+        return bool(self._dirty or self._deleted)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.dirty:
+            self._write()
+            self._dirty.clear()
+            self._deleted.clear()
+
+class Store(_Cached):
+    '''Dict mirrored by the client array name, saved in the world variable
+    "mushpy_" + name. delimiter is the one of ArrayImport/ArrayExport.'''
+
+    def __init__(self, name, delimiter="|", codec=None, flush_interval=5.0):
+        super(Store, self).__init__(flush_interval)
+        self.name = name
+        self.variable = "mushpy_" + name
+        self.delimiter = delimiter
+        self.codec = codec
+        self.load()
+
+    def _encode(self, value):
+        if self.codec is not None:
+            return self.codec.dumps(value)
+        return value if isinstance(value, basestring) else unicode(value)
+
+    def load(self):
+        '''Load the saved content, dropping unflushed changes'''
+        saved = world.GetVariable(self.variable) or ""
+        res = world.ArrayCreate(self.name)
+        if res == ErrorNo.eArrayAlreadyExists:
+            world.ArrayClear(self.name)
+        if saved:
+            res = world.ArrayImport(self.name, saved, self.delimiter)
+            if res not in (ErrorNo.eOK, ErrorNo.eImportedWithDuplicates):
+                raise StoreOpError("Array import failed: {0}".format(res))
+        items = _split(saved, self.delimiter) if saved else []
+        decode = self.codec.loads if self.codec is not None else None
+        self._data = dict((items[i], decode(items[i + 1]) if decode
+                else items[i + 1]) for i in range(0, len(items) - 1, 2))
+        self._dirty.clear()
+        self._deleted.clear()
+
+    def _write(self):
+        delimiter = self.delimiter
+        for key in self._deleted:
+            world.ArrayDeleteKey(self.name, key)
+        if self._dirty:
+            values = delimiter.join(_escape(key, delimiter) + delimiter +
+                    _escape(self._encode(self._data[key]), delimiter)
+                    for key in self._dirty)
+            res = world.ArrayImport(self.name, values, delimiter)
+            if res not in (ErrorNo.eOK, ErrorNo.eImportedWithDuplicates):
+                raise StoreOpError("Array import failed: {0}".format(res))
+        exported = world.ArrayExport(self.name, delimiter) if self._data \
+                else ""
+        if not isinstance(exported, basestring):
+            raise StoreOpError("Array export failed: {0}".format(exported))
+        world.SetVariable(self.variable, exported)
+
+class Variables(_Cached):
+    '''World variables, each read at most once and written back at flush.
+    Iterating lists the variables with a single call.'''
+
+    def __getitem__(self, key):
+        if key in self._data:
+            return self._data[key]
+        if key in self._deleted:
+            raise KeyError(key)
+        value = world.GetVariable(key)
+        if value is None:
+            raise KeyError(key)
+        self._data[key] = value
+        return value
+
+    def __delitem__(self, key):
+        self[key]   # KeyError if missing
+        super(Variables, self).__delitem__(key)
+
+    def _names(self):
+        names = set(world.GetVariableList() or ())
+        return (names | set(self._data)) - self._deleted
+
+    def __iter__(self):
+        return iter(self._names())
+
+    def __len__(self):
+        return len(self._names())
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def _write(self):
+        for key in self._deleted:
+            world.DeleteVariable(key)
+        for key in self._dirty:
+            value = self._data[key]
+            world.SetVariable(key, value if isinstance(value, basestring)
+                    else unicode(value))
+
+_stores = {}
+_variables = None
+
+def get_store(name, **options):
+    '''Return the Store of that name, created with options the first time'''
+    store = _stores.get(name)
+    if store is None:
+        store = _stores[name] = Store(name, **options)
+    return store
+
+def get_variables(flush_interval=5.0):
+    '''Return the Variables cache'''
+    global _variables
+    if _variables is None:
+        _variables = Variables(flush_interval)
+    return _variables
+
+def flush_all():
+    '''Write back the changes of all the stores and of the variables'''
+    for store in _stores.itervalues():
+        store.flush()
+    if _variables is not None:
+        _variables.flush()
@@ -1,7 +1,20 @@
 from greenlet import greenlet, getcurrent
 from trigger import *
 from common import *
+from dispatch import get_dispatcher
+from timer import call_later, cancel_owner
+from sendqueue import get_send_queue
+from alias import install_alias_dispatcher, AliasOpError
+from workers import install_offloader, get_offloader
+from wildcards import Wildcards
+import instrument
 from types import MethodType
+from functools import wraps
+import itertools
+import re
+import sys
+import traceback
+import weakref
 
 def _get_main_greenlet():
     current = getcurrent()
@@ -10,27 +23,355 @@ def _get_main_greenlet():
     return current
 main = _get_main_greenlet()
 
+class _Waiter(object):
+    __slots__ = ("task", "names", "timer", "done")
+
+    def __init__(self, task):
+        self.task = task
+        self.names = []     # dispatcher entries of the patterns
+        self.timer = None
+        self.done = False
+
+class _Scheduler(object):
+    '''Tasks suspended in Task.expect() or Task.sleep().
+
+    The patterns waited for are entries of the dispatcher, so matching them
+    costs no client trigger. Deadlines are timers of mush.timer.
+    '''
+
+    def __init__(self):
+        self._waiters = {} # task : waiter
+        self._seq = 0
+
+    def wait(self, task, patterns, timeout, arm=None):
+        '''Suspend the task until a pattern matches or timeout expires.
+
+        Returns (index of the pattern, wildcards), or None on timeout. If
+        given, arm(resume) is called before suspending, resume(value) then
+        resumes the task with value.
+        '''
+        if getcurrent() is not task:
+            raise RuntimeError("A task can only wait from its own greenlet")
+        dispatcher = get_dispatcher()
+        if patterns and dispatcher is None:
+            raise RuntimeError("Waiting for lines needs the dispatcher, "
+                    "see mush.init(ax, dispatch=True)")
+
+        waiter = _Waiter(task)
+        self._seq += 1
+        for i, pattern in enumerate(patterns):
+            name = "w__{0}__{1}".format(self._seq, i)
+            dispatcher.add(name, pattern, self._on_match(waiter, i),
+                    enabled=True)
+            waiter.names.append(name)
+        if timeout is not None:
+            waiter.timer = call_later(timeout, self._resume, (waiter, None),
+                    owner=task)
+        if arm is not None:
+            arm(lambda value: self._resume(waiter, value))
+        self._waiters[task] = waiter
+        return main.switch()
+
+    def _on_match(self, waiter, index):
+        def callback(name, line, wc):
+            self._resume(waiter, (index, wc))
+        return callback
+
+    def _finish(self, waiter):
+        waiter.done = True
+        del self._waiters[waiter.task]
+        if waiter.timer is not None:
+            waiter.timer.cancel()
+        dispatcher = get_dispatcher()
+        for name in waiter.names:
+            dispatcher.remove(name)
+
+    def _resume(self, waiter, value):
+        if waiter.done:
+            return
+        self._finish(waiter)
+        waiter.task.switch(value)
+
+    def cancel(self, task):
+        '''Forget a waiting task without resuming it'''
+        waiter = self._waiters.get(task)
+        if waiter is not None:
+            self._finish(waiter)
+
+_scheduler = _Scheduler()
+
+def _class_label(cls):
+    '''Module and name of a Task class, made of the characters a trigger
+    name allows'''
+    return re.sub(r"\W", "_", "{0}__{1}".format(cls.__module__, cls.__name__))
+
+# registered shared triggers and aliases by name, see register()
+_registered = {}
+
+class _SharedTrigger(object):
+    '''One trigger shared by all the instances of a Task class.
+
+    The trigger (a client trigger, or a dispatcher entry if the dispatcher
+    is installed) is created the first time an instance enables the handler,
+    and is only enabled while some instance has the handler enabled. A match
+    is fanned out to these instances, which are weakly referenced, calling
+    the handler function directly (no bound method is made per call).
+
+    Multi-line handlers (block options set) can only be dispatcher entries.
+    '''
+
+    def __init__(self, cls, func, pattern, block=None, order=None):
+        self.func = func
+        # the undecorated handler, see _handler()
+        self.handler = getattr(cls, func).im_func.handler
+        self.pattern = pattern
+        self.block = block
+        self.order = order or {}    # priority and exclusive
+        self.group = "g__{0}".format(_class_label(cls))
+        self.name = "{0}__{1}".format(self.group, func)
+        self.listeners = weakref.WeakKeyDictionary() # task : serial
+        self._tasks = None  # weak references to the listeners, in order
+        self.enabled = False
+        self.registered = False
+        self.dispatcher = None
+
+    def register(self):
+        if self.registered:
+            return
+        if self.name in _registered:
+            # e.g. classes made by a factory, the trigger would be taken over
+            raise TriggerOpError("Trigger {0} is already used by another "
+                    "Task class of the same module and name".format(
+                        self.name))
+        self.dispatcher = get_dispatcher()
+        if self.dispatcher is not None:
+            options = dict(self.order, **(self.block or {}))
+            self.dispatcher.add(self.name, self.pattern, self.fire,
+                    group=self.group, **options)
+        elif self.block:
+            raise TriggerOpError("Multi-line trigger {0} needs the "
+                    "dispatcher".format(self.name))
+        else:
+            expose(self.fire, self.name)
+            add_trigger(name=self.name, pattern=self.pattern,
+                    script=self.name, group=self.group)
+            self._set_order()
+        _registered[self.name] = self
+        self.registered = True
+
+    def _set_order(self):
+        trig = get_trigger(self.name)
+        trig.keep_evaluating = not self.order.get("exclusive", False)
+        priority = self.order.get("priority")
+        trig.sequence = 100 if priority is None else priority
+
+    def adopt(self):
+        '''Take over the disabled client trigger of a previous load'''
+        expose(self.fire, self.name)
+        self.dispatcher = None
+        self.registered = True
+        self.enabled = False
+        self._set_order()
+
+    def set_enabled(self, on):
+        self.register()
+        if self.dispatcher is not None:
+            self.dispatcher.set_enabled(self.name, on)
+        else:
+            set_trig_onoff(self.name, on)
+        self.enabled = on
+
+    def listen(self, task, on):
+        '''Add or remove a listening task.
+
+        Returns whether the trigger has to be switched to on.
+        '''
+        if on:
+            self.listeners[task] = task._serial
+        else:
+            self.listeners.pop(task, None)
+        self._tasks = None
+        return bool(self.listeners) != self.enabled
+
+    def fire(self, name, line, wc):
+        '''Script callback: run the handler of all the listening tasks'''
+        tasks = self._tasks
+        if tasks is None:
+            tasks = self._tasks = [weakref.ref(task) for task, serial in
+                    sorted(self.listeners.items(), key=lambda item: item[1])]
+        if not tasks:
+            # the listeners have been garbage collected
+            self.set_enabled(False)
+            return
+        if not isinstance(wc, Wildcards):
+            # from a client trigger
+            wc = Wildcards(line, values=wc, pattern=self.pattern)
+        handler = self.handler
+        profiler = instrument.handler_profiler
+        for ref in tasks:
+            task = ref()
+            if task is None:
+                self._tasks = None  # collected, gone from the listeners
+                continue
+            try:
+                if profiler is not None:
+                    profiler.call_handler(task, self.func,
+                            MethodType(handler, task, type(task)), wc)
+                else:
+                    handler(task, wc)
+            except Exception:
+                traceback.print_exc(file=sys.stderr)
+        if self.dispatcher is None:
+            # a script call of its own, the dispatcher flushes per line
+            sys.stdout.flush()
+
+class _SharedAlias(_SharedTrigger):
+    '''One alias shared by all the instances of a Task class, an entry of
+    the alias dispatcher (see mush.alias).'''
+
+    def register(self):
+        if self.registered:
+            return
+        if self.name in _registered:
+            raise AliasOpError("Alias {0} is already used by another "
+                    "Task class of the same module and name".format(
+                        self.name))
+        self.dispatcher = install_alias_dispatcher()
+        self.dispatcher.add(self.name, self.pattern, self.fire,
+                group=self.group)
+        _registered[self.name] = self
+        self.registered = True
+
+def _switch_shared(cls, shared, on):
+    '''Switch shared triggers of a class, with a single group call when
+    they are all the triggers of the class.'''
+    if not shared:
+        return
+    if len(shared) == len(cls._shared):
+        for trig in shared:
+            trig.register()
+        dispatcher = shared[0].dispatcher
+        if all(trig.dispatcher is dispatcher for trig in shared):
+            if dispatcher is not None:
+                dispatcher.set_group_enabled(shared[0].group, on)
+            else:
+                enable_trigger_group(shared[0].group, on)
+            for trig in shared:
+                trig.enabled = on
+            return
+    for trig in shared:
+        trig.set_enabled(on)
+
+def _collect_handlers(bases, attrs, attr):
+    '''{name: pattern} of the handlers marked with attr, inherited ones
+    included'''
+    handlers = {}
+    table = "_func2" + attr
+    for base in reversed(bases):
+        handlers.update(getattr(base, table, {}))
+    for key, value in attrs.iteritems():
+        try:
+            if callable(value) and attr in dir(value):
+                handlers[key] = getattr(value, attr)
+            else:
+                handlers.pop(key, None)
+        except AttributeError: # greenlet.run doesn't like dir() on it
+            pass
+    return handlers
+
+# Task classes by module and name, the last one defined, see
+# reconcile_triggers()
+_task_classes = {}
+# Task instances alive, see live_tasks()
+_live_tasks = weakref.WeakSet()
+
+def live_tasks():
+    '''The Task instances still referenced somewhere'''
+    return list(_live_tasks)
+
+_reconciled = False
+
+def reconcile_triggers():
+    '''Reuse the handler triggers left in the client by a previous load.
+
+    The client keeps the triggers when the script is reloaded. The ones
+    still matching a handler of a defined Task class are taken over (their
+    pattern updated if it changed) instead of being added again, the stale
+    ones are deleted, and the client's trigger list is fetched only once.
+    Triggers of classes defined later are created when first enabled as
+    usual.
+
+    Done when the first Task is created; call it again after defining more
+    Task classes to also reuse their triggers. The triggers already in use
+    are left alone.
+    '''
+    global _reconciled
+    _reconciled = True
+    shared = {}
+    in_use = {}
+    if get_dispatcher() is None:
+        # otherwise all the handler triggers are dispatcher entries
+        for cls in _task_classes.itervalues():
+            for trig in cls._shared.itervalues():
+                if type(trig) is not _SharedTrigger or trig.block:
+                    continue
+                if not trig.registered:
+                    shared[trig.name] = trig
+                elif trig.dispatcher is None:
+                    in_use[trig.name] = trig.group
+    desired = dict((name, (trig.pattern, name, trig.group))
+            for name, trig in shared.iteritems())
+    for name in sync_triggers(desired, "g__", in_use):
+        shared[name].adopt()
+
 class _RegTrigMetaClass(type):
     def __new__(cls, name, bases, attrs):
-        _func2pattern = {}
-        for key, value in attrs.iteritems():
-            try:
-                if callable(value) and "pattern" in dir(value):
-                    _func2pattern[key] = value.pattern
-            except AttributeError: # greenlet.run doesn't like dir() on it
-                pass
+        # handlers inherited from the bases, computed once here
+        _func2pattern = _collect_handlers(bases, attrs, "pattern")
+        _func2alias = _collect_handlers(bases, attrs, "alias")
+        _func2block = _collect_handlers(bases, attrs, "block")
+        _func2order = _collect_handlers(bases, attrs, "order")
         attrs["_func2pattern"] = _func2pattern
-        return super(RegTrigMetaClass, cls).__new__(cls, name, bases, attrs)
+        attrs["_func2alias"] = _func2alias
+        attrs["_func2block"] = _func2block
+        attrs["_func2order"] = _func2order
+        new_cls = super(_RegTrigMetaClass, cls).__new__(cls, name, bases, attrs)
+        new_cls._shared = dict((func, _SharedTrigger(new_cls, func, pattern,
+                    _func2block.get(func), _func2order.get(func)))
+                for func, pattern in _func2pattern.iteritems())
+        new_cls._shared.update((func, _SharedAlias(new_cls, func, pattern))
+                for func, pattern in _func2alias.iteritems())
+        _task_classes[_class_label(new_cls)] = new_cls
+        return new_cls
+
+def _handler(func):
+    # Note that here "func" is a function rather than method In order
+    # to reference it later when class instantiates, we have to
+    # identify it by the name.
+    @wraps(func)
+    def newfunc(self, trig_name, line, wc):
+        # Call the function with class instance "self", a bound method is
+        # only made for the profiler
+        profiler = instrument.handler_profiler
+        if profiler is not None:
+            return profiler.call_handler(self, func.__name__,
+                    MethodType(func, self, type(self)), wc)
+        return func(self, wc)
+    # what the shared triggers call, see _SharedTrigger.fire()
+    newfunc.handler = func
+    return newfunc
 
 class Task(greenlet):
     """Collection of triggers and a greenlet.
 
-    triggers are registered at instantiation. To define a trigger handler:
+    triggers are shared by the instances of a class. To define a trigger
+    handler:
 
         >>> @Task.trigger("pattern_regex")
         >>> def onPattern(self, wildcards):
-        >>>     # wildcards is a length 10 array holding the wildcards
-        >>>     # The 10-th one is the whole line
+        >>>     # wildcards indexes like a length 10 array holding the
+        >>>     # wildcards, the 10-th one is the whole line; named groups
+        >>>     # are items and attributes (see mush.wildcards)
         >>>     pass
 
     The coroutine should be defined in method "run" (refer to greenlet doc):
@@ -42,79 +383,186 @@ class Task(greenlet):
 
         >>> instance.switch(args)
 
+    Each handler of a class has one trigger, created when an instance first
+    enables it and fanning matches out to the instances having it enabled.
+    The on/off state of each handler is tracked per instance on the Python
+    side, so creating, switching and deleting instances only reaches the
+    client when a trigger has to be turned on or off. The triggers of a
+    class are in one trigger group, switched with a single call when
+    possible.
+
+    The triggers only hold weak references to the instances: keep a
+    reference to an enabled instance, as one that is garbage collected
+    stops getting matches. For example "MyTask().enable_all()" alone has
+    no lasting effect.
+
+    Triggers are named after the module and the name of their class. Of
+    Task classes sharing both (e.g. made by a factory), only the first one
+    to enable a handler can: TriggerOpError is raised for the others.
+
+    If the dispatcher is installed (see mush.dispatch) when a trigger is
+    created, it is a dispatcher entry instead of a client trigger.
+
+    Handlers matching several lines need the dispatcher:
+
+        >>> @Task.trigger("^Inventory:$", end="^$", lines=50)
+        >>> def onInventory(self, wildcards):
+        >>>     # wildcards[9] holds the lines from "Inventory:" to the
+        >>>     # empty line, joined with newlines
+        >>>     pass
+
+        >>> @Task.trigger(r"^Score:\\n.*\\nLevel (\\d+)", start="^Score:",
+        >>>         lines=3)
+        >>> def onScore(self, wildcards):
+        >>>     pass
+
+    See Dispatcher for the details.
+
+    Handlers are evaluated by priority, lower first (the client's trigger
+    sequence, 100 by default). An exclusive handler declares that the lines
+    it matches match no other trigger, so evaluation stops there
+    (keep_evaluating off); see mush.adaptive to have the most matched
+    exclusive handlers evaluated first:
+
+        >>> @Task.trigger(r"^(\w+) hits you\.$", exclusive=True, priority=50)
+
+    Alias handlers are defined the same way with @Task.alias("pattern") and
+    switched along with the triggers; they are resolved by the alias
+    dispatcher (see mush.alias).
     """
 
     __metaclass__ = _RegTrigMetaClass
 
     @classmethod
-    def trigger(cls, pattern):
+    def trigger(cls, pattern, lines=None, start=None, end=None,
+            exclusive=False, priority=None):
         print cls, pattern
+        if (lines or start is not None or end is not None) and \
+                (start is None) == (end is None):
+            raise ValueError("A multi-line trigger needs either start or end")
         def wrapper(func):
-            # Note that here "func" is a function rather than method In order
-            # to reference it later when class instantiates, we have to
-            # identify it by the name.
-            def newfunc(self, trig_name, line, wc):
-                # Bound the function object to class instance "self" and then
-                # invoke
-                MethodType(func, self, type(self))(wc)
+            newfunc = _handler(func)
             newfunc.pattern = pattern
+            if start is not None or end is not None:
+                newfunc.block = dict(lines=lines, start=start, end=end)
+            if exclusive or priority is not None:
+                newfunc.order = dict(exclusive=exclusive, priority=priority)
+            return newfunc
+        return wrapper
+
+    @classmethod
+    def alias(cls, pattern):
+        '''Define an alias handler, called like a trigger handler with the
+        command's wildcards. See mush.alias.'''
+        def wrapper(func):
+            newfunc = _handler(func)
+            newfunc.alias = pattern
             return newfunc
         return wrapper
 
+    _serials = itertools.count()
+
     def __init__(self):
         super(Task, self).__init__()
         self._trig_state = {} # func_name : on/off
-        self._register_trigs() 
+        self._onoff = {} # func_name : current on/off
+        self._serial = next(self._serials)
+        self._register_trigs()
+        _live_tasks.add(self)
 
     def __getitem__(self, key):
         '''Get bound method by its name'''
         return getattr(self, key)
 
     def _register_trigs(self):
-        #for func in dir(self):
-        for func in self._func2pattern:
-            print func
-            class_name = self.__class__.__name__
-            global_name = "g__{0}__{1}__{2}".format(class_name, func, id(self))
-            expose(self[func], global_name)
-            add_trigger(name=global_name, pattern=self._func2pattern[func],
-                    script=global_name)
+        # the triggers are per class, only the ones left by a previous load
+        # are looked at, once
+        if not _reconciled:
+            reconcile_triggers()
+        for func in self._shared:
+            self._onoff[func] = False
+
+    def _func_name(self, func):
+        '''Name of a handler, given as a bound method or its name'''
+        return getattr(func, "__name__", func)
+
+    def _set_onoff(self, func, on):
+        if self._onoff[func] == on:
+            return
+        self._onoff[func] = on
+        trig = self._shared[func]
+        if trig.listen(self, on):
+            trig.set_enabled(on)
+
+    def _set_all_onoff(self, on):
+        switched = []
+        for func in self._onoff:
+            if self._onoff[func] == on:
+                continue
+            self._onoff[func] = on
+            trig = self._shared[func]
+            if trig.listen(self, on):
+                switched.append(trig)
+        _switch_shared(type(self), switched, on)
 
     def enable_all(self, store_state=True):
         if store_state:
             self._store_trig_state()
-        for func in self._func2pattern:
-            enable_trigger(name=self[func].global_name)
+        self._set_all_onoff(True)
 
     def disable_all(self, store_state=True):
         if store_state:
             self._store_trig_state()
-        for func in self._func2pattern:
-            disable_trigger(name=self[func].global_name)
+        self._set_all_onoff(False)
 
     def delete_all(self):
+        '''Stop listening to all the triggers, cancel waits and timers, and
+        end the greenlet if it is suspended, raising GreenletExit in it.
+
+        The triggers of the class stay registered for other instances, and
+        nothing left in the client refers to the instance.
+        '''
+        _scheduler.cancel(self)
+        cancel_owner(self)
+        if get_offloader() is not None:
+            get_offloader().cancel_owner(self)
         self.disable_all(store_state=False)
-        for func in self._func2pattern:
-            del_trigger(name=self[func].global_name)
+        self._trig_state = {}
+        self._kill()
+
+    def _kill(self):
+        # a suspended greenlet keeps its frame, and whatever it refers to,
+        # alive until it is resumed
+        current = getcurrent()
+        if not self or current is self:
+            return
+        try:
+            # come back here rather than to the creator once dead
+            self.parent = current
+        except ValueError:
+            return  # called from a greenlet started by this task
+        self.throw()
 
     def _store_trig_state(self):
-        self._trig_state = {}
-        for func in self._func2pattern:
-            self._trig_state[func] = get_trig_onoff(name=self[func].global_name)
+        # The on/off state is tracked on the Python side, so no client call
+        # is needed here.
+        self._trig_state = dict(self._onoff)
 
     def _resume_trig_state(self):
+        states = set(self._trig_state.itervalues())
+        if len(states) == 1 and len(self._trig_state) == len(self._onoff):
+            self._set_all_onoff(states.pop())
+            return
         for func in self._trig_state:
-            set_trig_onoff(self[func].global_name, self._trig_state[func])
+            if self._onoff[func] != self._trig_state[func]:
+                self._set_onoff(func, self._trig_state[func])
     resume = _resume_trig_state
 
     def _turn_onoff(self, func_or_list, on):
         if not isinstance(func_or_list, list):
             func_or_list = [func_or_list]
         for func in func_or_list:
-            if on:
-                enable_trigger(name=func.global_name)
-            else:
-                disable_trigger(name=func.global_name)
+            self._set_onoff(self._func_name(func), on)
 
     def enable(self, func_or_list):
         self._turn_onoff(func_or_list, on=True)
@@ -132,5 +580,57 @@ class Task(greenlet):
         """Switch to the main greenlet"""
         return main.switch()
 
+    def expect(self, pattern_or_list, timeout=None):
+        """Wait for the next line matching the pattern(s).
+
+        To be called from within the task's own greenlet, which is
+        suspended until a line matches or timeout seconds have passed.
+        Returns (index of the matching pattern, wildcards), or None on
+        timeout:
+
+            >>> res = self.expect([r"^You kill (.*)\.$", r"^You flee"], 5)
+
+        Needs the dispatcher (mush.init(ax, dispatch=True)).
+        """
+        if isinstance(pattern_or_list, (list, tuple)):
+            patterns = list(pattern_or_list)
+        else:
+            patterns = [pattern_or_list]
+        return _scheduler.wait(self, patterns, timeout)
+
+    def sleep(self, seconds):
+        """Suspend the task for some seconds"""
+        _scheduler.wait(self, [], seconds)
+
+    def wait_sent(self, timeout=None):
+        """Wait until the commands this task queued with send() are sent.
+
+        To be called from within the task's own greenlet. Returns False if
+        timeout seconds passed first. See mush.sendqueue.
+        """
+        queue = get_send_queue()
+        if queue is None or not queue.pending(self):
+            return True
+        return _scheduler.wait(self, [], timeout,
+                arm=lambda resume: queue.on_sent(self, resume)) is not None
+
+    def offload(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) in a worker and return its result.
+
+        To be called from within the task's own greenlet, which is
+        suspended until the result is back while the client carries on.
+        An exception raised by func is raised again here. See mush.workers.
+
+            >>> path = self.offload(find_path, here, there)
+        """
+        offloader = install_offloader()
+        ok, value = _scheduler.wait(self, [], None,
+                arm=lambda resume: offloader.submit(func, args, kwargs,
+                    lambda ok, value: resume((ok, value)), owner=self))
+        if not ok:
+            raise value[0]
+        return value
+
 maketrigger = Task.trigger
+makealias = Task.alias
 
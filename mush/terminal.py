@@ -1,4 +1,84 @@
+import os
+import time
+import Queue
+import threading
+from collections import deque
 from datetime import datetime
+
+class _Spill(threading.Thread):
+    '''Background writer streaming terminal output to rotating log files.
+
+    The file is rotated when it would grow over max_bytes: path becomes
+    path.1, path.1 becomes path.2 and so on, keeping up to backups files.
+    If writing fails, the thread stops and keeps the exception in error,
+    and put() no longer queues anything.
+    '''
+
+    def __init__(self, path, max_bytes, backups):
+        threading.Thread.__init__(self, name="mushpy-spill-" + path)
+        self.daemon = True
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.queue = Queue.Queue()
+        self.error = None
+
+    def put(self, text):
+        if self.error is None:
+            self.queue.put(text)
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def _rotate(self, f):
+        f.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = "{0}.{1}".format(self.path, i)
+            if os.path.exists(src):
+                dst = "{0}.{1}".format(self.path, i + 1)
+                if os.path.exists(dst):
+                    os.remove(dst)
+                os.rename(src, dst)
+        if self.backups > 0:
+            dst = self.path + ".1"
+            if os.path.exists(dst):
+                os.remove(dst)
+            os.rename(self.path, dst)
+        return open(self.path, "wb")
+
+    def run(self):
+        try:
+            self._write()
+        except EnvironmentError as e:
+            self.error = e
+
+    def _write(self):
+        f = open(self.path, "ab")
+        size = f.tell()
+        done = False
+        while not done:
+            batch = [self.queue.get()]
+            # write whatever piled up in one go
+            try:
+                while True:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                pass
+            if None in batch:
+                done = True
+                batch = batch[:batch.index(None)]
+            for data in batch:
+                if isinstance(data, unicode):
+                    data = data.encode("utf-8")
+                if size > 0 and size + len(data) > self.max_bytes:
+                    f = self._rotate(f)
+                    size = 0
+                f.write(data)
+                size += len(data)
+            f.flush()
+        f.close()
+
 class Terminal:
     '''Terminal.
 
@@ -6,6 +86,20 @@ class Terminal:
         time_stamp: prefix a time stamp to each line, default to False
         prompt_to_save: prompt to save on exit, default to False
         read_only: if the notepad is readonly. default to True
+        buffered: assemble whole lines and append them to the notepad in
+            batches, default to False. Buffered output is written when
+            flush_lines lines or flush_size characters are pending, or
+            when flush() is called.
+        flush_lines: default to 20
+        flush_size: default to 4096
+        max_lines: only keep about the last max_lines lines in the notepad,
+            default to None (unbounded). The notepad content is replaced
+            by the last max_lines lines each time it has grown to twice
+            that.
+        log_file: also stream all the output to this file, written by a
+            background thread. default to None
+        log_max_bytes: rotate the log file at this size, default to 10MB
+        log_backups: number of rotated log files to keep, default to 5
     '''
 
     def __init__(self, title="stdout", **options):
@@ -15,9 +109,33 @@ class Terminal:
         self.options['time_stamp'] = options.get('time_stamp', False)
         self.options['prompt_to_save'] = options.get('prompt_to_save', False)
         self.options['read_only'] = options.get('read_only', True)
+        self.options['buffered'] = options.get('buffered', False)
+        self.options['flush_lines'] = options.get('flush_lines', 20)
+        self.options['flush_size'] = options.get('flush_size', 4096)
+        self.options['max_lines'] = options.get('max_lines', None)
+        self.options['log_file'] = options.get('log_file', None)
+        self.options['log_max_bytes'] = options.get('log_max_bytes', 10*1024*1024)
+        self.options['log_backups'] = options.get('log_backups', 5)
+
+        self._pending = []          # text not yet sent to the notepad
+        self._pending_lines = 0
+        self._pending_size = 0
+        self._line_start = True     # next fragment starts a new line
+        self._stamp_sec = None      # second the cached stamp was made for
+        self._stamp_text = ""
+        self._tail = deque(maxlen=self.options['max_lines'] or None)
+        self._tail_partial = ""     # last line, not terminated yet
+        self._notepad_lines = 0     # lines in the notepad
+
+        self._spill = None
+        if self.options['log_file']:
+            self._spill = _Spill(self.options['log_file'],
+                    self.options['log_max_bytes'], self.options['log_backups'])
+            self._spill.start()
 
         # Have to write to a notepad first, then the NotepadSaveMethod() call can take effect.
         self.write("Initializing...\r\n")
+        self.flush()
 
         if self.options['prompt_to_save']:
             world.NotepadSaveMethod(self.title, 1)
@@ -26,15 +144,89 @@ class Terminal:
 
         world.NotepadReadOnly(self.title, self.options['read_only'])
 
+    def _stamp(self):
+        '''Time stamp prefix, formatted at most once per second'''
+        now = int(time.time())
+        if now != self._stamp_sec:
+            self._stamp_sec = now
+            self._stamp_text = datetime.fromtimestamp(now).strftime("%c")+": "
+        return self._stamp_text
+
     def write(self, what):
+        if self.options['buffered']:
+            self._write_buffered(what)
+            return
         if self.options['time_stamp']:
             if what.strip():
                 what = datetime.now().strftime("%c")+": "+what
         what = what.replace('\n', '\r\n')
-        world.appendtonotepad(self.title, what)
+        self._append(what)
+
+    def _write_buffered(self, what):
+        what = what.replace('\r\n', '\n')
+        for i, text in enumerate(what.split('\n')):
+            if i > 0:
+                self._pending.append('\r\n')
+                self._pending_lines += 1
+                self._pending_size += 2
+                self._line_start = True
+            if not text:
+                continue
+            if self._line_start and text.strip():
+                if self.options['time_stamp']:
+                    self._pending.append(self._stamp())
+                self._line_start = False
+            self._pending.append(text)
+            self._pending_size += len(text)
+
+        if (self._pending_lines >= self.options['flush_lines'] or
+                self._pending_size >= self.options['flush_size']):
+            self.flush()
 
     def flush(self):
-        pass
+        if not self._pending:
+            return
+        what = "".join(self._pending)
+        self._pending = []
+        self._pending_lines = 0
+        self._pending_size = 0
+        self._append(what)
+
+    def close(self):
+        '''Flush and stop the log file writer'''
+        self.flush()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+    def _append(self, what):
+        if self._spill is not None:
+            if self._spill.error is not None:
+                self._spill_failed()
+            else:
+                self._spill.put(what)
+        if not self.options['max_lines']:
+            world.appendtonotepad(self.title, what)
+            return
+
+        lines = what.split('\r\n')
+        lines[0] = self._tail_partial + lines[0]
+        self._tail_partial = lines.pop()
+        self._tail.extend(lines)
+        self._notepad_lines += len(lines)
+        if self._notepad_lines < 2 * self.options['max_lines']:
+            world.appendtonotepad(self.title, what)
+            return
+
+        text = "\r\n".join(self._tail) + "\r\n" + self._tail_partial
+        world.ReplaceNotepad(self.title, text)
+        self._notepad_lines = len(self._tail)
+
+    def _spill_failed(self):
+        '''Report once that the log file writer stopped, and forget it'''
+        error, self._spill = self._spill.error, None
+        world.note("mushpy: no longer writing {0}: {1}".format(
+            self.options['log_file'], error))
 
     def __getattr__(self, name):
         return self.__call_any
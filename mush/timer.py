@@ -0,0 +1,232 @@
+'''Python side timers driven by a single client timer.
+
+All the timers live in a hierarchical timer wheel. One MUSHclient timer
+ticks it at a fixed resolution, so the client's timer list holds a single
+entry however many timeouts are pending. Adding and cancelling a timer are
+O(1).
+
+    >>> t = call_later(5, onTimeout, args=(room,), owner=task)
+    >>> t.cancel()
+
+Timers with an owner are cancelled together by cancel_owner(owner); Task
+does it when deleted.
+'''
+
+__all__ = ["TimerWheel", "install_timer_wheel", "get_timer_wheel",
+        "call_later", "call_every", "cancel_owner"]
+
+import sys
+import time
+import traceback
+
+from consts import *
+from common import expose
+
+class TimerOpError(Exception): pass
+
+class Timer(object):
+    '''Handle of a pending timer, returned by call_later() and call_every()'''
+    __slots__ = ("due", "func", "args", "interval", "owner", "wheel",
+            "bucket")
+
+    def __init__(self, wheel, due, func, args, interval, owner):
+        self.wheel = wheel
+        self.due = due  # tick number
+        self.func = func
+        self.args = args
+        self.interval = interval    # ticks, None for one-shot
+        self.owner = owner
+        self.bucket = None
+
+    @property
+    def active(self):
+        return self.bucket is not None
+
+    def cancel(self):
+        if self.bucket is not None:
+            self.wheel._remove(self)
+        self.interval = None
+
+class TimerWheel(object):
+    '''Hierarchical timer wheel.
+
+    Level 0 has one slot per tick, each slot of level n spans slots**n ticks.
+    A timer sits in the lowest level covering its delay and moves down a
+    level each time the level above turns to its slot. Timers further than
+    the top level wait in an overflow bucket.
+    '''
+
+    def __init__(self, resolution=0.1, bits=6, levels=4):
+        self.resolution = resolution
+        self._bits = bits
+        self._mask = (1 << bits) - 1
+        self._levels = [[set() for i in range(1 << bits)]
+                for j in range(levels)]
+        self._overflow = set()
+        self._start = time.time()
+        self._now = 0   # last processed tick
+        self._count = 0 # pending timers
+        self._owners = {}   # owner : set of timers
+
+    def __len__(self):
+        return self._count
+
+    def _current_tick(self):
+        return int((time.time() - self._start) / self.resolution)
+
+    def _ticks(self, seconds):
+        return max(1, int(round(seconds / self.resolution)))
+
+    def add(self, delay, func, args=(), interval=None, owner=None):
+        if self._count == 0:
+            # nothing to process while idle, just catch up
+            self._now = max(self._now, self._current_tick())
+        due = max(self._current_tick(), self._now) + self._ticks(delay)
+        if interval is not None:
+            interval = self._ticks(interval)
+        timer = Timer(self, due, func, args, interval, owner)
+        self._insert(timer)
+        self._count += 1
+        if owner is not None:
+            self._owners.setdefault(owner, set()).add(timer)
+        return timer
+
+    def _insert(self, timer):
+        # timers cascading down at their due tick go to the current slot,
+        # which is processed right after the cascade
+        due = max(timer.due, self._now)
+        delta = due - self._now
+        for level, slots in enumerate(self._levels):
+            if delta < 1 << (self._bits * (level + 1)):
+                bucket = slots[(due >> (self._bits * level)) & self._mask]
+                break
+        else:
+            bucket = self._overflow
+        bucket.add(timer)
+        timer.bucket = bucket
+
+    def _remove(self, timer):
+        timer.bucket.discard(timer)
+        timer.bucket = None
+        self._count -= 1
+        if timer.owner is not None:
+            timers = self._owners.get(timer.owner)
+            if timers is not None:
+                timers.discard(timer)
+                if not timers:
+                    del self._owners[timer.owner]
+
+    def cancel_owner(self, owner):
+        for timer in list(self._owners.get(owner, ())):
+            timer.cancel()
+
+    def _cascade(self, tick):
+        '''Move the timers of the higher levels' current slots down'''
+        for level in range(1, len(self._levels)):
+            shift = self._bits * level
+            if (tick >> (shift - self._bits)) & self._mask:
+                return
+            index = (tick >> shift) & self._mask
+            bucket = self._levels[level][index]
+            self._levels[level][index] = set()
+            for timer in bucket:
+                self._insert(timer)
+        overflow, self._overflow = self._overflow, set()
+        for timer in overflow:
+            self._insert(timer)
+
+    def advance(self, until=None):
+        '''Process the ticks up to until, firing the expired timers'''
+        if until is None:
+            until = self._current_tick()
+        while self._now < until:
+            if self._count == 0:
+                self._now = until
+                break
+            tick = self._now = self._now + 1
+            if not tick & self._mask:
+                self._cascade(tick)
+            slots = self._levels[0]
+            expired, slots[tick & self._mask] = slots[tick & self._mask], set()
+            # drained one at a time: a callback may cancel a timer of the
+            # same tick, which then leaves the set through _remove()
+            while expired:
+                timer = expired.pop()
+                timer.bucket = None
+                self._count -= 1
+                if timer.interval is not None:
+                    timer.due = tick + timer.interval
+                    self._insert(timer)
+                    self._count += 1
+                elif timer.owner is not None:
+                    self._owners[timer.owner].discard(timer)
+                    if not self._owners[timer.owner]:
+                        del self._owners[timer.owner]
+                try:
+                    timer.func(*timer.args)
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+
+class _ClientTimerWheel(TimerWheel):
+    '''TimerWheel ticked by a MUSHclient timer, which is only enabled while
+    timers are pending.'''
+
+    def __init__(self, name, resolution):
+        super(_ClientTimerWheel, self).__init__(resolution)
+        self.name = name
+        self._enabled = False
+        expose(self.tick, name)
+        res = world.AddTimer(name, 0, 0, resolution, "",
+                TimerFlags.eTemporary | TimerFlags.eReplace |
+                TimerFlags.eActiveWhenClosed, name)
+        if res != ErrorNo.eOK:
+            raise TimerOpError("Timer creation failed: {0}".format(res))
+
+    def _enable(self, on):
+        if on != self._enabled:
+            world.EnableTimer(self.name, on)
+            self._enabled = on
+
+    def add(self, *args, **kw):
+        timer = super(_ClientTimerWheel, self).add(*args, **kw)
+        self._enable(True)
+        return timer
+
+    def tick(self, name=None):
+        '''Script callback of the client timer'''
+        self.advance()
+        if self._count == 0:
+            self._enable(False)
+        # what the callbacks printed
+        sys.stdout.flush()
+
+_wheel = None
+
+def install_timer_wheel(resolution=0.1, name="mushpy_timer"):
+    '''Create the client timer driving the timer wheel.
+
+    resolution is the tick length in seconds. Called with the defaults by
+    the first call_later() or call_every() if not called before.
+    '''
+    global _wheel
+    if _wheel is None:
+        _wheel = _ClientTimerWheel(name, resolution)
+    return _wheel
+
+def get_timer_wheel():
+    '''Return the installed TimerWheel or None.'''
+    return _wheel
+
+def call_later(delay, func, args=(), owner=None):
+    '''Call func(*args) once after delay seconds.'''
+    return install_timer_wheel().add(delay, func, args, owner=owner)
+
+def call_every(interval, func, args=(), owner=None):
+    '''Call func(*args) every interval seconds until cancelled.'''
+    return install_timer_wheel().add(interval, func, args, interval=interval,
+            owner=owner)
+
+def cancel_owner(owner):
+    '''Cancel all the pending timers of owner.'''
+    if _wheel is not None:
+        _wheel.cancel_owner(owner)
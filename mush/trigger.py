@@ -1,10 +1,59 @@
 from consts import *
+from common import unexpose
+
+# Trigger proxies by name, see get_trigger()
+_proxies = {}
+
+# Counters of the proxy cache: option reads served from the cache (hits) or
+# from the client (misses), option writes sent to the client (writes) or
+# skipped because the value was unchanged (skipped).
+trigger_cache_stats = {"hits": 0, "misses": 0, "writes": 0, "skipped": 0}
+
+def get_trigger(name):
+    '''Return the cached Trigger proxy of a trigger.
+
+    The client is only asked whether the trigger exists the first time.
+    '''
+    try:
+        return _proxies[name]
+    except KeyError:
+        proxy = _proxies[name] = Trigger(name)
+        return proxy
+
+def invalidate_trigger_cache(name=None):
+    '''Forget cached option values, of one trigger or of all of them.
+
+    Needed when triggers are changed behind mushpy's back, e.g. edited in
+    the client's trigger dialog.
+    '''
+    if name is None:
+        _proxies.clear()
+    else:
+        _proxies.pop(name, None)
+
+def get_many(names, keys):
+    '''Get options of several triggers: {name: {key: value}}'''
+    result = {}
+    for name in names:
+        trig = get_trigger(name)
+        result[name] = dict((key, trig[key]) for key in keys)
+    return result
+
+def set_many(names, options):
+    '''Set the options dict {key: value} on several triggers.
+
+    Only the values different from the cached ones are sent to the client.
+    '''
+    for name in names:
+        trig = get_trigger(name)
+        for key, value in options.iteritems():
+            trig[key] = value
 
 def set_trig_onoff(name, set_on):
-    Trigger(name).enabled = set_on
+    get_trigger(name).enabled = set_on
 
 def get_trig_onoff(name):
-    return Trigger(name).enabled
+    return get_trigger(name).enabled
 
 def enable_trigger(name):
     set_trig_onoff(name, True)
@@ -13,11 +62,72 @@ def disable_trigger(name):
     set_trig_onoff(name, False)
 
 def del_trigger(name):
+    _proxies.pop(name, None)
     res = world.DeleteTrigger(name)
     if res != ErrorNo.eOK:
         raise TriggerOpError("Trigger deletion failed: {0}".format(res))
 
-def add_trigger(name, pattern, script):
+def sync_triggers(desired, prefix, keep=None):
+    '''Reconcile the client triggers whose names start with prefix with
+    desired, {name: (pattern, script, group)}, listing them with a single
+    GetTriggerList() call.
+
+    Existing desired triggers are kept, with their pattern updated if it
+    changed, and disabled; the triggers of keep, {name: group}, are left as
+    they are; the others are deleted along with their script, which is
+    named after them. Missing triggers aren't created. Returns the names of
+    the desired triggers kept.
+    '''
+    wanted = dict((name.lower(), name) for name in desired)
+    keep = keep or {}
+    busy = set(keep.itervalues())   # groups not to be disabled as a whole
+    keep = set(name.lower() for name in keep)
+    prefix = prefix.lower()
+    namespace = ax._scriptEngine_.globalNameSpaceModule
+    kept = set()
+    groups = set()
+    for existing in world.GetTriggerList() or ():
+        if not existing.lower().startswith(prefix) or \
+                existing.lower() in keep:
+            continue
+        name = wanted.get(existing.lower())
+        if name is None:
+            del_trigger(existing)
+            unexpose(existing)
+            # exposed by a previous load, unknown to unexpose()
+            if hasattr(namespace, existing):
+                delattr(namespace, existing)
+            continue
+        pattern, script, group = desired[name]
+        trig = _proxies[name] = Trigger(name, check=False)
+        if trig.whattomatch != pattern:
+            trig.match = pattern
+        # the rest follows from the name, but for keep_evaluating and
+        # sequence which the caller may have changed
+        trig._cache.update(scriptprocname=script, regex=True, groupname=group)
+        if group in busy:
+            disable_trigger(name)
+        else:
+            groups.add(group)
+        kept.add(name)
+    for group in groups:
+        disable_trigger_group(group)
+    return kept
+
+def enable_trigger_group(group, on=True):
+    '''Enable or disable all the triggers of a group with a single call.
+
+    Returns the number of triggers in the group.
+    '''
+    for trig in _proxies.itervalues():
+        trig._group_switched(group, on)
+    return world.EnableTriggerGroup(group, on)
+
+def disable_trigger_group(group):
+    return enable_trigger_group(group, False)
+
+def add_trigger(name, pattern, script, group=None):
+    _proxies.pop(name, None)
     res = world.AddTrigger(name, pattern, 
             "", # ResponseText
             TriggerFlags.KeepEval_Re, 
@@ -29,6 +139,14 @@ def add_trigger(name, pattern, script):
     if res != ErrorNo.eOK:
         raise TriggerOpError("Trigger creation failed: {0}".format(res))
 
+    # We know what the trigger looks like, no need to ask the client.
+    trig = _proxies[name] = Trigger(name, check=False)
+    trig._cache.update(whattomatch=pattern, scriptprocname=script,
+            enabled=False, keepeval=True, regex=True, groupname="",
+            sequence=100)
+    if group:
+        trig.group = group
+
 class TriggerNotFoundError(Exception): pass
 class TriggerOpError(Exception): pass
 
@@ -42,7 +160,10 @@ class Trigger:
 
     For setting, refer to:
     http://www.gammon.com.au/scripts/function.php?name=SetTriggerOption
-    
+
+    Option values read or written through the proxy are cached, and setting
+    an option to its cached value doesn't reach the client. Use
+    get_trigger() to share one proxy per trigger.
     '''
 
     TriggerInfoNames = {
@@ -71,6 +192,33 @@ class Trigger:
         "isoneshot" : 36          ,# 'one shot' flag (boolean)
     }
 
+    # SetTriggerOption names and the GetTriggerInfo names they change
+    _option2info = {
+        "enabled" : "enabled",
+        "expand_variables" : "expandvar",
+        "group" : "groupname",
+        "ignore_case" : "ignorecase",
+        "keep_evaluating" : "keepeval",
+        "match" : "whattomatch",
+        "omit_from_log" : "omitfromlog",
+        "omit_from_output" : "omitfromoutput",
+        "one_shot" : "isoneshot",
+        "regexp" : "regex",
+        "repeat" : "reponsameline",
+        "script" : "scriptprocname",
+        "send" : "whattosend",
+        "send_to" : "sendto",
+        "sequence" : "sequence",
+        "sound" : "soundtoplay",
+        "sound_if_inactive" : "playsoundifinactive",
+        "variable" : "varname",
+    }
+
+    # Infos changing without the proxy being told, never cached
+    _volatile_infos = set([
+        "invoccount", "timesmatched", "lastmatchedon",
+        "execscriptflag", "isscriptvalid"])
+
     _boolean_opts = set([
         "enabled", "expand_variables", "ignore_case", 
         "inverse", "italic", "keep_evaluating", 
@@ -78,14 +226,30 @@ class Trigger:
         "omit_from_output", "one_shot", "regexp", 
         "repeat", "sound_if_inactive"])
 
-    def __init__(self, name):
-        if (world.istrigger(name) != ErrorNo.eOK):
+    def __init__(self, name, check=True):
+        if check and (world.istrigger(name) != ErrorNo.eOK):
             raise TriggerNotFoundError()
         # avoid recursive calls into __setattr__ and __getattr__
         self.__dict__["name"] = name
+        self.__dict__["_cache"] = {} # info name : value
 
     def __getitem__(self, key):
-        return world.GetTriggerInfo(self.name, self.TriggerInfoNames[key.lower()])
+        key = key.lower()
+        if key in self._cache:
+            trigger_cache_stats["hits"] += 1
+            return self._cache[key]
+        trigger_cache_stats["misses"] += 1
+        value = world.GetTriggerInfo(self.name, self.TriggerInfoNames[key])
+        if key not in self._volatile_infos:
+            self._cache[key] = value
+        return value
+
+    def _group_switched(self, group, on):
+        '''Keep the cache right when the trigger's group is switched'''
+        if self._cache.get("groupname") == group:
+            self._cache["enabled"] = bool(on)
+        elif "groupname" not in self._cache:
+            self._cache.pop("enabled", None)
 
     def __getattr__(self, key):
         if key in self.__dict__:
@@ -133,13 +297,24 @@ class Trigger:
 "variable": (string - name of variable to send to)
             
         '''
+        info = self._option2info.get(key)
+        cached = value
         if key in self._boolean_opts:
-            value = "y" if value == True else "n"
+            cached = (value == True)
+            value = "y" if cached else "n"
+
+        if info in self._cache and self._cache[info] == cached:
+            trigger_cache_stats["skipped"] += 1
+            return
 
+        trigger_cache_stats["writes"] += 1
         res = world.SetTriggerOption(self.name, key, value)
         if res != ErrorNo.eOK:
+            self._cache.pop(info, None)
             raise TriggerOpError("Error setting trigger option: {0} {1} {2}".format(
                 self.name, key, value))
+        if info is not None:
+            self._cache[info] = cached
 
     def __setattr__(self, key, value):
         if key in self.__dict__:
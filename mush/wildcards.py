@@ -0,0 +1,97 @@
+'''Wildcards given to the handlers.
+
+A handler gets a Wildcards object. It indexes like the client's wildcards
+array: the 9 groups (empty for a group that didn't match) followed by the
+line, e.g. wc[0] is the first group and wc[9] the line. The named groups
+of the pattern are also available as items or attributes:
+
+    >>> @Task.trigger(r"^(?P<target>\w+) has (?P<hp>\d+) hp\.$")
+    ... def onHp(self, wc):
+    ...     print wc.target, int(wc["hp"]), wc[1], wc.line
+
+Nothing is converted or copied until accessed. For a client trigger, whose
+wildcards array has no names, the line is matched again in Python the first
+time a named group is asked for. A pattern that Python's re cannot compile
+(the client's regexes are PCRE) then has no named groups.
+'''
+
+__all__ = ["Wildcards"]
+
+import re
+
+class Wildcards(object):
+    '''Wildcards of a match, either of a Python match object or of the
+    client's wildcards array (values) with the pattern to get the named
+    groups from'''
+
+    __slots__ = ("line", "_match", "_values", "_pattern")
+
+    def __init__(self, line, match=None, values=None, pattern=None):
+        self.line = line
+        self._match = match
+        self._values = values
+        self._pattern = pattern
+
+    def __len__(self):
+        return 10
+
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self._group(key)
+        if isinstance(key, slice):
+            return [self[i] for i in xrange(*key.indices(10))]
+        if key < 0:
+            key += 10
+        if not 0 <= key < 10:
+            raise IndexError("wildcard index out of range")
+        if self._values is not None:
+            value = self._values[key]
+        elif key == 9:
+            return self.line
+        elif key < self._match.re.groups:
+            value = self._match.group(key + 1)
+        else:
+            return ""
+        return value if value is not None else ""
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def _search(self):
+        '''The match object, or False if the pattern doesn't compile or
+        match in Python'''
+        if self._match is None:
+            try:
+                # cached by re once compiled
+                regex = re.compile(self._pattern)
+            except (re.error, TypeError):
+                self._match = False
+            else:
+                self._match = regex.search(self.line) or False
+        return self._match
+
+    def _group(self, name):
+        match = self._search()
+        try:
+            value = match.group(name)
+        except (IndexError, AttributeError):
+            raise KeyError(name)
+        return value if value is not None else ""
+
+    def __getattr__(self, name):
+        # only the named groups get here
+        if name.startswith("__"):
+            raise AttributeError(name)
+        try:
+            return self._group(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def groupdict(self):
+        '''The named groups'''
+        match = self._search()
+        names = match.re.groupindex if match else ()
+        return dict((name, self._group(name)) for name in names)
+
+    def __repr__(self):
+        return "Wildcards({0!r})".format(self[:])
@@ -0,0 +1,152 @@
+'''Run heavy work off the client's thread.
+
+Script callbacks run on the client's UI thread, which is frozen while they
+run. Work submitted to the Offloader runs in a pool of worker threads or
+processes instead, and its result is delivered on the client's thread by a
+timer polling the completion queue, so handlers can use world as usual:
+
+    >>> offload(find_path, (here, there), callback=self.walk)
+
+A Task can also wait for the result from its own greenlet with
+Task.offload(), the rest of the client carrying on meanwhile.
+
+Worker threads still share the interpreter lock with the client's thread,
+which gets it back regularly; pure Python number crunching is better off
+in worker processes (kind="process"), for functions and arguments that
+can be pickled.
+'''
+
+__all__ = ["Offloader", "install_offloader", "get_offloader", "offload"]
+
+import sys
+import Queue
+import traceback
+import multiprocessing
+import multiprocessing.pool
+
+from timer import call_every
+
+def _run(func, args, kwargs):
+    '''Run in a worker: (True, result) or (False, (exception, traceback))'''
+    try:
+        return True, func(*args, **kwargs)
+    except Exception as e:
+        return False, (e, traceback.format_exc())
+
+class _Job(object):
+    __slots__ = ("callback", "owner", "result")
+
+    def __init__(self, callback, owner):
+        self.callback = callback
+        self.owner = owner
+        self.result = None  # AsyncResult of the pool
+
+class Offloader(object):
+    '''Pool of workers whose completions are polled every interval seconds,
+    only while jobs are pending.
+
+    kind is "thread" or "process"; workers defaults to the number of
+    cores.
+    '''
+
+    def __init__(self, workers=None, kind="thread", interval=0.05):
+        if kind == "process":
+            self._pool = multiprocessing.Pool(workers)
+        elif kind == "thread":
+            self._pool = multiprocessing.pool.ThreadPool(workers)
+        else:
+            raise ValueError("Unknown kind of workers: {0}".format(kind))
+        self.interval = interval
+        self._done = Queue.Queue()  # (job, ok, value) of finished jobs
+        self._jobs = set()  # pending jobs
+        self._timer = None
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def submit(self, func, args=(), kwargs=None, callback=None, owner=None):
+        '''Run func(*args, **kwargs) in a worker.
+
+        callback(ok, value) is then called on the client's thread, with
+        ok True and the value returned, or False and (exception, formatted
+        traceback).
+        '''
+        job = _Job(callback, owner)
+        self._jobs.add(job)
+        # called by the pool's result thread
+        done = lambda res: self._done.put((job, res[0], res[1]))
+        job.result = self._pool.apply_async(_run, (func, args, kwargs or {}),
+                callback=done)
+        if self._timer is None:
+            self._timer = call_every(self.interval, self.poll)
+        return job
+
+    def cancel_owner(self, owner):
+        '''Drop the callbacks of the pending jobs of owner. The work itself
+        still runs to completion.'''
+        for job in self._jobs:
+            if job.owner is owner:
+                job.callback = None
+
+    def _deliver(self, job, ok, value):
+        self._jobs.discard(job)
+        if job.callback is None:
+            return
+        try:
+            job.callback(ok, value)
+        except Exception:
+            traceback.print_exc(file=sys.stderr)
+
+    def poll(self):
+        '''Timer callback: deliver the results of the finished jobs'''
+        while True:
+            try:
+                job, ok, value = self._done.get_nowait()
+            except Queue.Empty:
+                break
+            self._deliver(job, ok, value)
+        # jobs failing in the pool itself, e.g. func, its arguments or its
+        # result not picklable, get no callback from the pool
+        for job in [job for job in self._jobs if job.result.ready() and
+                not job.result.successful()]:
+            try:
+                job.result.get(0)
+            except Exception as e:
+                self._deliver(job, False, (e, traceback.format_exc()))
+        if not self._jobs and self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def close(self):
+        '''Stop the workers, dropping the pending jobs'''
+        self._pool.terminate()
+        self._pool.join()
+        self._jobs.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+_offloader = None
+
+def install_offloader(workers=None, kind="thread", interval=0.05):
+    '''Create the Offloader used by offload() and Task.offload(). Called
+    with the defaults by the first of them if not called before.'''
+    global _offloader
+    if _offloader is None:
+        _offloader = Offloader(workers, kind, interval)
+    return _offloader
+
+def get_offloader():
+    '''Return the installed Offloader or None.'''
+    return _offloader
+
+def offload(func, args=(), kwargs=None, callback=None, owner=None):
+    '''Run func(*args, **kwargs) in a worker and call callback(result) on
+    the client's thread. Exceptions raised by func are reported on stderr.
+    '''
+    def done(ok, value):
+        if not ok:
+            sys.stderr.write(value[1])
+        elif callback is not None:
+            callback(value)
+    return install_offloader().submit(func, args, kwargs, done, owner)
@@ -0,0 +1,29 @@
+'''Task classes run by test_offline'''
+
+from mush.task import Task
+
+class Tally(Task):
+    def __init__(self):
+        Task.__init__(self)
+        self.damage = 0
+
+    @Task.trigger(r"^(\w+) hits you for (\d+)\.$")
+    def onHit(self, wc):
+        self.damage += int(wc[1])
+        return wc[0]
+
+    @Task.trigger(r"^You die\.$")
+    def onDeath(self, wc):
+        pass
+
+    def offline_result(self):
+        return self.damage
+
+    @classmethod
+    def offline_merge(cls, damages):
+        return sum(damages)
+
+class Silent(Task):
+    @Task.trigger(r"^You flee\.$")
+    def onFlee(self, wc):
+        pass
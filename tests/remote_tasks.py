@@ -0,0 +1,14 @@
+'''Task classes served by the worker of test_remote'''
+
+from mush.task import Task
+
+class Fighter(Task):
+    def __init__(self):
+        Task.__init__(self)
+        self.hits = 0
+
+    @Task.trigger(r"^(?P<who>\w+) hits you\.$")
+    def onHit(self, wc):
+        self.hits += 1
+        send("kill " + wc.who)
+        print "hit by", wc.who, "target", world.GetVariable("target")
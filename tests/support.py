@@ -0,0 +1,48 @@
+'''Helpers of the tests: mushpy on a simulated client (see mush.sim).
+
+mushpy keeps its state in module globals, so each test imports it anew
+rather than at the top of the test modules.
+'''
+
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# modules replaced by fresh_mush(), kept alive: Python 2 clears the globals
+# of a collected module, which objects still in use (e.g. a simulated World)
+# rely on
+_replaced = []
+
+def fresh_mush():
+    '''Import mush anew, its module globals reset'''
+    for name in list(sys.modules):
+        if name == "mush" or name.startswith("mush."):
+            _replaced.append(sys.modules.pop(name))
+    import mush
+    return mush
+
+class SimTestCase(unittest.TestCase):
+    '''Test with mush initialized on a new simulated client: self.mush,
+    self.ax and its World self.sim'''
+
+    dispatch = False
+
+    def setUp(self):
+        self._streams = sys.stdout, sys.stderr
+        self.mush = fresh_mush()
+        import mush.sim
+        self.ax = mush.sim.make_ax()
+        self.sim = self.ax.sim
+        self.mush.init(self.ax, dispatch=self.dispatch)
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self._streams
+
+    def reload(self):
+        '''Load mush again on the same client, as a script reload does'''
+        self.mush = fresh_mush()
+        self.mush.init(self.ax, dispatch=self.dispatch)
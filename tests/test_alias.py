@@ -0,0 +1,90 @@
+import unittest
+
+import support
+from support import SimTestCase
+
+class AliasDispatcherTest(unittest.TestCase):
+    def setUp(self):
+        support.fresh_mush()
+        from mush.alias import AliasDispatcher
+        self.dispatcher = AliasDispatcher()
+        self.got = []
+
+    def add(self, name, pattern, **kwargs):
+        def callback(name, command, wc):
+            self.got.append((name, wc[0]))
+        self.dispatcher.add(name, pattern, callback, **kwargs)
+
+    def names(self, command):
+        return [e.name for e in self.dispatcher.candidates(command)]
+
+    def test_literal_prefixes_in_the_trie_others_tried_as_regexes(self):
+        self.add("kill", r"^kill (\w+)$", enabled=True)
+        self.add("k", r"^k (\w+)$", enabled=True)
+        self.add("any", r"(\w+)!$", enabled=True)
+        self.add("nocase", r"(?i)^kick (\w+)$", enabled=True)
+        self.assertEqual(self.names("kill rat"), ["kill", "any", "nocase"])
+        self.assertEqual(self.names("k rat"), ["k", "any", "nocase"])
+        self.assertEqual(self.names("look"), ["any", "nocase"])
+        self.assertTrue(self.dispatcher.dispatch("KICK rat"))
+        self.assertTrue(self.dispatcher.dispatch("kill orc"))
+        self.assertTrue(self.dispatcher.dispatch("yay!"))
+        self.assertFalse(self.dispatcher.dispatch("look"))
+        self.assertEqual(self.got,
+                [("nocase", "rat"), ("kill", "orc"), ("any", "yay")])
+
+    def test_first_match_in_adding_order(self):
+        self.add("any", r"^(.*)$", enabled=True)
+        self.add("kill", r"^kill (\w+)$", enabled=True)
+        self.dispatcher.dispatch("kill rat")
+        self.assertEqual(self.got, [("any", "kill rat")])
+
+    def test_enable_and_disable(self):
+        self.add("kill", r"^kill (\w+)$", group="g")
+        self.add("any", r"(\w+)!$", group="g")
+        self.assertEqual(self.names("kill rat"), [])
+        self.assertEqual(self.dispatcher.set_group_enabled("g", True), 2)
+        self.assertEqual(self.names("kill rat"), ["kill", "any"])
+        self.dispatcher.set_enabled("kill", False)
+        self.dispatcher.set_enabled("any", False)
+        self.assertEqual(self.names("kill rat"), [])
+        self.assertFalse(self.dispatcher.is_enabled("kill"))
+        self.dispatcher.set_enabled("kill", True)
+        self.dispatcher.remove("kill")
+        self.assertNotIn("kill", self.dispatcher)
+        self.assertEqual(self.names("kill rat"), [])
+
+class MakeAliasTest(SimTestCase):
+    def setUp(self):
+        super(MakeAliasTest, self).setUp()
+        self.got = []
+        got = self.got
+        Task, makealias = self.mush.Task, self.mush.makealias
+
+        class Fighter(Task):
+            @makealias(r"^kk (\w+)$")
+            def onKill(self, wc):
+                got.append(wc[0])
+                send("kill " + wc[0])
+
+        self.task = Fighter()
+        self.task.enable_all()
+
+    def test_alias_handlers_switched_with_the_task(self):
+        self.sim.command("kk rat")
+        self.task.disable_all()
+        self.sim.command("kk orc")
+        self.task.enable("onKill")
+        self.sim.command("kk bat")
+        self.assertEqual(self.got, ["rat", "bat"])
+        self.assertEqual(self.sim.sent, ["kill rat", "kk orc", "kill bat"])
+        # one catch-all client alias, last in sequence
+        self.assertEqual(self.sim.aliases.keys(), ["mushpy_alias"])
+        self.assertEqual(self.sim.aliases["mushpy_alias"].sequence, 10000)
+
+    def test_unmatched_commands_bypass_the_send_queue(self):
+        queue = self.mush.install_send_queue(rate=1, burst=1)
+        self.mush.send("north\nnorth")
+        self.sim.command("look")
+        self.assertEqual(self.sim.sent, ["north", "look"])
+        self.assertEqual(len(queue), 1)
@@ -0,0 +1,149 @@
+import re
+import random
+import unittest
+
+import support
+from support import SimTestCase
+
+def _dispatcher():
+    from mush.dispatch import Dispatcher
+    return Dispatcher()
+
+class DispatcherTest(unittest.TestCase):
+    def setUp(self):
+        support.fresh_mush()
+        self.dispatcher = _dispatcher()
+        self.calls = []
+
+    def add(self, name, pattern, **options):
+        self.dispatcher.add(name, pattern,
+                lambda name, line, wc: self.calls.append((name, wc[0])),
+                enabled=True, **options)
+
+    def test_literal_index_matches_like_the_regexes(self):
+        # literals sharing prefixes, contained in one another, or none
+        patterns = [r"hits mob1 ", r"hits mob10 ", r"mob1", r"ob10 f",
+                r"^x\d+y", r"bc", r"abc", r"a.c", r"zz(?:a|b)"]
+        for i, pattern in enumerate(patterns):
+            self.add("e{0}".format(i), pattern)
+        rand = random.Random(0)
+        pieces = ["hits ", "mob1", "0 ", "for ", "abc", "x12y", "zza", "b",
+                "c"]
+        for i in range(2000):
+            line = "".join(rand.choice(pieces) for j in range(6))
+            del self.calls[:]
+            self.dispatcher.dispatch(line)
+            expected = ["e{0}".format(i) for i, pattern in enumerate(patterns)
+                    if re.search(pattern, line)]
+            self.assertEqual(sorted(name for name, wc in self.calls),
+                    expected, line)
+
+    def test_enabling_known_literals_keeps_the_index(self):
+        self.add("a", r"^foo (\w+)")
+        self.add("b", r"^bar (\w+)")
+        self.dispatcher.dispatch("foo x")
+        index = self.dispatcher._literals
+        self.dispatcher.set_enabled("a", False)
+        self.dispatcher.dispatch("foo y")
+        self.dispatcher.set_enabled("a", True)
+        self.dispatcher.dispatch("foo z")
+        self.assertIs(self.dispatcher._literals, index)
+        self.assertEqual(self.calls, [("a", "x"), ("a", "z")])
+
+    def test_entries_run_in_adding_order(self):
+        self.add("second", r"hits (\w+)")
+        self.add("first", r"^(\w+)")
+        self.add("third", r"(\w+)$")
+        self.dispatcher.dispatch("Bob hits Al")
+        self.assertEqual(self.calls,
+                [("second", "Al"), ("first", "Bob"), ("third", "Al")])
+
+    def test_priority_and_exclusive(self):
+        self.add("late", r"^(\w+) hits", priority=200)
+        self.add("first", r"^(\w+) hits", priority=10)
+        self.add("stop", r"^(\w+) hits you", exclusive=True)
+        self.add("never", r"^(\w+) hits you", priority=150)
+        self.dispatcher.dispatch("Bob hits you")
+        self.assertEqual(self.calls, [("first", "Bob"), ("stop", "Bob")])
+        del self.calls[:]
+        self.dispatcher.dispatch("Bob hits it")
+        self.assertEqual(self.calls, [("first", "Bob"), ("late", "Bob")])
+
+    def test_adaptive_puts_the_most_matched_exclusive_first(self):
+        self.add("cold", r"^cold (\w+)", exclusive=True)
+        self.add("hot", r"^hot (\w+)", exclusive=True)
+        self.add("other", r"(\w+)$")
+        self.dispatcher.adaptive = True
+        for i in range(1024):
+            self.dispatcher.dispatch("hot x")
+        orders = sorted((entry.order, name) for name, entry in
+                self.dispatcher._entries.iteritems())
+        self.assertEqual([name for order, name in orders],
+                ["hot", "cold", "other"])
+
+    def test_block_with_end_marker(self):
+        calls = []
+        self.dispatcher.add("inv", r"^Inventory:$",
+                lambda name, line, wc: calls.append(wc[9]), enabled=True,
+                end=r"^$", lines=10)
+        for line in ["Inventory:", "a sword", "a shield", "", "after"]:
+            self.dispatcher.dispatch(line)
+        self.assertEqual(calls, ["Inventory:\na sword\na shield\n"])
+        self.assertEqual(self.dispatcher._open, {})
+
+    def test_block_with_multi_line_pattern(self):
+        calls = []
+        self.dispatcher.add("score", r"^Score:\n.*\nLevel (\d+)",
+                lambda name, line, wc: calls.append((wc[0], wc[9])),
+                enabled=True, start=r"^Score:$", lines=5)
+        for line in ["Score:", "name bob", "Level 12", "Level 13"]:
+            self.dispatcher.dispatch(line)
+        self.assertEqual(calls, [("12", "Score:\nname bob\nLevel 12")])
+        # no match can span more than 2 newlines: dropped at the 3rd line
+        for line in ["Score:", "name bob", "xp 10"]:
+            self.dispatcher.dispatch(line)
+        self.assertEqual(self.dispatcher._open, {})
+
+    def test_unbounded_block_matches_like_the_whole_pattern(self):
+        pattern = r"^Inv:\n(?:.*\n)*Total: (\d+)"
+        calls = []
+        self.dispatcher.add("inv", pattern,
+                lambda name, line, wc: calls.append(wc[9]), enabled=True,
+                start=r"^Inv:$", lines=50)
+        lines = ["Inv:", "a", "Total: x", "b", "Total: 3", "c"]
+        for line in lines:
+            self.dispatcher.dispatch(line)
+        self.assertEqual(calls, ["\n".join(lines[:5])])
+
+    def test_disabling_drops_the_open_block(self):
+        self.add("inv", r"^Inventory:$", end=r"^$", lines=10)
+        self.dispatcher.dispatch("Inventory:")
+        self.assertIn("inv", self.dispatcher._open)
+        self.dispatcher.set_enabled("inv", False)
+        self.assertEqual(self.dispatcher._open, {})
+
+    def test_block_options_are_checked(self):
+        self.assertRaises(ValueError, self.dispatcher.add, "x", "^a",
+                lambda *args: None, start="^a", end="^b")
+
+class DispatchedTaskTest(SimTestCase):
+    dispatch = True
+
+    def test_handlers_behind_a_single_client_trigger(self):
+        Task = self.mush.Task
+        got = []
+        class Hp(Task):
+            @Task.trigger(r"^(?P<target>\w+) has (?P<hp>\d+) hp\.$")
+            def onHp(self, wc):
+                got.append((wc.target, wc["hp"], wc[0], wc[9], len(wc)))
+        task = Hp()
+        task.enable_all()
+        self.sim.receive("orc has 12 hp.")
+        self.assertEqual(got, [("orc", "12", "orc", "orc has 12 hp.", 10)])
+        self.assertEqual(sorted(self.sim.triggers), ["mushpy_dispatch"])
+        task.disable_all()
+        self.sim.receive("orc has 11 hp.")
+        self.assertEqual(len(got), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import __builtin__
+from StringIO import StringIO
+
+from support import SimTestCase
+
+class InstrumentTest(SimTestCase):
+    def setUp(self):
+        super(InstrumentTest, self).setUp()
+        import mush.instrument
+        self.instrument = mush.instrument
+        Task = self.mush.Task
+
+        class Greeter(Task):
+            @Task.trigger(r"^hello (\w+)$")
+            def onHello(self, wc):
+                pass
+        self.task = Greeter()
+        self.task.enable_all()
+
+    def tearDown(self):
+        self.instrument.stop()
+        super(InstrumentTest, self).tearDown()
+
+    def test_start_and_stop_swap_the_world(self):
+        client = __builtin__.world
+        self.instrument.start()
+        proxy = __builtin__.world
+        self.assertIsNot(proxy, client)
+        self.instrument.start(sample_every=2)
+        self.assertIs(__builtin__.world, proxy)
+        world.note("x")
+        self.assertEqual(self.sim.output, ["Successfully loaded Mushpy", "x"])
+        self.assertEqual(
+            self.instrument._profiler.world_calls["note"].calls, 1)
+        self.instrument.stop()
+        self.assertIs(__builtin__.world, client)
+        self.assertIsNone(self.instrument.handler_profiler)
+        # kept for report()
+        self.assertEqual(
+            self.instrument._profiler.world_calls["note"].calls, 1)
+
+    def test_handlers_counted_and_one_call_in_n_timed(self):
+        self.sim.receive("hello x")
+        self.instrument.start(sample_every=3, world_calls=False)
+        self.assertIs(__builtin__.world._sim, self.sim)
+        for i in range(7):
+            self.sim.receive("hello x")
+        self.instrument.stop()
+        self.sim.receive("hello x")
+        stat = self.instrument._profiler.handlers["Greeter.onHello"]
+        self.assertEqual((stat.calls, stat.timed), (7, 2))
+
+    def test_report_sorted_by_total_time(self):
+        profiler = self.instrument._profiler
+        for key, elapsed, calls in (("A.fast", 0.001, 100),
+                ("B.slow", 0.5, 1), ("C.medium", 0.01, 20)):
+            stat = profiler._stat(profiler.handlers, key)
+            stat.calls = calls
+            stat.add(elapsed)
+        out = StringIO()
+        self.instrument.report(out)
+        names = [line.split()[0] for line in out.getvalue().splitlines()
+                if line[:2] in ("A.", "B.", "C.")]
+        self.assertEqual(names, ["B.slow", "C.medium", "A.fast"])
+
+        self.instrument.report()
+        self.assertEqual(self.sim.notepads["mushpy profile"].replace("\r", ""),
+                out.getvalue())
+        self.instrument.reset()
+        self.assertEqual(profiler.handlers, {})
+
+class MemoryReportTest(SimTestCase):
+    def setUp(self):
+        super(MemoryReportTest, self).setUp()
+        import mush.instrument
+        self.instrument = mush.instrument
+        Task = self.mush.Task
+
+        class Hoarder(Task):
+            def __init__(self):
+                Task.__init__(self)
+                self.data = "x" * 100000
+
+            @Task.trigger(r"^loot (\w+)$")
+            def onLoot(self, wc):
+                pass
+
+        class Idle(Task):
+            def run(self):
+                # suspended until deleted
+                self.parent.switch()
+        self.Hoarder, self.Idle = Hoarder, Idle
+
+    def lines(self):
+        out = StringIO()
+        self.instrument.memory_report(out)
+        return out.getvalue().splitlines()
+
+    def test_live_tasks_largest_first(self):
+        hoarder = self.Hoarder()
+        hoarder.enable_all()
+        idle = self.Idle()
+        idle.switch()
+        lines = self.lines()
+        self.assertEqual(lines[0],
+                "Live tasks: 2 (approximate bytes retained)")
+        self.assertEqual([line.split()[0] for line in lines[1:5]],
+                ["Hoarder", "#{0}".format(hoarder._serial), "Idle",
+                    "#{0}".format(idle._serial)])
+        self.assertGreater(int(lines[2].split()[-1]), 100000)
+        self.assertEqual(lines[4].split()[1], "suspended")
+
+        idle.delete_all()
+        self.assertTrue(idle.dead)
+        del hoarder, idle
+        self.assertEqual(self.lines()[0],
+                "Live tasks: 0 (approximate bytes retained)")
+
+    def test_exposed_names(self):
+        hoarder = self.Hoarder()
+        hoarder.enable_all()
+        self.instrument.memory_report()
+        lines = self.sim.notepads["mushpy memory"].split("\r\n")
+        start = lines.index("Exposed names: 1")
+        self.assertEqual(lines[start + 1].split()[:2],
+                ["g__test_instrument__Hoarder__onLoot", "fire"])
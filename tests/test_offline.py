@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import support
+
+class OfflineTest(unittest.TestCase):
+    def setUp(self):
+        support.fresh_mush()
+        import mush.offline
+        import offline_tasks
+        self.offline = mush.offline
+        self.classes = [offline_tasks.Tally, offline_tasks.Silent]
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def log(self, name, lines, newline=True):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write("\n".join(lines) + ("\n" if newline else ""))
+        return path
+
+    def check_shards(self, path, count):
+        with open(path, "rb") as f:
+            data = f.read()
+        ranges = self.offline.shards(path, count)
+        self.assertEqual(ranges[0][1], 0)
+        self.assertEqual(ranges[-1][2], len(data))
+        for (_, start, end), (_, next_start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, next_start)
+            self.assertEqual(data[end - 1], "\n")
+        lines = []
+        for _, start, end in ranges:
+            lines.extend(self.offline._lines(path, start, end))
+        self.assertEqual(lines, data.splitlines())
+        return ranges
+
+    def test_shards_end_at_line_boundaries(self):
+        lines = ["line {0} {1}".format(i, "x" * (i % 13)) for i in range(100)]
+        self.assertEqual(len(self.check_shards(self.log("a.log", lines), 7)),
+                7)
+        self.check_shards(self.log("b.log", lines, newline=False), 7)
+        self.check_shards(self.log("c.log", ["one long line"]), 7)
+        self.assertEqual(self.offline.shards(self.log("d.log", [], False), 4),
+                [])
+
+    def test_same_result_whatever_the_process_count(self):
+        who = ["rat", "orc", "bat"]
+        paths = []
+        for n in range(2):
+            lines = []
+            for i in range(300):
+                lines.append("{0} hits you for {1}.".format(who[i % 3], i))
+                if i % 50 == 0:
+                    lines.append("You die.")
+            paths.append(self.log("{0}.log".format(n), lines, newline=n == 0))
+
+        single = self.offline.run(paths, self.classes, processes=1)
+        pooled = self.offline.run(paths, self.classes, processes=2)
+        self.assertEqual(pooled, single)
+        self.assertEqual(single["lines"], 612)
+        hits = single["handlers"]["Tally.onHit"]
+        self.assertEqual(hits["matches"], 600)
+        self.assertEqual(hits["values"], [who[i % 3] for i in range(300)] * 2)
+        self.assertEqual(single["handlers"]["Tally.onDeath"],
+                {"matches": 12, "values": []})
+        self.assertEqual(single["handlers"]["Silent.onFlee"]["matches"], 0)
+        # the shard summaries merged by offline_merge()
+        self.assertEqual(single["results"], {"Tally": sum(range(300)) * 2})
@@ -0,0 +1,123 @@
+import unittest
+
+from support import SimTestCase
+
+def _define(Task, got, hello=r"^hello (\w+)$", module=__name__):
+    class Greeter(Task):
+        __module__ = module
+
+        @Task.trigger(hello)
+        def onHello(self, wc):
+            got.append(("hello", wc[0]))
+
+        @Task.trigger(r"^bye (\w+)$")
+        def onBye(self, wc):
+            got.append(("bye", wc[0]))
+    return Greeter
+
+class ReconcileTest(SimTestCase):
+    def test_reconciling_again_keeps_the_triggers_in_use(self):
+        Task = self.mush.Task
+        got = []
+        Greeter = _define(Task, got)
+        greeter = Greeter()
+        greeter.enable_all()
+        class Later(Task):
+            @Task.trigger(r"^later (\w+)$")
+            def onLater(self, wc):
+                got.append(("later", wc[0]))
+        self.mush.task.reconcile_triggers()
+        later = Later()
+        later.enable_all()
+        for line in ["hello x", "bye y", "later z"]:
+            self.sim.receive(line)
+        self.assertEqual(got, [("hello", "x"), ("bye", "y"), ("later", "z")])
+        self.assertEqual(sorted(self.sim.triggers),
+                ["g__test_reconcile__Greeter__onBye",
+                    "g__test_reconcile__Greeter__onHello",
+                    "g__test_reconcile__Later__onLater"])
+
+    def test_reconciling_again_with_part_of_a_class_enabled(self):
+        Task = self.mush.Task
+        got = []
+        Greeter = _define(Task, got)
+        greeter = Greeter()
+        greeter.enable("onHello")
+        self.mush.task.reconcile_triggers()
+        self.sim.receive("hello x")
+        greeter.enable("onBye")
+        self.sim.receive("bye y")
+        self.assertEqual(got, [("hello", "x"), ("bye", "y")])
+
+    def test_reload_reuses_the_triggers_and_drops_stale_ones(self):
+        got = []
+        greeter = _define(self.mush.Task, got)()
+        greeter.enable_all()
+        namespace = self.ax._scriptEngine_.globalNameSpaceModule
+        class Gone(self.mush.Task):
+            @self.mush.Task.trigger(r"^gone$")
+            def onGone(self, wc):
+                pass
+        Gone().enable_all()
+        gone = "g__test_reconcile__Gone__onGone"
+        self.assertTrue(hasattr(namespace, gone))
+
+        self.reload()
+        self.sim.calls.clear()
+        # the pattern of one handler changed meanwhile
+        greeter = _define(self.mush.Task, got, hello=r"^hi (\w+)$")()
+        greeter.enable_all()
+        self.assertEqual(self.sim.calls["addtrigger"], 0)
+        self.assertEqual(self.sim.calls["gettriggerlist"], 1)
+        self.assertEqual(sorted(self.sim.triggers),
+                ["g__test_reconcile__Greeter__onBye",
+                    "g__test_reconcile__Greeter__onHello"])
+        self.assertFalse(hasattr(namespace, gone))
+        del got[:]
+        for line in ["hello x", "hi x", "bye y"]:
+            self.sim.receive(line)
+        # "hello x" no longer matches
+        self.assertEqual(got, [("hello", "x"), ("bye", "y")])
+
+    def test_classes_of_the_same_name_in_other_modules(self):
+        got = []
+        here = _define(self.mush.Task, got)()
+        there = _define(self.mush.Task, got, module="other.tasks")()
+        here.enable_all()
+        there.enable_all()
+        self.reload()
+        self.sim.calls.clear()
+        # both defined before the first Task is created
+        Here = _define(self.mush.Task, got)
+        There = _define(self.mush.Task, got, module="other.tasks")
+        here, there = Here(), There()
+        here.enable_all()
+        there.enable_all()
+        self.assertEqual(self.sim.calls["addtrigger"], 0)
+        self.assertEqual(len(self.sim.triggers), 4)
+        self.sim.receive("hello x")
+        self.assertEqual(got, [("hello", "x")] * 2)
+
+class OrderTest(SimTestCase):
+    def test_exclusive_handler_stops_evaluation(self):
+        Task = self.mush.Task
+        got = []
+        class Fight(Task):
+            @Task.trigger(r"^(\w+) hits you$", exclusive=True, priority=10)
+            def onHit(self, wc):
+                got.append("hit")
+
+            @Task.trigger(r"^(\w+) hits")
+            def onAny(self, wc):
+                got.append("any")
+        fight = Fight()
+        fight.enable_all()
+        self.sim.receive("Bob hits you")
+        self.sim.receive("Bob hits it")
+        self.assertEqual(got, ["hit", "any"])
+        opts = self.sim.triggers["g__test_reconcile__Fight__onHit"].opts
+        self.assertFalse(opts["keep_evaluating"])
+        self.assertEqual(opts["sequence"], 10)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+
+from support import SimTestCase
+
+class RegexCheckTest(SimTestCase):
+    def test_analyze(self):
+        from mush.regexprof import analyze
+        self.assertEqual(analyze(r"^(\w+) hits you\.$")[0], [])
+        self.assertEqual([severity for severity, message in
+            analyze(r"^(\w+)+$")[0]], ["error"])
+        self.assertEqual([severity for severity, message in
+            analyze(r".*foo")[0]], ["warning"])
+
+    def test_check_the_handlers_of_task_classes(self):
+        from mush.regexprof import check
+        Task = self.mush.Task
+        class Safe(Task):
+            @Task.trigger(r"^(?P<who>\w+) hits you\.$")
+            def onHit(self, wc):
+                pass
+        class Risky(Task):
+            @Task.trigger(r"^(\w+\s?)+ arrives\.$")
+            def onArrive(self, wc):
+                pass
+        self.assertEqual(check([Safe]), [])
+        problems = check([Safe, Risky])
+        self.assertTrue(problems)
+        for pattern, where, severity, message in problems:
+            self.assertEqual((pattern, where, severity),
+                (r"^(\w+\s?)+ arrives\.$", ["Risky.onArrive"], "error"))
+
+    def test_tasks_of_the_tests_have_no_problems(self):
+        import offline_tasks
+        import remote_tasks
+        from mush.regexprof import check
+        self.assertEqual(check([offline_tasks.Tally, offline_tasks.Silent,
+            remote_tasks.Fighter], level="warning"), [])
+
+if __name__ == "__main__":
+    unittest.main()
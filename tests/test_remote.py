@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import socket
+import subprocess
+import unittest
+
+import support
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(("localhost", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        self._streams = sys.stdout, sys.stderr
+        self.address = ("localhost", _free_port())
+        self.authkey = os.urandom(16).encode("hex")
+        env = dict(os.environ)
+        env["MUSHPY_AUTHKEY"] = self.authkey
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [support.ROOT,
+            os.path.dirname(os.path.abspath(__file__)),
+            env.get("PYTHONPATH")]))
+        self.worker = subprocess.Popen([sys.executable, "-m", "mush.remote",
+            "--address", "localhost:{0}".format(self.address[1]), "serve",
+            "remote_tasks"], env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self._streams
+        if self.worker.poll() is None:
+            self.worker.kill()
+        self.worker.wait()
+
+    def replay(self, lines):
+        '''Feed lines through a fake client, once the worker listens'''
+        mush = support.fresh_mush()
+        import mush.remote
+        deadline = time.time() + 10
+        while True:
+            try:
+                return mush.remote.replay(lines, self.address, self.authkey)
+            except socket.error:
+                if time.time() > deadline or self.worker.poll() is not None:
+                    raise
+                time.sleep(0.1)
+
+    def test_replay_through_a_worker(self):
+        sim = self.replay(["hello", "Bob hits you.", "x", "Al hits you."])
+        self.assertEqual(sim.sent, ["kill Bob", "kill Al"])
+        stdout = sim.notepads.get("stdout", "")
+        self.assertIn("hit by Bob target None", stdout)
+        self.assertIn("hit by Al target None", stdout)
+        # the worker's handler trigger, forwarded by the shim
+        self.assertIn("mushpy_dispatch", sim.triggers)
+        self.assertEqual(sim.script_errors, 0)
+        self.worker.wait()
+        self.assertEqual(self.worker.returncode, 0)
+
+    def test_authkey_required(self):
+        mush = support.fresh_mush()
+        import mush.remote
+        self.assertRaises(ValueError, mush.remote.replay, ["hello"],
+                self.address)
+        self.assertRaises(ValueError, mush.remote.serve, lambda: None,
+                self.address)
+        self.assertRaises(ValueError, mush.remote.install_shim, self.address)
+        # nor does the worker start without one
+        env = dict(os.environ)
+        env.pop("MUSHPY_AUTHKEY", None)
+        env["PYTHONPATH"] = support.ROOT
+        worker = subprocess.Popen([sys.executable, "-m", "mush.remote",
+            "serve", "remote_tasks"], env=env, stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        output = worker.communicate()[0]
+        self.assertEqual(worker.returncode, 2)
+        self.assertIn("MUSHPY_AUTHKEY", output)
+
+if __name__ == "__main__":
+    unittest.main()
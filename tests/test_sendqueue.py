@@ -0,0 +1,70 @@
+import unittest
+
+from support import SimTestCase
+
+class SendQueueTest(SimTestCase):
+    def setUp(self):
+        super(SendQueueTest, self).setUp()
+        self.queue = self.mush.install_send_queue(rate=1, burst=1)
+
+    def elapse(self, seconds):
+        '''Let seconds pass for the rate limit and drain the queue'''
+        self.queue._last -= seconds
+        self.queue.drain()
+
+    def test_rate_limit_and_repeated_commands(self):
+        for i in range(3):
+            self.mush.send("north")
+        self.assertEqual(self.sim.sent, ["north"])
+        self.assertEqual(len(self.queue), 2)
+        self.elapse(1.0)
+        self.assertEqual(self.sim.sent, ["north"] * 2)
+        # bursts are capped
+        self.elapse(10.0)
+        self.assertEqual(self.sim.sent, ["north"] * 3)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_dedupe_is_opt_in(self):
+        self.mush.send("north")
+        self.mush.send("score", dedupe=True)
+        self.mush.send("score", dedupe=True)
+        self.mush.send("score")
+        self.elapse(10.0)
+        self.elapse(10.0)
+        self.elapse(10.0)
+        self.assertEqual(self.sim.sent, ["north", "score", "score"])
+
+    def test_priority_goes_first(self):
+        self.mush.send("look")
+        self.mush.send("get coins\nget sword")
+        self.mush.send("flee", priority=10)
+        for i in range(3):
+            self.elapse(1.0)
+        self.assertEqual(self.sim.sent,
+                ["look", "flee", "get coins", "get sword"])
+
+    def test_burst_sent_in_one_call(self):
+        self.queue.burst = 3
+        self.queue._tokens = 3.0
+        self.sim.calls.clear()
+        self.mush.send("a\nb\nc\nd")
+        self.assertEqual(self.sim.sent, ["a", "b", "c"])
+        self.assertEqual(self.sim.calls["send"], 1)
+
+    def test_waiting_task_resumes_once_sent(self):
+        Task = self.mush.Task
+        done = []
+        test = self
+        class Walker(Task):
+            def run(self):
+                test.mush.send("north\nnorth")
+                self.wait_sent()
+                done.append(list(test.sim.sent))
+        walker = Walker()
+        walker.switch()
+        self.assertEqual(done, [])
+        self.elapse(1.0)
+        self.assertEqual(done, [["north", "north"]])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import time
+import unittest
+
+from support import SimTestCase
+
+class StoreTest(SimTestCase):
+    def setUp(self):
+        super(StoreTest, self).setUp()
+        import mush.store
+        self.store = mush.store
+
+    def reloaded(self, name, **options):
+        '''The store of that name as loaded by the next script load'''
+        self.reload()
+        import mush.store
+        return mush.store.get_store(name, **options)
+
+    def test_round_trip_with_escaped_delimiters(self):
+        # without the flush timer, which makes client calls of its own
+        kills = self.store.get_store("kills", flush_interval=0)
+        self.sim.calls.clear()
+        kills["orc"] = 3
+        kills["a|b"] = "x\\y|z\\"
+        kills["empty"] = ""
+        self.assertEqual(int(kills["orc"]) + 1, 4)
+        self.assertEqual(sum(self.sim.calls.values()), 0)
+        kills.flush()
+        self.assertEqual(dict(self.sim.calls), {"arrayimport": 1,
+            "arrayexport": 1, "setvariable": 1})
+        self.assertEqual(self.sim.arrays["kills"],
+                {"orc": "3", "a|b": "x\\y|z\\", "empty": ""})
+        self.assertEqual(dict(self.reloaded("kills")),
+                {"orc": "3", "a|b": "x\\y|z\\", "empty": ""})
+
+    def test_deleted_keys(self):
+        kills = self.store.get_store("kills", delimiter=",")
+        kills.update(orc="1", rat="2", bat="3")
+        kills.flush()
+        del kills["orc"]
+        kills["new"] = "4"
+        del kills["new"]
+        self.assertTrue(kills.dirty)
+        kills.flush()
+        self.assertFalse(kills.dirty)
+        self.assertEqual(self.sim.arrays["kills"], {"rat": "2", "bat": "3"})
+        self.assertEqual(self.sim.variables["mushpy_kills"], "bat,3,rat,2")
+        del kills["rat"]
+        del kills["bat"]
+        kills.flush()
+        self.assertEqual(self.sim.variables["mushpy_kills"], "")
+        self.assertEqual(dict(self.reloaded("kills", delimiter=",")), {})
+
+    def test_codec(self):
+        loot = self.store.get_store("loot", codec=json)
+        loot["bag"] = {"coins": [1, 2]}
+        loot.flush()
+        self.assertEqual(self.reloaded("loot", codec=json)["bag"],
+                {"coins": [1, 2]})
+
+    def test_flushed_by_a_timer_once_changed(self):
+        kills = self.store.get_store("kills", flush_interval=0.01)
+        self.assertNotIn("mushpy_timer", self.sim.timers)
+        kills["orc"] = "1"
+        kills["rat"] = "2"
+        deadline = time.time() + 2
+        while kills.dirty and time.time() < deadline:
+            time.sleep(0.02)
+            self.sim.poll_timers()
+        self.assertEqual(self.sim.variables["mushpy_kills"], "orc|1|rat|2")
+        self.assertEqual(self.mush.get_timer_wheel()._owners, {})
+        self.assertFalse(self.sim.timers["mushpy_timer"].enabled)
+        # flushed before the timer
+        kills["bat"] = "3"
+        self.store.flush_all()
+        self.assertEqual(len(self.mush.get_timer_wheel()), 0)
+
+    def test_variables(self):
+        self.sim.variables.update(hp="10", target="orc")
+        variables = self.store.get_variables()
+        self.sim.calls.clear()
+        self.assertEqual(variables["hp"], "10")
+        self.assertEqual(variables["hp"], "10")
+        self.assertEqual(self.sim.calls["getvariable"], 1)
+        self.assertNotIn("mp", variables)
+        self.assertRaises(KeyError, lambda: variables["mp"])
+        variables["hp"] = 9
+        variables["mp"] = "5"
+        del variables["target"]
+        self.assertEqual(sorted(variables), ["hp", "mp"])
+        self.assertEqual(self.sim.calls["setvariable"], 0)
+        self.store.flush_all()
+        self.assertEqual(self.sim.variables, {"hp": "9", "mp": "5"})
+        self.assertEqual(self.sim.calls["setvariable"], 2)
+        self.assertEqual(self.sim.calls["deletevariable"], 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import gc
+import unittest
+
+from support import SimTestCase
+
+def _define(Task, got):
+    class Greeter(Task):
+        @Task.trigger(r"^hello (\w+)$")
+        def onHello(self, wc):
+            got.append((self.name, "hello", wc[0]))
+
+        @Task.trigger(r"^bye (\w+)$")
+        def onBye(self, wc):
+            got.append((self.name, "bye", wc[0]))
+
+        def __init__(self, name):
+            Task.__init__(self)
+            self.name = name
+    return Greeter
+
+class SharedTriggerTest(SimTestCase):
+    def setUp(self):
+        super(SharedTriggerTest, self).setUp()
+        self.got = []
+        self.Greeter = _define(self.mush.Task, self.got)
+
+    def test_one_trigger_per_handler_fanned_out_in_creation_order(self):
+        a, b, c = [self.Greeter(name) for name in "abc"]
+        for task in (c, a, b):
+            task.enable_all()
+        b.disable("onBye")
+        self.sim.receive("hello x")
+        self.sim.receive("bye y")
+        self.assertEqual(self.got, [("a", "hello", "x"), ("b", "hello", "x"),
+            ("c", "hello", "x"), ("a", "bye", "y"), ("c", "bye", "y")])
+        self.assertEqual(sorted(self.sim.triggers),
+                ["g__test_task__Greeter__onBye",
+                    "g__test_task__Greeter__onHello"])
+
+    def test_client_calls_only_on_the_first_and_last_listener(self):
+        a, b = self.Greeter("a"), self.Greeter("b")
+        a.enable_all()
+        self.sim.calls.clear()
+        b.enable_all()
+        a.disable_all()
+        self.assertEqual(sum(self.sim.calls.values()), 0)
+        b.disable_all()
+        self.assertEqual(dict(self.sim.calls), {"enabletriggergroup": 1})
+        a.enable_all()
+        self.assertEqual(self.sim.calls["enabletriggergroup"], 2)
+        self.assertEqual(self.sim.calls["settriggeroption"], 0)
+
+    def test_part_of_the_handlers_switched_one_by_one(self):
+        a = self.Greeter("a")
+        a.enable_all()
+        a.disable_all()
+        self.sim.calls.clear()
+        a.enable("onHello")
+        self.assertEqual(dict(self.sim.calls), {"settriggeroption": 1})
+        a.enable_all()
+        # onBye alone, not the group
+        self.assertEqual(self.sim.calls["enabletriggergroup"], 0)
+        self.assertEqual(self.sim.calls["settriggeroption"], 2)
+
+    def test_resume_only_switches_the_changed_handlers(self):
+        a = self.Greeter("a")
+        a.enable("onHello")
+        a.disable_all()
+        self.sim.calls.clear()
+        a.resume()
+        self.assertEqual(dict(self.sim.calls), {"settriggeroption": 1})
+        self.sim.receive("hello x")
+        self.sim.receive("bye y")
+        self.assertEqual(self.got, [("a", "hello", "x")])
+
+    def test_collected_instances_stop_listening(self):
+        self.Greeter("a").enable_all()
+        gc.collect()
+        self.sim.receive("hello x")
+        self.assertEqual(self.got, [])
+        # the trigger turned itself off
+        self.assertFalse(
+                self.sim.triggers["g__test_task__Greeter__onHello"].opts[
+                    "enabled"])
+
+    def test_classes_of_the_same_name(self):
+        got = []
+        # a class of the same name in another module
+        Other = _define(self.mush.Task, got)
+        Other = type(Other)("Greeter", (Other,), {"__module__": "elsewhere"})
+        a, b = self.Greeter("a"), Other("b")
+        a.enable_all()
+        b.enable_all()
+        self.sim.receive("hello x")
+        self.assertEqual(self.got, [("a", "hello", "x")])
+        self.assertEqual(got, [("b", "hello", "x")])
+        # same module and name
+        Again = _define(self.mush.Task, self.got)
+        self.assertRaises(self.mush.TriggerOpError,
+                Again("c").enable_all)
+
+class DispatchedSharedTriggerTest(SimTestCase):
+    dispatch = True
+
+    def test_fan_out_with_no_client_call(self):
+        got = []
+        Greeter = _define(self.mush.Task, got)
+        a, b = Greeter("a"), Greeter("b")
+        self.sim.calls.clear()
+        a.enable_all()
+        b.enable("onBye")
+        self.sim.receive("bye y")
+        a.disable_all()
+        self.sim.receive("bye z")
+        self.assertEqual(got, [("a", "bye", "y"), ("b", "bye", "y"),
+            ("b", "bye", "z")])
+        self.assertEqual(self.sim.calls["enabletriggergroup"], 0)
+        self.assertEqual(self.sim.calls["settriggeroption"], 0)
+        Again = _define(self.mush.Task, got)
+        self.assertRaises(self.mush.TriggerOpError, Again("c").enable_all)
+
+if __name__ == "__main__":
+    unittest.main()
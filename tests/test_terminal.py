@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+import support
+from support import SimTestCase
+
+class BufferedOutputTest(unittest.TestCase):
+    def setUp(self):
+        self._streams = sys.stdout, sys.stderr
+        self.mush = support.fresh_mush()
+        import mush.sim
+        self.ax = mush.sim.make_ax()
+        self.sim = self.ax.sim
+        self.mush.init(self.ax, buffered=True)
+
+    def tearDown(self):
+        sys.stdout, sys.stderr = self._streams
+
+    def test_client_trigger_output_flushed_after_the_line(self):
+        Task = self.mush.Task
+        class Greeter(Task):
+            @Task.trigger(r"^hello (\w+)$")
+            def onHello(self, wc):
+                print "got", wc[0]
+        greeter = Greeter()
+        greeter.enable_all()
+        self.sim.receive("hello bob")
+        self.assertIn("got bob", self.sim.notepads["stdout"])
+
+    def test_several_writes_of_a_line_in_one_call(self):
+        self.sim.calls.clear()
+        for i in range(5):
+            print "part", i
+        self.assertEqual(self.sim.calls["appendtonotepad"], 0)
+        sys.stdout.flush()
+        self.assertEqual(self.sim.calls["appendtonotepad"], 1)
+
+    def test_lines_stamped_once_and_flushed_in_batches(self):
+        sys.stdout.options["flush_lines"] = 3
+        self.sim.calls.clear()
+        sys.stdout.write("a")
+        sys.stdout.write("b\nc\n")
+        self.assertEqual(self.sim.calls["appendtonotepad"], 0)
+        sys.stdout.write("d\n")
+        self.assertEqual(self.sim.calls["appendtonotepad"], 1)
+        text = self.sim.notepads["stdout"]
+        lines = text.split("\r\n")[1:-1]
+        self.assertEqual([line.split(": ", 1)[1] for line in lines],
+                ["ab", "c", "d"])
+
+class BoundedOutputTest(SimTestCase):
+    def setUp(self):
+        super(BoundedOutputTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "out.log")
+
+    def tearDown(self):
+        super(BoundedOutputTest, self).tearDown()
+        shutil.rmtree(self.dir)
+
+    def test_notepad_replaced_at_twice_max_lines(self):
+        term = self.mush.Terminal("t", max_lines=3)
+        self.sim.calls.clear()
+        for i in range(4):
+            term.write("line {0}\n".format(i))
+        self.assertEqual(self.sim.calls["replacenotepad"], 0)
+        term.write("line 4\nline 5")
+        self.assertEqual(self.sim.calls["replacenotepad"], 1)
+        self.assertEqual(self.sim.notepads["t"],
+                "line 2\r\nline 3\r\nline 4\r\nline 5")
+
+    def test_log_file_rotation(self):
+        term = self.mush.Terminal("t", log_file=self.path, log_max_bytes=20,
+                log_backups=2)
+        for i in range(10):
+            term.write("line {0}\n".format(i))
+        term.close()
+        names = sorted(os.listdir(self.dir))
+        self.assertEqual(names, ["out.log", "out.log.1", "out.log.2"])
+        content = ""
+        for name in reversed(names):
+            with open(os.path.join(self.dir, name), "rb") as f:
+                data = f.read()
+            self.assertTrue(len(data) <= 20, name)
+            content += data
+        self.assertTrue(content.endswith("line 8\r\nline 9\r\n"))
+
+    def test_log_file_failure_reported_once(self):
+        path = os.path.join(self.dir, "missing", "out.log")
+        term = self.mush.Terminal("t", log_file=path)
+        for thread in threading.enumerate():
+            if thread.name == "mushpy-spill-" + path:
+                thread.join(5)
+        for i in range(3):
+            term.write("line {0}\n".format(i))
+        notes = [text for text in self.sim.output if path in text]
+        self.assertEqual(len(notes), 1)
+        self.assertIsNone(term._spill)
+        self.assertIn("line 2", self.sim.notepads["t"])
+
+    def test_reload_closes_the_previous_stdout(self):
+        self.mush.init(self.ax, log_file=self.path)
+        old = sys.stdout
+        spill = old._spill
+        print "before reload"
+        self.reload()
+        self.assertFalse(spill.is_alive())
+        self.assertIsNone(old._spill)
+        with open(self.path, "rb") as f:
+            self.assertIn("before reload", f.read())
+
+if __name__ == "__main__":
+    unittest.main()
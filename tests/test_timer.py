@@ -0,0 +1,105 @@
+import sys
+import time
+import random
+import unittest
+from StringIO import StringIO
+
+import support
+from support import SimTestCase
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        support.fresh_mush()
+        from mush.timer import TimerWheel
+        # ticks only move when advanced by the test
+        self.wheel = TimerWheel(resolution=1000.0, bits=2, levels=2)
+        self.fired = []
+
+    def later(self, ticks, *args, **kwargs):
+        return self.wheel.add(ticks * 1000.0, self.fired.append,
+                (args or (ticks,)), **kwargs)
+
+    def test_timers_fire_at_their_tick_across_levels(self):
+        # 4 slots and 2 levels: the longer delays cascade or overflow
+        rand = random.Random(0)
+        delays = [rand.randrange(1, 60) for i in range(50)]
+        for delay in delays:
+            self.later(delay)
+        for tick in range(1, 61):
+            del self.fired[:]
+            self.wheel.advance(tick)
+            self.assertEqual(sorted(self.fired),
+                    [delay for delay in delays if delay == tick], tick)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_periodic_timer_until_cancelled(self):
+        timer = self.wheel.add(3000.0, self.fired.append, ("tick",),
+                interval=3000.0)
+        self.wheel.advance(10)
+        self.assertEqual(len(self.fired), 3)
+        timer.cancel()
+        self.wheel.advance(20)
+        self.assertEqual(len(self.fired), 3)
+        self.assertFalse(timer.active)
+
+    def test_cancel_owner(self):
+        owner = object()
+        self.later(2, "a", owner=owner)
+        self.later(5, "b", owner=owner, interval=1000.0)
+        self.later(3, "c")
+        self.wheel.cancel_owner(owner)
+        self.wheel.advance(10)
+        self.assertEqual(self.fired, ["c"])
+        self.assertEqual(self.wheel._owners, {})
+
+    def test_callback_cancelling_timers_of_the_same_tick(self):
+        timers = []
+        def fire(i):
+            self.fired.append(i)
+            for timer in timers:
+                timer.cancel()
+        owner = object()
+        for i in range(5):
+            timers.append(self.wheel.add(3000.0, fire, (i,), owner=owner))
+        self.later(4)
+        self.wheel.advance(3)
+        # the first one to fire cancelled the others
+        self.assertEqual(len(self.fired), 1)
+        self.assertEqual(len(self.wheel), 1)
+        self.assertEqual(self.wheel._owners, {})
+        self.wheel.advance(4)
+        self.assertEqual(self.fired[1:], [4])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_failing_callback_doesnt_stop_the_others(self):
+        def fail():
+            raise ValueError("boom")
+        self.wheel.add(1000.0, fail)
+        self.later(1, "after")
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            self.wheel.advance(1)
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual(self.fired, ["after"])
+        self.assertIn("boom", output)
+
+class ClientTimerTest(SimTestCase):
+    def test_single_client_timer_enabled_while_pending(self):
+        from mush.timer import install_timer_wheel, call_later
+        install_timer_wheel(resolution=0.01)
+        fired = []
+        for i in range(5):
+            call_later(0.01, fired.append, (i,))
+        self.assertEqual(sorted(self.sim.timers), ["mushpy_timer"])
+        self.assertTrue(self.sim.timers["mushpy_timer"].enabled)
+        deadline = time.time() + 2
+        while len(fired) < 5 and time.time() < deadline:
+            time.sleep(0.02)
+            self.sim.poll_timers()
+        self.assertEqual(sorted(fired), range(5))
+        self.assertFalse(self.sim.timers["mushpy_timer"].enabled)
+
+if __name__ == "__main__":
+    unittest.main()
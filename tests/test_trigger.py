@@ -0,0 +1,74 @@
+import unittest
+
+from support import SimTestCase
+
+class TriggerCacheTest(SimTestCase):
+    def setUp(self):
+        super(TriggerCacheTest, self).setUp()
+        self.trigger = self.mush.trigger
+        self.trigger.add_trigger("t1", r"^a$", "", group="grp")
+        self.trigger.add_trigger("t2", r"^b$", "", group="grp")
+        self.sim.calls.clear()
+        self.stats = self.trigger.trigger_cache_stats
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def test_unchanged_option_is_not_sent(self):
+        trig = self.trigger.get_trigger("t1")
+        trig.sequence = 50
+        trig.sequence = 50
+        trig.enabled = False    # as created
+        self.assertEqual(self.sim.calls["settriggeroption"], 1)
+        self.assertEqual(self.stats["writes"], 1)
+        self.assertEqual(self.stats["skipped"], 2)
+        self.assertEqual(self.sim.triggers["t1"].opts["sequence"], 50)
+
+    def test_reads_are_counted_and_cached(self):
+        trig = self.trigger.get_trigger("t1")
+        self.assertEqual(trig.ignorecase, False)
+        self.assertEqual(trig["IgnoreCase"], False)
+        self.assertEqual(self.sim.calls["gettriggerinfo"], 1)
+        self.assertEqual((self.stats["misses"], self.stats["hits"]), (1, 1))
+        # volatile infos are always asked for
+        trig.timesmatched
+        trig.timesmatched
+        self.assertEqual(self.sim.calls["gettriggerinfo"], 3)
+
+    def test_one_proxy_per_trigger(self):
+        self.assertIs(self.trigger.get_trigger("t1"),
+                self.trigger.get_trigger("t1"))
+        self.assertEqual(self.sim.calls["istrigger"], 0)
+
+    def test_deleting_drops_the_cache(self):
+        self.trigger.del_trigger("t1")
+        self.assertRaises(self.trigger.TriggerNotFoundError,
+                self.trigger.get_trigger, "t1")
+        self.trigger.add_trigger("t1", r"^c$", "")
+        trig = self.trigger.get_trigger("t1")
+        self.assertEqual(trig.whattomatch, r"^c$")
+        self.assertEqual(trig.groupname, "")
+
+    def test_group_switch_updates_the_cached_state(self):
+        self.trigger.enable_trigger_group("grp", True)
+        self.assertTrue(self.trigger.get_trig_onoff("t1"))
+        self.assertTrue(self.sim.triggers["t1"].opts["enabled"])
+        self.trigger.disable_trigger("t2")
+        self.trigger.disable_trigger_group("grp")
+        self.trigger.enable_trigger("t2")
+        self.assertEqual(self.sim.calls["gettriggerinfo"], 0)
+        self.assertEqual(self.sim.calls["settriggeroption"], 2)
+        self.assertTrue(self.sim.triggers["t2"].opts["enabled"])
+
+    def test_get_many_and_set_many(self):
+        self.trigger.set_many(["t1", "t2"], {"sequence": 10, "enabled": True})
+        self.assertEqual(self.sim.calls["settriggeroption"], 4)
+        self.trigger.set_many(["t1", "t2"], {"sequence": 10})
+        self.assertEqual(self.sim.calls["settriggeroption"], 4)
+        self.assertEqual(self.trigger.get_many(["t1", "t2"],
+            ["sequence", "groupname"]), {
+                "t1": {"sequence": 10, "groupname": "grp"},
+                "t2": {"sequence": 10, "groupname": "grp"}})
+        self.assertEqual(self.sim.calls["gettriggerinfo"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
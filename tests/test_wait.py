@@ -0,0 +1,76 @@
+import time
+import unittest
+
+from support import SimTestCase
+
+class WaitTest(SimTestCase):
+    dispatch = True
+
+    def wait_until(self, condition, timeout=2):
+        '''Run the client timers until condition() is true'''
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+            self.sim.poll_timers()
+
+    def waiting(self):
+        '''Names of the dispatcher entries of the waits'''
+        return [name for name in self.mush.get_dispatcher()._entries
+                if name.startswith("w__")]
+
+    def spawn(self, body):
+        '''Start a task running body(task), return the task and the list
+        body's results go to'''
+        got = []
+        class Waiter(self.mush.Task):
+            def run(self):
+                got.append(body(self))
+        task = Waiter()
+        task.switch()
+        return task, got
+
+    def test_match_resumes_with_the_index_and_wildcards(self):
+        task, got = self.spawn(lambda task:
+                task.expect([r"^a (\w+)$", r"^b (\w+)$"], 5))
+        self.assertEqual(len(self.waiting()), 2)
+        self.sim.receive("c x")
+        self.assertEqual(got, [])
+        self.sim.receive("b y")
+        self.assertEqual(len(got), 1)
+        index, wc = got[0]
+        self.assertEqual((index, wc[0], wc[9]), (1, "y", "b y"))
+        self.assertEqual(self.waiting(), [])
+        self.assertTrue(task.dead)
+
+    def test_timeout_returns_none(self):
+        task, got = self.spawn(lambda task: task.expect(r"^never$", 0.05))
+        self.wait_until(lambda: got)
+        self.assertEqual(got, [None])
+        self.assertEqual(self.waiting(), [])
+
+    def test_sleep(self):
+        start = time.time()
+        task, got = self.spawn(lambda task: task.sleep(0.05))
+        self.assertEqual(got, [])
+        self.wait_until(lambda: got)
+        self.assertEqual(got, [None])
+        self.assertTrue(time.time() - start >= 0.05)
+
+    def test_waiting_needs_the_dispatcher(self):
+        self.mush.dispatch._dispatcher = None
+        task, got = self.spawn(lambda task: self.assertRaises(RuntimeError,
+            task.expect, r"^a$"))
+        self.assertEqual(got, [None])
+
+    def test_delete_all_drops_the_wait(self):
+        task, got = self.spawn(lambda task: task.expect(r"^a$", 0.05))
+        task.delete_all()
+        self.assertEqual(self.waiting(), [])
+        self.assertEqual(len(self.mush.get_timer_wheel()), 0)
+        self.sim.receive("a")
+        time.sleep(0.1)
+        self.sim.poll_timers()
+        self.assertEqual(got, [])
+
+if __name__ == "__main__":
+    unittest.main()
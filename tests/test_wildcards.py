@@ -0,0 +1,75 @@
+import re
+import unittest
+
+import support
+from support import SimTestCase
+
+class WildcardsTest(unittest.TestCase):
+    def setUp(self):
+        support.fresh_mush()
+        from mush.wildcards import Wildcards
+        self.Wildcards = Wildcards
+
+    def client(self, line, pattern, *groups):
+        '''Wildcards of a client trigger'''
+        values = list(groups) + [""] * (9 - len(groups)) + [line]
+        return self.Wildcards(line, values=values, pattern=pattern)
+
+    def test_match_object(self):
+        pattern = r"^(?P<who>\w+) (hits|misses)(?: (\w+))?"
+        wc = self.Wildcards("Bob hits", re.search(pattern, "Bob hits"))
+        self.assertEqual(wc[:], ["Bob", "hits"] + [""] * 7 + ["Bob hits"])
+        self.assertEqual((wc.who, wc["who"], wc[-1]), ("Bob", "Bob",
+            "Bob hits"))
+        self.assertEqual(wc.groupdict(), {"who": "Bob"})
+        self.assertRaises(KeyError, lambda: wc["nope"])
+        self.assertRaises(AttributeError, lambda: wc.nope)
+        self.assertRaises(IndexError, lambda: wc[10])
+
+    def test_client_values_matched_again_for_names(self):
+        wc = self.client("Bob hits", r"^(?P<who>\w+) hits", "Bob")
+        self.assertEqual(wc[0], "Bob")
+        self.assertEqual(wc._match, None)
+        self.assertEqual(wc.who, "Bob")
+        self.assertEqual(wc.groupdict(), {"who": "Bob"})
+
+    def test_pattern_python_cannot_compile(self):
+        # PCRE syntax: the values are there, the names are not
+        wc = self.client("Bob waves", r"^(?<who>\w+) waves$", "Bob")
+        self.assertEqual((wc[0], wc[9]), ("Bob", "Bob waves"))
+        self.assertRaises(KeyError, lambda: wc["who"])
+        self.assertRaises(AttributeError, lambda: wc.who)
+        self.assertEqual(wc.groupdict(), {})
+
+class ClientTriggerWildcardsTest(SimTestCase):
+    def test_named_groups(self):
+        Task = self.mush.Task
+        got = []
+        class Hp(Task):
+            @Task.trigger(r"^(?P<target>\w+) has (?P<hp>\d+) hp\.$")
+            def onHp(self, wc):
+                got.append((wc.target, wc["hp"], wc[0], wc[9]))
+        task = Hp()
+        task.enable_all()
+        self.sim.receive("orc has 12 hp.")
+        self.assertEqual(got, [("orc", "12", "orc", "orc has 12 hp.")])
+
+    def test_handler_of_a_pattern_python_cannot_compile(self):
+        Task = self.mush.Task
+        got = []
+        class Waves(Task):
+            @Task.trigger(r"^(?<who>\w+) waves$")
+            def onWave(self, wc):
+                got.append(wc[0])
+                got.append(getattr(wc, "who", None))
+        task = Waves()
+        # as the client would call it, the simulator only knows Python's re
+        trigger = Waves._shared["onWave"]
+        trigger.listen(task, True)
+        wildcards = ("Bob",) + ("",) * 8 + ("Bob waves",)
+        trigger.fire(trigger.name, "Bob waves", wildcards)
+        trigger.fire(trigger.name, "Al waves", ("Al",) + wildcards[1:])
+        self.assertEqual(got, ["Bob", None, "Al", None])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+from support import SimTestCase
+
+class OffloaderTest(SimTestCase):
+    def wait(self, offloader, timeout=10):
+        deadline = time.time() + timeout
+        while len(offloader) and time.time() < deadline:
+            time.sleep(0.01)
+            self.sim.poll_timers()
+
+    def test_results_and_errors_delivered(self):
+        from mush.workers import Offloader
+        offloader = Offloader(2)
+        got = []
+        offloader.submit(pow, (2, 10), callback=lambda ok, value:
+                got.append((ok, value)))
+        offloader.submit(int, ("x",), callback=lambda ok, value:
+                got.append((ok, type(value[0]))))
+        self.wait(offloader)
+        offloader.close()
+        self.assertEqual(sorted(got), [(False, ValueError), (True, 1024)])
+
+    def test_unpicklable_job_fails_rather_than_hangs(self):
+        from mush.workers import Offloader
+        offloader = Offloader(1, kind="process")
+        got = []
+        offloader.submit(lambda: 1, callback=lambda ok, value:
+                got.append(ok))
+        self.wait(offloader)
+        offloader.close()
+        self.assertEqual(got, [False])
+        self.assertEqual(len(offloader), 0)
+
+    def test_task_waits_for_the_result(self):
+        Task = self.mush.Task
+        got = []
+        class Worker(Task):
+            def run(self):
+                got.append(self.offload(sum, range(10)))
+        worker = Worker()
+        worker.switch()
+        self.wait(self.mush.get_offloader())
+        self.assertEqual(got, [45])
+
+if __name__ == "__main__":
+    unittest.main()